@@ -0,0 +1,197 @@
+# This file is Copyright (C) 2022 Christoph Reichenbach
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the
+#   Free Software Foundation, Inc.
+#   59 Temple Place, Suite 330
+#   Boston, MA  02111-1307
+#   USA
+#
+# The author can be reached as "creichen" at the usual gmail server.
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+import org_events
+from caltime import CalTime
+from event import Event, MergingDict
+from event_table import is_active_after
+from orgwriter import AtomicOrgWriter, FSYNC_POLICY
+from syncstate import encode_key
+
+'''Suffix for the directory (next to the org file) that holds the archive'''
+ARCHIVE_SUFFIX = '_archive'
+'''File in the archive directory that maps calendar UIDs and event keys to the months they are archived in'''
+ARCHIVE_INDEX = 'index.json'
+
+
+def perr(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def archive_month(ev : Event) -> str:
+    '''The month ("2022-05", in UTC) of the last end of the event, which names its archive file'''
+    end = datetime.fromtimestamp(ev.time_bounds()[1], timezone.utc)
+    return f'{end.year:04d}-{end.month:02d}'
+
+
+class Archive:
+    '''
+    Events that ended a while ago, moved out of the org file into one org file per month (by when they
+    ended, cf. archive_month()), so that updating the org file does not parse and merge them again.
+
+    The index maps calendar UIDs and event keys to months.  Remote events that are archived are left out of
+    the merge (cf. split_remote()), unless they changed: then their archived copy goes back into the merge,
+    and the merged event is archived again if it is still past (cf. archive_past()).
+
+    Month files are loaded when needed; save() writes the ones that changed, and the index.
+    '''
+
+    def __init__(self, dirname : str, index=None, fsync : str=FSYNC_POLICY):
+        self.dirname = dirname
+        self.fsync = fsync
+        # calendar UID -> encoded event key (cf. syncstate.encode_key()) -> month
+        self._index = {} if index is None else index
+        # month -> calendar UID -> OrgCalendar (only for months that we loaded)
+        self._months = {}
+        self._dirty = set()
+
+    @staticmethod
+    def path_for(orgfile_name : str) -> str:
+        return orgfile_name + ARCHIVE_SUFFIX
+
+    @staticmethod
+    def load(orgfile_name : str, fsync : str=FSYNC_POLICY) -> Archive:
+        '''The archive of the given org file; empty if there is none yet'''
+        dirname = Archive.path_for(orgfile_name)
+        path = os.path.join(dirname, ARCHIVE_INDEX)
+        try:
+            with open(path, encoding='utf-8') as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            index = None
+        except (OSError, ValueError) as e:
+            # Without the index, archived events would come back as new ones; better to stop here
+            raise ValueError(f'Unreadable archive index "{path}": {e}') from e
+        return Archive(dirname, index, fsync=fsync)
+
+    def __contains__(self, caluid_and_key):
+        caluid, key = caluid_and_key
+        return encode_key(key) in self._index.get(caluid, ())
+
+    def month_path(self, month : str) -> str:
+        return os.path.join(self.dirname, f'{month}.org')
+
+    def _month(self, month : str) -> dict[str, org_events.OrgCalendar]:
+        calendars = self._months.get(month)
+        if calendars is None:
+            try:
+                calendars = dict(org_events.OrgEventParser().load(self.month_path(month)))
+            except FileNotFoundError:
+                calendars = {}
+            self._months[month] = calendars
+        return calendars
+
+    def add(self, calendar, ev : Event):
+        '''Archives one event of 'calendar' (replacing an archived event with the same key)'''
+        month = archive_month(ev)
+        calendars = self._month(month)
+        if calendar.uid not in calendars:
+            calendars[calendar.uid] = org_events.OrgCalendar(calendar.name, calendar.uid, [])
+        calendars[calendar.uid].events[ev.key] = ev
+        self._index.setdefault(calendar.uid, {})[encode_key(ev.key)] = month
+        self._dirty.add(month)
+
+    def take(self, caluid : str, key) -> Event:
+        '''Removes one event from the archive and returns it (None if it went missing from its month file)'''
+        month = self._index[caluid].pop(encode_key(key))
+        if not self._index[caluid]:
+            del self._index[caluid]
+        self._dirty.add(month)
+        calendar = self._month(month).get(caluid)
+        if calendar is None or key not in calendar.events:
+            perr(f'Event "{key}" is missing from archive file "{self.month_path(month)}"')
+            return None
+        ev = calendar.events[key]
+        del calendar.events[key]
+        return ev
+
+    def split_remote(self, calendars : MergingDict, base : dict) -> tuple[MergingDict, dict[str, list[Event]]]:
+        '''
+        Leaves out archived events from (remote) calendars, except for those that changed since 'base' (cf.
+        SyncState.base): those are taken out of the archive.  Returns the calendars without the archived
+        events, and the archived copies of the events that were taken out, by calendar UID.
+        '''
+        result = MergingDict()
+        revived = {}
+        for caluid, cal in calendars.items():
+            archived = self._index.get(caluid)
+            if not archived:
+                result[caluid] = cal
+                continue
+            cal_base = base.get(caluid, {})
+            events = []
+            for key, ev in cal.events.items():
+                if encode_key(key) not in archived:
+                    events.append(ev)
+                elif key not in cal_base or not ev.unchanged_since(cal_base[key]):
+                    # Changed remotely, so merge it again
+                    events.append(ev)
+                    local = self.take(caluid, key)
+                    if local is not None:
+                        revived.setdefault(caluid, []).append(local)
+            result[caluid] = org_events.OrgCalendar(cal.name, caluid, events, cal.links)
+        return result, revived
+
+    def archive_past(self, calendar, cutoff : CalTime):
+        '''Archives all events of the calendar that ended before 'cutoff'; returns an OrgCalendar with the rest'''
+        remaining = []
+        for ev in calendar.events.values():
+            if is_active_after(ev, cutoff):
+                remaining.append(ev)
+            else:
+                self.add(calendar, ev)
+        if len(remaining) == len(calendar.events):
+            return calendar
+        return org_events.OrgCalendar(calendar.name, calendar.uid, remaining, calendar.links)
+
+    def save(self):
+        '''Writes the month files that changed, and the index (if anything changed)'''
+        if not self._dirty:
+            return
+        os.makedirs(self.dirname, exist_ok=True)
+        for month in sorted(self._dirty):
+            calendars = [cal for cal in self._months[month].values() if cal.events]
+            if not calendars:
+                try:
+                    os.remove(self.month_path(month))
+                except FileNotFoundError:
+                    pass
+                continue
+            with AtomicOrgWriter(self.month_path(month), fsync=self.fsync) as output:
+                unparser = org_events.OrgEventUnparser(output, past_events=True)
+                unparser.print_header(window=False)
+                for cal in calendars:
+                    unparser.unparse_calendar_heading(cal)
+                    for ev in cal.events.values():
+                        # As they were, without expanding recurrences
+                        unparser.unparse_event(ev)
+                        for instance in (ev.detached_instances or {}).values():
+                            unparser.unparse_event(instance)
+        with AtomicOrgWriter(os.path.join(self.dirname, ARCHIVE_INDEX), fsync=self.fsync) as output:
+            output.write(json.dumps(self._index, separators=(',', ':'), sort_keys=True))
+        self._dirty = set()
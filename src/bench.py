@@ -0,0 +1,450 @@
+# This file is Copyright (C) 2022 Christoph Reichenbach
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the
+#   Free Software Foundation, Inc.
+#   59 Temple Place, Suite 330
+#   Boston, MA  02111-1307
+#   USA
+#
+# The author can be reached as "creichen" at the usual gmail server.
+
+'''Micro-benchmarks for the event pipeline (not part of the test suite)'''
+
+from __future__ import annotations
+
+import argparse
+import gc
+import io
+import itertools
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+import caltime
+import tzresolve
+import event
+import event_table
+import org_events
+import orgwriter
+import syncstate
+
+cconv = caltime.CalConverter(tzresolve.TZResolver(None))
+
+def dt(s):
+    return cconv.time_from_str(s)
+
+def mk_events(count : int, recurrences=None):
+    '''Generates 'count' synthetic events, roughly shaped like the ones we get from Evolution'''
+    base = dt('2022-01-03T09:00/UTC')
+    for i in range(count):
+        start = base + timedelta(hours=i)
+        ev = event.EventRepeater(f'uid-{i:08d}@example.com', f'Meeting #{i}', start)
+        ev.end = start + timedelta(minutes=30)
+        ev.location = 'Room 1'
+        ev.attendees = [f'user{j}@example.com' for j in range(i % 5)]
+        if recurrences is not None:
+            ev.recurrences = recurrences()
+        yield ev
+
+
+def bench_memory(count : int):
+    '''Per-event memory footprint'''
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    events = list(mk_events(count))
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    shallow = sys.getsizeof(events[0])
+    if hasattr(events[0], '__dict__'):
+        shallow += sys.getsizeof(events[0].__dict__)
+    print(f'memory: {count} events, {(after - before) / count:.0f} bytes/event ({shallow} bytes/event object)')
+    return events
+
+
+def bench_expand(count : int):
+    '''Expansion of daily recurring events over a year into occurrences, plus reading them back'''
+    window_start, window_end = dt('2022-01-03T00:00/UTC'), dt('2023-01-03T00:00/UTC')
+    series = list(mk_events(max(1, count // 365), recurrences=lambda: [cconv.daily_recurrence()]))
+
+    def expand(mk_occurrence):
+        def run():
+            occurrences = [mk_occurrence(occ) for ev in series for occ in ev.in_interval(window_start, window_end)]
+            for occ in occurrences:
+                occ.name, occ.status, occ.start, occ.location
+            return occurrences
+
+        gc.collect()
+        start = time.perf_counter()
+        n = len(run())
+        duration = time.perf_counter() - start
+
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        occurrences = run()
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return f'{n / duration:.0f} occurrences/s, {(after - before) / n:.0f} bytes/occurrence'
+
+    print(f'expand (Occurrence): {expand(lambda occ: occ)}')
+    print(f'expand (ProxyEvent): ' +
+          expand(lambda occ: event.ProxyEvent(occ.base_event, occ.sequence_nr, start=occ.start, end=occ.end)))
+
+
+def bench_merge(count : int):
+    '''
+    Merging two EventSets in which one event in twenty has changed remotely: two-way, and three-way against a
+    snapshot of the unchanged events (cf. syncstate.SyncState.base).  Each merge starts from fresh events.
+    '''
+    def mk_set(changed):
+        events = event.EventSet()
+        for i, ev in enumerate(mk_events(count)):
+            ev.description = 'Agenda:\n' + '- item\n' * 20
+            if changed and i % 20 == 0:
+                ev.status = event.CANCELLED
+            events.add(ev)
+        return events
+
+    def timed_merge(base):
+        local, remote = mk_set(False), mk_set(True)
+        gc.collect()
+        start = time.perf_counter()
+        local.merge(remote, base=base)
+        return time.perf_counter() - start
+
+    base = {key : syncstate.decode_event(syncstate.encode_event(ev)) for key, ev in mk_set(False).items()}
+    print(f'merge: {count} events, two-way {timed_merge(None):.3f}s, three-way {timed_merge(base):.3f}s')
+
+
+def bench_sync(count : int):
+    '''
+    One synchronisation of 'count' events (one in twenty changed remotely) against the persisted state: loading the
+    state, the three-way merge, and saving the new state
+    '''
+    def mk_calendars(changed):
+        events = []
+        for i, ev in enumerate(mk_events(count)):
+            ev.description = 'Agenda:\n' + '- item\n' * 20
+            if changed and i % 20 == 0:
+                ev.status = event.CANCELLED
+            events.append(ev)
+        cals = event.MergingDict()
+        cals['C0'] = org_events.OrgCalendar('CAL0', 'C0', events)
+        return cals
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        orgfile = os.path.join(tmpdir, 'bench.org')
+        syncstate.SyncState.from_calendars(mk_calendars(False)).save(orgfile)
+        local, remote = mk_calendars(False), mk_calendars(True)
+        gc.collect()
+        start = time.perf_counter()
+        state = syncstate.SyncState.load(orgfile)
+        base = state.base
+        loaded = time.perf_counter()
+        local.merge(remote, base=base)
+        merged = time.perf_counter()
+        syncstate.SyncState.from_calendars(remote).save(orgfile)
+        saved = time.perf_counter()
+    print(f'sync: {count} events, {saved - start:.3f}s (load {loaded - start:.3f}s, merge {merged - loaded:.3f}s, '
+          f'save {saved - merged:.3f}s)')
+
+
+def bench_attendees(count : int):
+    '''Merging large attendee lists (one list of 'count' attendees, half of them new on either side)'''
+    local = event.EventStringList(f'user{i}@example.com' for i in range(0, count))
+    remote = event.EventStringList(f'user{i}@example.com' for i in range(count // 2, count + count // 2))
+    start = time.perf_counter()
+    merged = local.merge(remote)
+    duration = time.perf_counter() - start
+    assert len(merged) == count + count // 2
+    print(f'attendees: merging {count} + {count} attendees, {duration:.4f}s')
+
+
+def bench_window(count : int):
+    '''One-day window queries over 'count' events (one per hour), with and without the interval index'''
+    evs = event.EventSet()
+    for ev in mk_events(count):
+        evs.add(ev)
+    window_start = dt('2022-02-01T00:00/UTC')
+    window_end = window_start + timedelta(days=1)
+
+    start = time.perf_counter()
+    n_scan = sum(1 for ev in evs.values() for _ in ev.in_interval(window_start, window_end))
+    scan = time.perf_counter() - start
+
+    start = time.perf_counter()
+    evs.index
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    n_indexed = sum(1 for _ in evs.in_interval(window_start, window_end))
+    indexed = time.perf_counter() - start
+    assert n_scan == n_indexed
+    print(f'window: {n_indexed} occurrences, scan: {scan:.4f}s, index: {indexed:.6f}s (built in {build:.3f}s)')
+
+
+def bench_next(count : int):
+    '''The next 100 occurrences across 'count' / 24 daily series that recur forever'''
+    evs = event.EventSet()
+    for ev in mk_events(max(1, count // 24), recurrences=lambda: [cconv.daily_recurrence()]):
+        evs.add(ev)
+    evs.index
+    window_start = dt('2022-06-01T00:00/UTC')
+
+    start = time.perf_counter()
+    upcoming = list(itertools.islice(evs.chronological(window_start), 100))
+    duration = time.perf_counter() - start
+    assert all(a.start <= b.start for a, b in zip(upcoming, upcoming[1:]))
+    print(f'next: 100 of {len(evs)} unbounded series, {duration:.4f}s')
+
+
+def bench_table(count : int):
+    '''Filtering out past events, per object and with an EventTable mask'''
+    events = list(mk_events(count))
+    today = dt('2022-06-01T00:00/UTC')
+
+    start = time.perf_counter()
+    n_scan = sum(1 for ev in events if ev.recurrences or ev.end.astimezone(None) > today)
+    scan = time.perf_counter() - start
+
+    start = time.perf_counter()
+    table = event_table.EventTable(events)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    n_masked = len(table.select(table.active_after(today)))
+    masked = time.perf_counter() - start
+    assert n_scan == n_masked
+    print(f'table: {n_masked} of {count} events upcoming, scan: {scan:.4f}s, mask: {masked:.4f}s '
+          f'(built in {build:.3f}s, numpy: {event_table.numpy is not None})')
+
+
+def bench_stream(count : int):
+    '''Peak memory of updating an org file of 'count' events in memory and by streaming'''
+    def calendars(changed):
+        cals = event.MergingDict()
+        evs = event.EventSet()
+        for i, ev in enumerate(mk_events(count)):
+            if changed and i % 20 == 0:
+                ev.status = event.CANCELLED
+            evs.add(ev)
+        cals['C0'] = org_events.OrgCalendar('CAL0', 'C0', evs)
+        return cals
+
+    today = dt('2022-01-01T00:00/UTC')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        orgfile_name = os.path.join(tmpdir, 'calendar.org')
+        with open(orgfile_name, 'w') as f:
+            org_events.OrgEventUnparser(f, today=today).unparse_all_streams(
+                org_events.merge_calendar_streams(org_events.calendar_streams(calendars(False)), event.MergingDict()))
+        remote = calendars(True)
+
+        def in_memory(parse, output):
+            local = parse.load(orgfile_name)
+            org_events.OrgEventUnparser(output, today=today).unparse_all(org_events.merge_calendars(local, remote))
+
+        def streaming(parse, output):
+            org_events.OrgEventUnparser(output, today=today).unparse_all_streams(
+                org_events.merge_calendar_streams(parse.stream(orgfile_name), remote))
+
+        for name, update in [('in memory', in_memory), ('streaming', streaming)]:
+            gc.collect()
+            with open(os.devnull, 'w') as output:
+                tracemalloc.start()
+                start = time.perf_counter()
+                update(org_events.OrgEventParser(), output)
+                duration = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            print(f'stream: {count} events, {name}: {duration:.3f}s, peak {peak / 2**20:.1f} MiB')
+
+
+def bench_write(count : int):
+    '''
+    Rewriting an unchanged org file of 'count' events via print() into a StringIO, and with an AtomicOrgWriter
+    (with and without skipping unchanged output)
+    '''
+    cals = event.MergingDict()
+    cals['C0'] = org_events.OrgCalendar('CAL0', 'C0', mk_events(count))
+    today = dt('2022-01-01T00:00/UTC')
+
+    class PrintingUnparser(org_events.OrgEventUnparser):
+        def pr(self, *args):
+            print(*args, file=self.f)
+
+    def via_stringio(path):
+        buf = io.StringIO()
+        PrintingUnparser(buf, today=today).unparse_all(cals)
+        with open(path, 'w') as output:
+            output.write(buf.getvalue())
+
+    def atomic(skip_unchanged):
+        def write(path):
+            with orgwriter.AtomicOrgWriter(path, skip_unchanged=skip_unchanged) as output:
+                org_events.OrgEventUnparser(output, today=today).unparse_all(cals)
+        return write
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, write in [('StringIO', via_stringio), ('AtomicOrgWriter', atomic(False)),
+                            ('AtomicOrgWriter, skipping', atomic(True))]:
+            path = os.path.join(tmpdir, 'calendar.org')
+            write(path)
+            mtime = os.stat(path).st_mtime_ns
+            gc.collect()
+            start = time.perf_counter()
+            write(path)
+            duration = time.perf_counter() - start
+            tracemalloc.start()
+            write(path)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            touched = 'rewritten' if os.stat(path).st_mtime_ns != mtime else 'untouched'
+            print(f'write: {count} events, {name}: {duration:.3f}s, peak {peak / 2**20:.1f} MiB, file {touched}')
+
+
+def bench_render(count : int):
+    '''Rendering 8 calendars of 'count' / 8 daily series each (a week of occurrences per series), with 1-8 processes'''
+    cals = event.MergingDict()
+    for c in range(8):
+        cals[f'C{c}'] = org_events.OrgCalendar(f'CAL{c}', f'C{c}',
+                                               mk_events(count // 8, recurrences=lambda: [cconv.daily_recurrence()]))
+    today = dt('2022-06-01T00:00/UTC')
+
+    outputs = []
+    for jobs in [1, 2, 4, 8]:
+        buf = io.StringIO()
+        gc.collect()
+        start = time.perf_counter()
+        org_events.OrgEventUnparser(buf, today=today).unparse_all(cals, jobs=jobs)
+        print(f'render: {count} series, {jobs} job(s): {time.perf_counter() - start:.3f}s ({os.cpu_count()} CPUs)')
+        outputs.append(buf.getvalue())
+    assert all(output == outputs[0] for output in outputs)
+
+
+def bench_pmerge(count : int):
+    '''
+    Merging 8 calendars of 'count' / 8 events each (one in twenty changed remotely) and rendering them, with 1-8
+    processes: merged in this process and rendered in workers, or merged and rendered in the same workers
+    '''
+    def mk_calendars(changed):
+        cals = event.MergingDict()
+        for c in range(8):
+            events = list(mk_events(count // 8))
+            for i, ev in enumerate(events):
+                if changed and i % 20 == 0:
+                    ev.status = event.CANCELLED
+            cals[f'C{c}'] = org_events.OrgCalendar(f'CAL{c}', f'C{c}', events)
+        return cals
+
+    local, remote = mk_calendars(False), mk_calendars(True)
+    unparser = org_events.OrgEventUnparser(None, today=dt('2022-01-01T00:00/UTC'))
+    for jobs in [1, 2, 4, 8]:
+        gc.collect()
+        start = time.perf_counter()
+        merged = org_events.merge_calendars(local, remote)
+        separate = org_events.render_calendars(unparser, list(merged.values()), jobs=jobs)
+        separate_time = time.perf_counter() - start
+        del merged
+
+        gc.collect()
+        start = time.perf_counter()
+        together = org_events.merge_and_render_calendars(unparser, local, remote, list(local), jobs=jobs)
+        together_time = time.perf_counter() - start
+        assert [text for text, _ in together] == separate
+        print(f'pmerge: {count} events, {jobs} job(s): merge, then render {separate_time:.3f}s, '
+              f'merge and render in workers {together_time:.3f}s ({os.cpu_count()} CPUs)')
+
+
+def bench_repeat(count : int):
+    '''Rendering and parsing 'count' daily and three-times-weekly series, expanded by hand and as org repeaters'''
+    events = list(mk_events(count))
+    for i, ev in enumerate(events):
+        if i % 2:
+            ev.recurrences = [cconv.recurrence_from_rrule('FREQ=DAILY;INTERVAL=1')]
+        else:
+            days = ','.join(caltime.RRULE_WEEKDAYS[(ev.start.weekday(caltime.WEEKSTART_MON) + 1 + d) % 7] for d in [0, 2, 4])
+            ev.recurrences = [cconv.recurrence_from_rrule(f'FREQ=WEEKLY;INTERVAL=1;BYDAY={days};WKST=MO')]
+    cals = event.MergingDict()
+    cals['C0'] = org_events.OrgCalendar('CAL0', 'C0', events)
+    today = events[-1].start + timedelta(days=1) # every series has started
+
+    for native in [False, True]:
+        buf = io.StringIO()
+        gc.collect()
+        start = time.perf_counter()
+        org_events.OrgEventUnparser(buf, today=today, org_agenda_native_recurrence_allowed=native).unparse_all(cals)
+        render_time = time.perf_counter() - start
+        text = buf.getvalue()
+
+        start = time.perf_counter()
+        parsed = org_events.OrgEventParser(today=today).loads(text)
+        parse_time = time.perf_counter() - start
+        assert len(parsed['C0'].events) == count
+        print(f'repeat: {count} series, {"native" if native else "expanded"}: {len(text) / 1e6:.1f} MB, '
+              f'render {render_time:.3f}s, parse {parse_time:.3f}s')
+
+def bench_slide(count : int):
+    '''Moving 'count' hand-expanded daily series a day forward, compared to rendering them again'''
+    events = list(mk_events(count))
+    for ev in events:
+        ev.recurrences = [cconv.daily_recurrence(count=1000)]
+    cal = org_events.OrgCalendar('CAL0', 'C0', events)
+    since = events[-1].start + timedelta(days=1) # every series has started
+    for days in [7, 90]:
+        text = org_events.OrgEventUnparser(None, today=since, recurrence_emit_future_days=days).render_calendar(cal)
+        unparser = org_events.OrgEventUnparser(None, today=since + timedelta(days=1), recurrence_emit_future_days=days)
+        gc.collect()
+        start = time.perf_counter()
+        rendered = unparser.render_calendar(cal)
+        render_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        slid = unparser.slide_calendar(text, cal, since)
+        slide_time = time.perf_counter() - start
+        assert slid == rendered
+        print(f'slide: {count} series, {days} days: {len(text) / 1e6:.1f} MB, render {render_time:.3f}s, '
+              f'slide {slide_time:.3f}s')
+
+
+BENCHMARKS = {
+    'memory' : bench_memory,
+    'expand' : bench_expand,
+    'merge'  : bench_merge,
+    'sync'   : bench_sync,
+    'attendees' : bench_attendees,
+    'window' : bench_window,
+    'next'   : bench_next,
+    'table'  : bench_table,
+    'stream' : bench_stream,
+    'write'  : bench_write,
+    'render' : bench_render,
+    'pmerge' : bench_pmerge,
+    'repeat' : bench_repeat,
+    'slide'  : bench_slide,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run micro-benchmarks')
+    parser.add_argument('benchmarks', metavar='BENCH', nargs='*', default=list(BENCHMARKS),
+                        help=f'Benchmarks to run (default: all of {", ".join(BENCHMARKS)})')
+    parser.add_argument('--count', '-n', type=int, default=50000, help='Number of events')
+
+    args = parser.parse_args()
+    for b in args.benchmarks:
+        start = time.perf_counter()
+        BENCHMARKS[b](args.count)
+        print(f'  ({time.perf_counter() - start:.2f}s)')
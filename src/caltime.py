@@ -22,6 +22,7 @@
 from __future__ import annotations
 
 from enum import Enum
+import functools
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from tzresolve import TZResolver
@@ -64,6 +65,29 @@ RECURRENCE_ENCODING = {
     Recur.MONTH		: 'M',  # FIXME: this only works for my personal config
     Recur.YEAR		: 'Y',  # FIXME: this only works for my personal config
 }
+'''Inverse of RECURRENCE_ENCODING'''
+RECURRENCE_DECODING = {enc : unit for unit, enc in RECURRENCE_ENCODING.items() if enc is not None}
+
+'''Units of org-mode repeaters (org has none for minutes or seconds), cf. Recurrence.org_agenda_spec()'''
+ORG_REPEATER_UNITS = {
+    Recur.HOUR		: 'h',
+    Recur.DAY		: 'd',
+    Recur.WEEK		: 'w',
+    Recur.MONTH		: 'm',
+    Recur.YEAR		: 'y',
+}
+
+'''iCalendar FREQ values, cf. Recurrence.rrule()'''
+RRULE_FREQUENCIES = {
+    Recur.MINUTE	: 'MINUTELY',
+    Recur.HOUR		: 'HOURLY',
+    Recur.DAY		: 'DAILY',
+    Recur.WEEK		: 'WEEKLY',
+    Recur.MONTH		: 'MONTHLY',
+    Recur.YEAR		: 'YEARLY',
+}
+'''iCalendar weekday names, indexed by ECal weekday - 1 (i.e., starting with Sunday)'''
+RRULE_WEEKDAYS = ['SU', 'MO', 'TU', 'WE', 'TH', 'FR', 'SA']
 
 class CalTimeIncrement:
     '''
@@ -116,11 +140,27 @@ class YearIncrement(MonthIncrement):
         return f'{{years+={self.months//12}}}'
 
 
+def recurrence_increment(unit : Recur, factor : int):
+    '''Increment for the 'outer loop' of a recurrence every 'factor' units'''
+    if unit == Recur.MONTH:
+        return MonthIncrement(factor)
+    if unit == Recur.YEAR:
+        return YearIncrement(factor)
+    return timedelta(**{f'{unit.value}s' : factor})
+
+
 # Since ical supports week starts both for Sundays and Mondays, we have to
 # introduce some extra complexity:
 WEEKSTART_SUN = I_CAL_SUNDAY_WEEKDAY
 WEEKSTART_MON = I_CAL_MONDAY_WEEKDAY
 
+'''Number of days whose CalTime.date_str() we remember (about ten years' worth)'''
+DATE_STR_CACHE_SIZE = 4096
+
+@functools.lru_cache(maxsize=DATE_STR_CACHE_SIZE)
+def _date_str(year : int, month : int, day : int) -> str:
+    return f'{year:04d}-{month:02d}-{day:02d} {CalTime.WEEKDAYS[datetime(year, month, day).weekday()]}'
+
 class CalTime(datetime):
     '''
     Extension of datatime with specialised stringification and conversion operations
@@ -131,6 +171,11 @@ class CalTime(datetime):
     def __new__(cls, year=None, month=None, day=None, hour=0, minute=0, second=0, microsecond=0, tzinfo=None):
         return super().__new__(cls, year, month, day, hour, minute, second, microsecond, tzinfo)
 
+    def __reduce_ex__(self, protocol):
+        # datetime's own pickle format would go through __new__ with a byte string
+        return (CalTime, (self.year, self.month, self.day, self.hour, self.minute, self.second, self.microsecond,
+                          self.tzinfo))
+
     @staticmethod
     def from_datetime(dt, tzinfo=None):
         if tzinfo is None:
@@ -141,14 +186,15 @@ class CalTime(datetime):
         return CalTime.WEEKDAYS[self.weekday(WEEKSTART_MON)]
 
     def date_str(self):
-        return self.strftime('%Y-%m-%d') + ' ' + self.weekday_str()
+        '''Date with weekday, as in org timestamps ("2022-01-03 Mon"); memoised per day, cf. DATE_STR_CACHE_SIZE'''
+        return _date_str(self.year, self.month, self.day)
 
     def astimezone(self, timezone):
         return super().astimezone(timezone)
 
     @staticmethod
     def today(tzinfo):
-        now = datetime.now()
+        now = datetime.now(tzinfo)
         return CalTime(year = now.year, month = now.month, day = now.day, tzinfo=tzinfo).astimezone(tzinfo)
 
     @staticmethod
@@ -164,7 +210,7 @@ class CalTime(datetime):
         return wd
 
     def time_str(self):
-        return self.strftime('%H:%M')
+        return f'{self.hour:02d}:{self.minute:02d}'
 
     def as_mock(self):
         if self.tzinfo is None:
@@ -182,10 +228,11 @@ class CalTime(datetime):
         return (CalTime(year, dm, 1) - timedelta(days = 1)).day
 
     def timespec(self, repetition=None, untiltime=None):
+        '''Active org timestamp; 'repetition' is an org repeater such as "+1w" (cf. Recurrence.org_agenda_spec())'''
         if repetition is None:
             repstr = ''
         else:
-            repstr = f' {repetition.org_agenda_spec}'
+            repstr = f' {repetition}'
         if untiltime is None:
             untiltime = ''
         else:
@@ -199,7 +246,7 @@ class CalTime(datetime):
         return self == other.astimezone(self.tzinfo)
 
     def to_str(self) -> str:
-        return self.strftime('%Y-%m-%dT%H:%M')
+        return f'{self.year:04d}-{self.month:02d}-{self.day:02d}T{self.hour:02d}:{self.minute:02d}'
 
     @staticmethod
     def from_str(s, tzinfo=None):
@@ -250,6 +297,10 @@ class Subiterator:
     def weekday(self, d):
         return self.sunday() if d == 1 else d - 2
 
+    def ecal_weekday(self, weekday):
+        '''Inverse of weekday()'''
+        return 1 if weekday == self.sunday() else weekday + 2
+
 
 class WeekdaySubiterator(Subiterator):
     '''Given a week, find the given weekdays'''
@@ -388,15 +439,67 @@ class MonthAndWeekdaySubiterator(MonthDaySubiterator):
 DEBUGPRINT_NONE=lambda _:()
 DEBUGPRINT=DEBUGPRINT_NONE
 
+class Exclusions:
+    '''
+    Occurrences excluded from a recurring event: EXDATEs, hashed by their POSIX timestamps (cf.
+    event.recurrence_key()), and EXRULEs, whose dates are generated lazily alongside the dates that they
+    filter.
+    '''
+
+    __slots__ = ('dates', 'rules')
+
+    def __init__(self, dates=(), rules=()):
+        self.dates = frozenset(int(d.timestamp()) for d in dates)
+        self.rules = tuple(rules)
+
+    def __bool__(self):
+        return bool(self.dates or self.rules)
+
+    def shifted(self, delta : timedelta) -> Exclusions:
+        '''The same exclusions for dates that are offset by 'delta' (e.g., for event end dates)'''
+        result = Exclusions(rules=self.rules)
+        offset = int(delta.total_seconds())
+        result.dates = frozenset(d + offset for d in self.dates)
+        return result
+
+    def filter(self, first_date : CalTime, dates):
+        '''
+        Yields all 'dates' (ascending, from a recurrence starting at 'first_date') that are not excluded.
+        EXRULE dates are generated from 'first_date' in lockstep with 'dates'.
+        '''
+        exdates = self.dates
+        exrules = [rule.range_from(first_date).all() for rule in self.rules]
+        next_excluded = [next(it, None) for it in exrules]
+
+        for date in dates:
+            if exdates and int(date.timestamp()) in exdates:
+                continue
+            excluded = False
+            for i, it in enumerate(exrules):
+                ex = next_excluded[i]
+                while ex is not None and ex < date:
+                    ex = next(it, None)
+                next_excluded[i] = ex
+                if ex == date:
+                    excluded = True
+            if not excluded:
+                yield date
+
+    def __str__(self):
+        return f'{{exdates={len(self.dates)}, exrules=[{", ".join(str(r) for r in self.rules)}]}}'
+
+
 class RecurrenceRange:
     def __init__(self, first_date : CalTime,
                  increment : timedelta, subiterator,
-                 count : int, until : CalTime):
+                 count : int, until : CalTime,
+                 exclusions : Exclusions=None):
         self.first_date = first_date
         self.increment = increment
         self.subiterator = subiterator
         self.count = None if count == 0 else count
         self.until = None if until is None else until.astimezone(self.tzinfo)
+        self.exclusions = exclusions if exclusions else None
 
     @property
     def tzinfo(self):
@@ -408,21 +511,33 @@ class RecurrenceRange:
 
     def all(self):
         '''Returns an iterator over all CalTimes'''
-        return self._starting(self.start_date)
+        return self._filtered(self._starting(self.start_date))
+
+    def _filtered(self, it):
+        # Excluded dates still count towards 'count', so we filter after generating them
+        if self.exclusions is None:
+            return it
+        return self.exclusions.filter(self.start_date, it)
 
     def before_end(self, caltime):
         '''"until" is inclusive, so it is technically before-or-equal the end'''
-        caltime = caltime.astimezone(self.tzinfo)
         return self.until is None or caltime.astimezone(self.tzinfo) <= self.until
 
     def starting(self, start : CalTime):
         '''Returns an iterator over all CalTimes at or after 'start' '''
         start = start.astimezone(self.tzinfo)
 
-        # must skip to first valid date
-        it = self._starting(self.start_date)
-        # Performance improvements possible here!
+        # We need not generate the periods (of 'increment', from the base date) that end before 'start'; we can
+        # only compute those for fixed increments, though, not for months or years
+        periods = 0
+        if isinstance(self.increment, timedelta):
+            base = self.first_date.astimezone(self.tzinfo) # As in _starting()
+            if self.subiterator:
+                base = self.subiterator.base_date(base)
+            periods = max(0, (start - base) // self.increment)
 
+        # must skip to first valid date
+        it = self._filtered(self._starting(self.start_date, periods))
         for v in it:
             if v >= start:
                 yield v
@@ -432,48 +547,65 @@ class RecurrenceRange:
         return
 
 
-    def _starting(self, start : CalTime):
-        '''Returns an iterator over all CalTimes explicitly starting at 'start' '''
+    def _starting(self, start : CalTime, periods : int=0):
+        '''
+        Returns an iterator over all CalTimes explicitly starting at 'start'; with 'periods' > 0, only over those
+        from that many increments (which must be timedeltas) after it on
+        '''
         start = start.astimezone(self.tzinfo)
 
         count = self.count
         pos = start
 
         pr = DEBUGPRINT
+        debug = pr is not DEBUGPRINT_NONE # Skip formatting debug messages in the hot loops
+
+        if debug: pr(f"[it, c:{count}, until:{self.until}] -- START -- at {start}")
+
+        if periods > 0:
+            # The skipped dates still count: the start date, those after it in its period, and all of later ones
+            skipped = periods
+            if self.subiterator:
+                pos = self.subiterator.base_date(pos)
+                per_period = sum(1 for _ in self.subiterator.all_from(pos))
+                in_first = sum(1 for date in self.subiterator.all_from(pos) if date > start)
+                skipped = 1 + in_first + (periods - 1) * per_period
+            if count is not None:
+                count = max(0, count - skipped)
+            pos = pos + periods * self.increment
+            if debug: pr(f"[it, c:{count}, until:{self.until}] Skipping {periods} periods: {pos}")
+        else:
+            # Phase 1: Start date
+            if self.before_end(pos) and count != 0:
+                if count is not None:
+                    count -= 1
+                if debug: pr(f"[it, c:{count}, until:{self.until}] Phase 1 ==> {pos}")
+                yield pos
 
-        pr(f"[it, c:{count}, until:{self.until}] -- START -- at {start}")
 
-        # Phase 1: Start date
-        if self.before_end(pos) and count != 0:
-            if count is not None:
-                count -= 1
-            pr(f"[it, c:{count}, until:{self.until}] Phase 1 ==> {pos}")
-            yield pos
-
-
-        # Phase 2: subiterator (if any) bounded by start date
-        if self.subiterator:
-            pos = self.subiterator.base_date(pos)
-            pr(f"[it, c:{count}, until:{self.until}] Phase 2 : {pos} <- base_date()")
-            for date in self.subiterator.all_from(pos):
-                if date > start:
-                    if count == 0 or not self.before_end(date):
-                        pr(f"[it, c:{count}, until:{self.until}] Phase 2 : done early")
-                        return # done
-                    if count is not None:
-                        count -= 1
-                    pr(f"[it, c:{count}, until:{self.until}] Phase 2 ==> {date}")
-                    yield date
-                else:
-                    pr(f"[it, c:{count}, until:{self.until}] Phase 2 skipping {date} (<= {start})")
+            # Phase 2: subiterator (if any) bounded by start date
+            if self.subiterator:
+                pos = self.subiterator.base_date(pos)
+                if debug: pr(f"[it, c:{count}, until:{self.until}] Phase 2 : {pos} <- base_date()")
+                for date in self.subiterator.all_from(pos):
+                    if date > start:
+                        if count == 0 or not self.before_end(date):
+                            if debug: pr(f"[it, c:{count}, until:{self.until}] Phase 2 : done early")
+                            return # done
+                        if count is not None:
+                            count -= 1
+                        if debug: pr(f"[it, c:{count}, until:{self.until}] Phase 2 ==> {date}")
+                        yield date
+                    else:
+                        if debug: pr(f"[it, c:{count}, until:{self.until}] Phase 2 skipping {date} (<= {start})")
 
-        pos = self.increment + pos
-        pr(f"[it, c:{count}, until:{self.until}] Phase 3: {pos}")
+            pos = self.increment + pos
+        if debug: pr(f"[it, c:{count}, until:{self.until}] Phase 3: {pos}")
 
         # Phase 3: free iteration
         while self.before_end(pos) and count != 0:
             if not self.subiterator:
-                pr(f"[it, c:{count}, until:{self.until}] Phase 3 ==> {pos}")
+                if debug: pr(f"[it, c:{count}, until:{self.until}] Phase 3 ==> {pos}")
                 yield pos
                 if count is not None:
                     count -= 1
@@ -481,14 +613,14 @@ class RecurrenceRange:
                 for date in self.subiterator.all_from(pos):
                     if date > start:
                         if count == 0 or not self.before_end(date):
-                            pr(f"[it, c:{count}, until:{self.until}] Phase 3 : done early")
+                            if debug: pr(f"[it, c:{count}, until:{self.until}] Phase 3 : done early")
                             return # done
                         if count is not None:
                             count -= 1
-                        pr(f"[it, c:{count}, until:{self.until}] Phase 3 ==> {date}")
+                        if debug: pr(f"[it, c:{count}, until:{self.until}] Phase 3 ==> {date}")
                         yield date
                     else:
-                        pr(f"[it, c:{count}, until:{self.until}] Phase 3 skipping {date} (<= {start})")
+                        if debug: pr(f"[it, c:{count}, until:{self.until}] Phase 3 skipping {date} (<= {start})")
 
             pos = self.increment + pos
 
@@ -515,11 +647,37 @@ class Recurrence:
 
     def org_agenda_spec(self):
         '''Returns None if there is no matching org agenda spec'''
-        return self.spec
+        if not self.spec:
+            return None
+        unit = ORG_REPEATER_UNITS.get(RECURRENCE_DECODING[self.spec[-1]])
+        if unit is None:
+            return None
+        return f'{self.spec[:-1]}{unit}'
 
-    def range_from(self, starttime : CalTime) -> RecurrenceRange:
-        '''Constructs a RecurrenceRange that can retrieve all individual instances, given a start time/date'''
-        return RecurrenceRange(starttime, self.increment, self.subiterator, count=self.count, until=self.until)
+    def rrule(self) -> str:
+        '''
+        iCalendar RRULE (without DTSTART) for unbounded rules with a spec (of which org timestamps can repeat
+        those with an org_agenda_spec()) and weekly rules on fixed weekdays; None for all other rules.
+        Inverse of CalConverter.recurrence_from_rrule().
+        '''
+        if self.until is not None or self.count:
+            return None
+        if self.spec:
+            return f'FREQ={RRULE_FREQUENCIES[RECURRENCE_DECODING[self.spec[-1]]]};INTERVAL={self.spec[1:-1]}'
+        sub = self.subiterator
+        if isinstance(sub, WeekdaySubiterator) and isinstance(self.increment, timedelta):
+            weekdays = ','.join(RRULE_WEEKDAYS[sub.ecal_weekday(sub.first + d) - 1] for d in sub.day_increments)
+            weekstart = 'SU' if sub.weekstart == WEEKSTART_SUN else 'MO'
+            return f'FREQ=WEEKLY;INTERVAL={self.increment.days // 7};BYDAY={weekdays};WKST={weekstart}'
+        return None
+
+    def range_from(self, starttime : CalTime, exclusions : Exclusions=None) -> RecurrenceRange:
+        '''
+        Constructs a RecurrenceRange that can retrieve all individual instances, given a start time/date,
+        skipping any 'exclusions'
+        '''
+        return RecurrenceRange(starttime, self.increment, self.subiterator, count=self.count, until=self.until,
+                               exclusions=exclusions)
 
     def __str__(self):
         fields = [('spec', self.spec),
@@ -619,6 +777,24 @@ class CalConverter:
     def daily_recurrence(self, count=None):
         return Recurrence(None, timedelta(days = 1), None, until = None, count = 0 if count is None else count)
 
+    def recurrence_from_rrule(self, rrule : str) -> Recurrence:
+        '''Inverse of Recurrence.rrule(); raises ValueError for rules that it does not produce'''
+        try:
+            fields = dict(part.split('=', 1) for part in rrule.split(';'))
+            unit = {freq : unit for unit, freq in RRULE_FREQUENCIES.items()}[fields['FREQ']]
+            factor = int(fields.get('INTERVAL', '1'))
+            if 'BYDAY' not in fields:
+                return Recurrence(f'+{factor}{RECURRENCE_ENCODING[unit]}', recurrence_increment(unit, factor), None,
+                                  until=None, count=0)
+            if unit != Recur.WEEK:
+                raise ValueError(f'weekdays in {fields["FREQ"]} rule')
+            weekdays = [RRULE_WEEKDAYS.index(d) + 1 for d in fields['BYDAY'].split(',')]
+        except (KeyError, IndexError) as e:
+            raise ValueError(f'Unsupported recurrence rule "{rrule}"') from e
+        weekstart = WEEKSTART_SUN if fields.get('WKST') == 'SU' else WEEKSTART_MON
+        return Recurrence(None, recurrence_increment(unit, factor), WeekdaySubiterator(weekdays, weekstart=weekstart),
+                          until=None, count=0)
+
     def recurrence_from_evolution(self, rec) -> Recurrence:
         '''Convert Evolution recurrence objects to caltime.Recurrence'''
 
@@ -0,0 +1,110 @@
+# This file is Copyright (C) 2022 Christoph Reichenbach
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the
+#   Free Software Foundation, Inc.
+#   59 Temple Place, Suite 330
+#   Boston, MA  02111-1307
+#   USA
+#
+# The author can be reached as "creichen" at the usual gmail server.
+
+from __future__ import annotations
+
+from event import EventSet, MergingDict
+from org_events import OrgCalendar
+
+
+class DedupPolicy:
+    '''
+    Decides which calendar keeps an event that occurs (with the same UID) in several calendars.  Specs:
+    - 'first': the first calendar (in registry order) wins
+    - 'prefer:CALUID[,CALUID...]': the listed calendars win, in that order; otherwise the first one does
+    - 'link': as 'first', but the emitted event lists the other calendars (cf. OrgProc.ALSO_IN)
+    '''
+
+    def __init__(self, spec : str):
+        self.spec = spec
+        self.preferred = []
+        self.link = False
+        if spec == 'link':
+            self.link = True
+        elif spec.startswith('prefer:'):
+            self.preferred = [caluid for caluid in spec[len('prefer:'):].split(',') if caluid]
+            if not self.preferred:
+                raise ValueError(f'No calendars to prefer in dedup policy "{spec}"')
+        elif spec != 'first':
+            raise ValueError(f'Unknown dedup policy "{spec}"')
+
+    def priority_order(self, calendars : MergingDict) -> list[str]:
+        '''Calendar UIDs, highest priority first'''
+        preferred = [caluid for caluid in self.preferred if caluid in calendars]
+        return preferred + [caluid for caluid in calendars if caluid not in preferred]
+
+
+class UIDIndex:
+    '''Maps event keys (cf. Event.key) to the UIDs of all calendars that contain them, in priority order'''
+
+    def __init__(self, calendars : MergingDict, order : list[str]):
+        self._calendars = {}
+        for caluid in order:
+            for key in calendars[caluid].events:
+                self._calendars.setdefault(key, []).append(caluid)
+
+    def __len__(self):
+        return len(self._calendars)
+
+    def __contains__(self, key):
+        return key in self._calendars
+
+    def owner(self, key) -> str:
+        '''UID of the calendar that keeps the event'''
+        return self._calendars[key][0]
+
+    def calendars(self, key) -> list[str]:
+        return self._calendars[key]
+
+    def duplicates(self) -> int:
+        '''Number of redundant copies'''
+        return sum(len(caluids) - 1 for caluids in self._calendars.values())
+
+
+def deduplicate(calendars : MergingDict, policy : DedupPolicy) -> MergingDict:
+    '''
+    Calendars (as OrgCalendars, in the original order) in which each event only occurs once, in the calendar
+    that the policy picks.  With policy.link, the 'links' of each calendar map the keys of the events that it
+    keeps to the names of the other calendars that have them, too.
+    '''
+    index = UIDIndex(calendars, policy.priority_order(calendars))
+    result = MergingDict()
+    for caluid, cal in calendars.items():
+        events = EventSet()
+        links = {}
+        for key, ev in cal.events.items():
+            if index.owner(key) != caluid:
+                continue
+            events[key] = ev
+            if policy.link and len(index.calendars(key)) > 1:
+                links[key] = [calendars[other].name for other in index.calendars(key)[1:]]
+        result[caluid] = OrgCalendar(cal.name, caluid, events, links=links)
+    return result
+
+
+def deduplicate_stream(stream, calendars : MergingDict, policy : DedupPolicy):
+    '''
+    Drops the events from (calendar, events) pairs (as from org_events.OrgEventParser.stream()) that
+    deduplicate() would assign to another one of 'calendars'.  Events that none of 'calendars' has are kept.
+    '''
+    index = UIDIndex(calendars, policy.priority_order(calendars))
+    for cal, events in stream:
+        yield cal, (ev for ev in events if ev.key not in index or index.owner(ev.key) == cal.uid)
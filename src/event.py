@@ -22,10 +22,16 @@
 from __future__ import annotations
 
 import collections
+import collections.abc
+import functools
+import heapq
+import math
+import operator
 from typing import Generator, Optional
 import sys
 
-from caltime import CalTime, Recurrence, CalConverter
+from caltime import CalTime, Recurrence, RecurrenceRange, CalConverter, Exclusions
+from intervals import IntervalIndex
 
 EMPTY_EVENT_NAME='(nameless event)'
 
@@ -36,45 +42,75 @@ CANCELLED_STR='CANCELLED'
 
 EMIT_DEBUG=False
 EMIT_CONFLICT_DEBUG=True
+# Starts the explanation that Event.merge() appends to the description of conflict events
+CONFLICT_EXPLANATION='\nLocal/remote calendar Conflict:\n'
 
 def perr(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
+def without_conflict_explanation(v):
+    '''A property value without the explanation of an earlier conflict that it may carry (cf. Event.merge())'''
+    return v.partition(CONFLICT_EXPLANATION)[0] if isinstance(v, str) else v
+
 class MergeableEventProperty:
     '''Type that tags event properties that are 'mergeable' (part of a lattice)'''
 
+    __slots__ = ()
+
     def merge(self, other : MergeableEventProperty) -> (MergeableEventProperty) :
         '''Attempts to merge (join) two event properties'''
         raise Exception('Implement Me')
 
 
 class EventState(MergeableEventProperty):
-    '''TODO state'''
+    '''
+    TODO state.  States are interned: there is exactly one EventState per name, identified by a small integer
+    'code'.  Merging is a lookup in a join table that is recomputed whenever a state is registered.
+    '''
 
-    STATES = {}
+    __slots__ = ('name', 'code')
+
+    STATES = {}  # name -> EventState
+    BY_CODE = [] # code -> EventState
+    _JOIN = []   # code -> code -> EventState
 
     def __init__(self, name : str):
-        self.name = name
         assert name not in EventState.STATES
+        self.name = name
+        self.code = len(EventState.BY_CODE)
         EventState.STATES[name] = self
+        EventState.BY_CODE.append(self)
+        EventState._JOIN = [[EventState._join(l, r) for r in EventState.BY_CODE] for l in EventState.BY_CODE]
 
-    def merge(self, other : EventState) -> EventState:
-        if self == other:
-            return self
+    @staticmethod
+    def register(name : str) -> EventState:
+        '''The state with the given name, which is created if needed'''
+        state = EventState.STATES.get(name)
+        return EventState(name) if state is None else state
+
+    @staticmethod
+    def _join(left : EventState, right : EventState) -> EventState:
+        if left is right:
+            return left
 
         # DONE > CANCELLED > (misc) > TODO
+        # (by name, since the join table is computed while the main three are being created)
+        names = (left.name, right.name)
+        main_states = (TODO_STR, CANCELLED_STR, DONE_STR)
 
-        if self == DONE or other == DONE:
-            return DONE
-        if self == CANCELLED or other == CANCELLED:
-            return CANCELLED
+        for name in (DONE_STR, CANCELLED_STR):
+            if name in names:
+                return EventState.STATES[name]
 
         # Preserve local states that are not among the main three
-        if self not in [TODO, CANCELLED, DONE]:
-            return self
-        if other not in [TODO, CANCELLED, DONE]:
-            return other
-        return TODO
+        if left.name not in main_states:
+            return left
+        if right.name not in main_states:
+            return right
+        return EventState.STATES[TODO_STR]
+
+    def merge(self, other : EventState) -> EventState:
+        return EventState._JOIN[self.code][other.code]
 
     def __str__(self):
         return self.name
@@ -82,28 +118,82 @@ class EventState(MergeableEventProperty):
     def __repr__(self):
         return self.name
 
+    def __reduce__(self):
+        # Unpickle to the interned state
+        return (EventState.register, (self.name,))
+
     @staticmethod
-    def get(s):
-        assert(s is not None)
-        if s not in EventState.STATES:
-            return EventState(s)
+    def get(s : str) -> EventState:
+        '''The registered state with the given name; raises KeyError for unknown states'''
         return EventState.STATES[s]
 
 
-class EventStringList(list, MergeableEventProperty):
-    '''List of strings (used for attendee names)'''
+class EventStringList(MergeableEventProperty, collections.abc.Sequence):
+    '''
+    Immutable, order-preserving list of strings (used for attendee names).  Strings are interned, since
+    the same addresses recur across many events; the member set and hash are computed once, on demand.
+    '''
+
+    __slots__ = ('_items', '_members', '_hash')
 
-    def EventStringList(self, args):
-        super().__init__(self, args)
+    def __init__(self, items=()):
+        if isinstance(items, EventStringList):
+            self._items = items._items
+        else:
+            self._items = tuple(sys.intern(item) for item in items)
+        self._members = None
+        self._hash = None
+
+    @property
+    def members(self) -> frozenset[str]:
+        if self._members is None:
+            self._members = frozenset(self._items)
+        return self._members
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __contains__(self, item):
+        return item in self.members
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self._items)
+        return self._hash
+
+    def __eq__(self, other):
+        if isinstance(other, EventStringList):
+            return self is other or (hash(self) == hash(other) and self._items == other._items)
+        if isinstance(other, (list, tuple)):
+            return self._items == tuple(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self._items))
+
+    def __reduce__(self):
+        return (EventStringList, (self._items,))
+
+    def difference(self, other : EventStringList) -> EventStringList:
+        '''All items (in order) that are not in other'''
+        if not isinstance(other, EventStringList):
+            other = EventStringList(other)
+        members = other.members
+        return EventStringList(item for item in self._items if item not in members)
 
     def merge(self, other : EventStringList) -> EventStringList:
         if self == other:
             return self
-        rlist = list(self)
-        for item in other:
-            if item not in self:
-                rlist.append(item)
-        return EventStringList(rlist)
+        added = EventStringList(other).difference(self)
+        if not added:
+            return self
+        return EventStringList(self._items + added._items)
 
 
 TODO = EventState(TODO_STR)
@@ -144,6 +234,11 @@ def from_evolution(evo_event, cconverter : CalConverter) -> EventRepeater:
     if evo_event.get_dtend():
         event.end = cconverter.time_from_evolution(evo_event.get_dtend())
 
+    recurrence_id = evo_event.get_recurid()
+    if recurrence_id is not None:
+        # Detached instance: individually modified occurrence of a recurring event
+        event.recurrence_id = cconverter.time_from_evolution(recurrence_id.get_datetime())
+
     if evo_event.get_last_modified():
         event.last_modified_remote = cconverter.time_from_evolution(evo_event.get_last_modified())
 
@@ -166,7 +261,7 @@ def from_evolution(evo_event, cconverter : CalConverter) -> EventRepeater:
         event.organizer = evo_event.get_organizer().get_value()
 
     # Also potentially interesting: attendee.get_rsvp() : bool
-    event.attendees = sorted([attendee.get_value() for attendee in evo_event.get_attendees()])
+    event.attendees = EventStringList(sorted([attendee.get_value() for attendee in evo_event.get_attendees()]))
 
     event.description_remote = '\n'.join(d.get_value() for d in evo_event.get_descriptions())
 
@@ -184,21 +279,55 @@ def from_evolution(evo_event, cconverter : CalConverter) -> EventRepeater:
             else:
                 event.description_remote = rrec + '\n' + event.description_remote
 
+    exrules = []
     for exrule in evo_event.get_exrules():
-        perr('  -- exrule : %s : %s (%s)' % (exrule, type(exrule), dir(exrule)))
         rexrule = cconverter.recurrence_from_evolution(exrule)
         if type(rexrule) is Recurrence:
-            event.exceptions.append(rexrule)
+            exrules.append(rexrule)
         elif type(rexrule) is str:
             # Can't express directly, noting as string
             if event.description_remote == '':
-                event.description_remote = rrec
+                event.description_remote = 'Except: ' + rexrule
             else:
-                event.description_remote = 'Except: ' + rrec + '\n' + event.description_remote
+                event.description_remote = 'Except: ' + rexrule + '\n' + event.description_remote
+
+    exdates = [cconverter.time_from_evolution(exdate) for exdate in evo_event.get_exdates()]
+    exclusions = Exclusions([d for d in exdates if d is not None], exrules)
+    if exclusions:
+        event.exclusions = exclusions
 
     return event
 
 
+def equivalent(proptype, a, b) -> bool:
+    '''Are two values of an event property of the given type the same, as far as Event.diff() is concerned?'''
+    if a is None or b is None:
+        return a == b
+    if proptype is str:
+        return a.strip() == b.strip()
+    if proptype is CalTime:
+        return a.equivalent(b)
+    return a == b
+
+
+def _key_str(value):
+    return value.strip() if type(value) is str else value
+
+def _key_caltime(value):
+    # aware times by their UTC time, consistent with CalTime.equivalent()
+    return value if value.tzinfo is None else value.timestamp()
+
+def _key_any(value):
+    return tuple(value) if isinstance(value, list) else value
+
+def _key_function(proptype):
+    if proptype is str:
+        return _key_str
+    if proptype is CalTime:
+        return _key_caltime
+    return _key_any
+
+
 class Event:
     '''An abstract calendar event (which may describe a recurring event or an individual occurrence)'''
 
@@ -211,25 +340,80 @@ class Event:
         'start'                : (CalTime, None),
         'end'                  : (CalTime, None),
         'recurrences'          : (list[Recurrence], []),
+        'exclusions'           : (Exclusions, None),
         'last_modified_remote' : (CalTime, None),
         'organizer'            : (Optional[str], None),
         'evo_event'            : (object, None),
         'debuginfo'            : (list[str], []),
+        'recurrence_id'        : (CalTime, None),
+        'detached_instances'   : (dict, None),
     }
 
-    UNDIFFABLE_PROPERTIES = ['debuginfo', 'recurrences', 'end']
+    UNDIFFABLE_PROPERTIES = ['debuginfo', 'recurrences', 'exclusions', 'end', 'recurrence_id', 'detached_instances']
+
+    '''Opaque handles that are carried along when merging, but never compared'''
+    OPAQUE_PROPERTIES = ['evo_event']
+
+    # Concrete events store their PROPERTIES in slots, cf. Event.property_slots()
+    __slots__ = ('_event_id', '_sequence_nr')
 
     def __init__(self, event_id : str, sequence_nr : int):
         self._event_id = event_id
         self._sequence_nr = sequence_nr
 
+    @staticmethod
+    def property_slots(*extra_slots) -> tuple[str]:
+        '''__slots__ for an event class that stores all PROPERTIES (plus extra_slots) itself'''
+        return tuple(Event.PROPERTIES) + extra_slots
+
+    def __getstate__(self):
+        # Opaque handles (e.g., Evolution objects) can't be pickled
+        state = {}
+        for slot in _all_slots(type(self)):
+            if slot in _UNPICKLED:
+                state[slot] = None
+                continue
+            try:
+                state[slot] = getattr(self, slot)
+            except AttributeError:
+                pass
+        return (None, state)
+
+    def __setstate__(self, state):
+        for slot, v in state[1].items():
+            object.__setattr__(self, slot, v)
+
+    @property
+    def content_key(self) -> tuple:
+        '''
+        The COMPARED_PROPERTIES, normalised as in equivalent(): events with equal content keys have no
+        differences for merge()
+        '''
+        return tuple(v if v is None else key(v) for key, v in zip(_KEY_FUNCTIONS, _get_compared(self)))
+
+    def unchanged_since(self, base) -> bool:
+        '''Is this event (including its recurrences and detached instances) still equivalent to 'base' (cf. merge())?'''
+        common_recurrences, common_detached = base[_NUM_COMPARED:]
+        detached = self.detached_instances or {}
+        return (all(equivalent(proptype, v, common)
+                    for proptype, v, common in zip(_COMPARED_TYPES, _get_compared(self), base))
+                and recurrence_signature(self) == common_recurrences
+                and detached.keys() == common_detached.keys()
+                and all(instance.unchanged_since(common_detached[k]) for k, instance in detached.items()))
+
     def get_conflict_event(self):
         return None
 
+    def init_properties(self):
+        '''Sets all PROPERTIES to their defaults'''
+        for p, default, mk_fresh in _PROPERTY_DEFAULTS:
+            setattr(self, p, default if mk_fresh is None else mk_fresh())
+
     def populate_properties(self):
-        for p, (_, default) in Event.PROPERTIES.items():
+        '''Sets all PROPERTIES that are not set yet to their defaults'''
+        for p, default, mk_fresh in _PROPERTY_DEFAULTS:
             if not hasattr(self, p):
-                setattr(self, p, default)
+                setattr(self, p, default if mk_fresh is None else mk_fresh())
 
     @property
     def base_event(self):
@@ -239,6 +423,16 @@ class Event:
     def event_id(self):
         return self._event_id
 
+    @property
+    def key(self):
+        '''
+        Key in an EventSet: the event ID, or (event ID, recurrence_key()) for a detached instance (i.e.,
+        an individually modified occurrence) of a recurring event.
+        '''
+        if self.recurrence_id is None:
+            return self.event_id
+        return (self.event_id, recurrence_key(self.recurrence_id))
+
     @property
     def sequence_nr(self):
         return self._sequence_nr
@@ -261,25 +455,21 @@ class Event:
                 s += f'\n\t{n} = "{v}"'
         return s
 
-    def diff(self, other_event : Event) -> map[str, object]:
+    def diff(self, other_event : Event, properties=None) -> map[str, object]:
         '''
-        Find differences between all event attributes.  Conflicts are reported as (False, (self_elt, other_elt)),
-        merges as (True, merged).
+        Find differences between all event attributes (or only the given properties).  Conflicts are reported
+        as (False, (self_elt, other_elt)), merges as (True, merged).
         '''
         output = {}
-        for prop, (proptype, _) in Event.PROPERTIES.items():
+        if properties is None:
+            properties = Event.PROPERTIES
+        for prop in properties:
+            proptype = Event.PROPERTIES[prop][0]
             pself = getattr(self, prop)
             pother = getattr(other_event, prop)
 
-            if proptype is str and pself is not None and pother is not None:
-                if pself.strip() == pother.strip():
-                    continue
-            elif proptype is CalTime and pself is not None and pother is not None:
-                if pself.equivalent(pother):
-                    continue
-            else:
-                if pself == pother:
-                    continue
+            if equivalent(proptype, pself, pother):
+                continue
 
             v = (False, (pself, pother))
 
@@ -295,18 +485,63 @@ class Event:
 
         return output
 
-    def merge(self, other, explain_conflicts=True) -> ProxyEvent:
+    def merge(self, other, explain_conflicts=True, base=None, remote=True) -> ProxyEvent:
         '''
         Tries to merge in another event.  If complete merging is not possible, set up "get_conflict_event()"
         to return "other".  Returns ProxyEvent with conflict_event set to either 'None' or "other".
+
+        'base' optionally describes the common ancestor of both events (i.e., the state of "other" when we last
+        merged, cf. SyncState.base): the values of its COMPARED_PROPERTIES, its recurrence_signature(), and
+        a map from recurrence_key() to the same information for each of its detached instances.  Properties that
+        only one side changed since then are then taken from that side; only properties changed on both sides are
+        merged (and may conflict).
+
+        Recurrence rules, exclusions and detached instances are owned by the other (remote) side: org files either
+        don't preserve rules at all or only keep a copy for natively repeating events (cf.
+        OrgEventUnparser.native_repetition()), and only show the detached instances that fall into the window that
+        we render.  So we take them from "other", even if it has none; only a local copy of the rules that was
+        changed while "other" kept them as in 'base' survives.  Set 'remote' to False for merging two copies of an
+        event from the same source: then neither side owns them, and we keep what either side has.
         '''
         conflict_event = None
         updates = { }
-        diffs = self.diff(other)
 
-        for suppress_prop in Event.UNDIFFABLE_PROPERTIES:
-            if suppress_prop in diffs:
-                del diffs[suppress_prop]
+        if base is None:
+            diffs = self.diff(other, Event.COMPARED_PROPERTIES)
+            take_recurrences = remote or bool(other.recurrences)
+            common_detached = None
+        else:
+            changed_on_both_sides = []
+            for prop, proptype, common in zip(Event.COMPARED_PROPERTIES, _COMPARED_TYPES, base):
+                theirs = getattr(other, prop)
+                if equivalent(proptype, theirs, common):
+                    continue
+                if equivalent(proptype, getattr(self, prop), common):
+                    updates[prop] = theirs
+                else:
+                    changed_on_both_sides.append(prop)
+            diffs = self.diff(other, changed_on_both_sides)
+
+            common_recurrences, common_detached = base[_NUM_COMPARED:]
+            take_recurrences = (not self.recurrences
+                                or recurrence_signature(other) != common_recurrences
+                                or recurrence_signature(self) == common_recurrences)
+
+        for prop in Event.OPAQUE_PROPERTIES:
+            if getattr(self, prop) is None and getattr(other, prop) is not None:
+                updates[prop] = getattr(other, prop)
+
+        if take_recurrences:
+            if other.recurrences is not self.recurrences:
+                updates['recurrences'] = other.recurrences
+            if other.exclusions is not self.exclusions:
+                updates['exclusions'] = other.exclusions
+
+        if other.detached_instances is not self.detached_instances and (remote or other.detached_instances):
+            updates['detached_instances'] = merge_detached_instances(self.detached_instances,
+                                                                     other.detached_instances,
+                                                                     explain_conflicts, base=common_detached,
+                                                                     keep_mine=not remote)
 
         for k, v in diffs.items():
             resolved, result = v
@@ -320,21 +555,166 @@ class Event:
             b = conflict_event.description
             if b is None:
                 b = ''
-            b += ('\nLocal/remote calendar Conflict:\n')
+            # Replace the explanation of an earlier conflict, if any, rather than piling them up
+            b = without_conflict_explanation(b) + CONFLICT_EXPLANATION
             for k, v in diffs.items():
                 resolved, result = v
                 if not resolved:
                     suffix = ''
                     if EMIT_CONFLICT_DEBUG:
-                        suffix = f': "{result[0]}" vs "{result[1]}"'
+                        mine, theirs = map(without_conflict_explanation, result)
+                        suffix = f': "{mine}" vs "{theirs}"'
                     b += (f'- {k}{suffix}\n')
             conflict_event.description = b
 
+        return self._with_updates(conflict_event, updates)
+
+    def _with_updates(self, conflict_event, updates) -> ProxyEvent:
         return ProxyEvent(self, self.sequence_nr, conflict_event=conflict_event, **updates)
 
+    def recurrence_ranges(self, rec : Recurrence) -> tuple[RecurrenceRange, RecurrenceRange]:
+        '''RecurrenceRanges for the start and end times of the occurrences of 'rec' (skipping exclusions)'''
+        exclusions = self.exclusions
+        if self.end is None:
+            return (rec.range_from(self.start, exclusions),) * 2
+        end_exclusions = exclusions.shifted(self.end - self.start) if exclusions else None
+        return (rec.range_from(self.start, exclusions), rec.range_from(self.end, end_exclusions))
+
+    def _recurrence_times(self, rec : Recurrence) -> Generator[tuple[CalTime, CalTime]]:
+        starts, ends = self.recurrence_ranges(rec)
+        ends = ends.all()
+        for ev_start in starts.all():
+            ev_end = next(ends, None)
+            if ev_end is None:
+                return
+            yield (ev_start, ev_end)
+
+    def occurrence_times(self) -> Generator[tuple[CalTime, CalTime]]:
+        '''(start, end) of all occurrences, in chronological order'''
+        if not self.recurrences:
+            yield (self.start, self.start if self.end is None else self.end)
+        elif len(self.recurrences) == 1:
+            yield from self._recurrence_times(self.recurrences[0])
+        else:
+            yield from heapq.merge(*(self._recurrence_times(rec) for rec in self.recurrences),
+                                   key=operator.itemgetter(0))
+
+    def in_interval(self, start : Optional[CalTime], end : Optional[CalTime]) -> Generator[Event]:
+        '''
+        All events that intersect with this interval, in chronological order.  'start' may be None, and
+        so may 'end' (for unbounded intervals).
+        '''
+        if start is None:
+            start = self.start
+
+        detached = self.detached_instances
+        stop = end
+        if detached and end is not None:
+            # Occurrences may have been moved into the interval from later on
+            stop = max([end] + [i.recurrence_id for i in detached.values() if i.start <= end])
+
+        seq_nr = 0
+        for ev_start, ev_end in self.occurrence_times():
+            if stop is not None and ev_start > stop:
+                return # Passed the specified range
+            seq_nr += 1
+            base = self
+            if detached:
+                instance = detached.get(recurrence_key(ev_start))
+                if instance is not None:
+                    # Individually modified occurrence (yielded in the place of the original occurrence)
+                    base, ev_start, ev_end = instance, instance.start, instance.end or instance.start
+                    if end is not None and ev_start > end:
+                        continue
+            if ev_end >= start:
+                yield Occurrence(base, seq_nr, ev_start, ev_end)
+
+    def time_bounds(self) -> tuple[float, float]:
+        '''
+        POSIX timestamps of the first start and the last end over all occurrences (an upper bound for
+        recurrences with an 'until' date).  The end is math.inf if the event recurs indefinitely.
+        '''
+        start = self.start
+        first_start = start.timestamp()
+        last_end = first_start if self.end is None else self.end.timestamp()
+        duration = last_end - first_start
+        for rec in self.recurrences:
+            if rec.until is not None:
+                last_start = rec.until
+            elif rec.count:
+                for last_start in rec.range_from(start).all():
+                    pass
+            else:
+                return (first_start, math.inf)
+            last_end = max(last_end, last_start.timestamp() + duration)
+        for instance in (self.detached_instances or {}).values():
+            # Detached instances may have been moved
+            instance_start, instance_end = instance.time_bounds()
+            first_start = min(first_start, instance_start)
+            last_end = max(last_end, instance_end)
+        return (first_start, last_end)
+
+
+def recurrence_key(recurrence_id : CalTime) -> int:
+    '''Hash key for a RECURRENCE-ID, i.e., for the original start time of an occurrence'''
+    return int(recurrence_id.timestamp())
+
+
+def merge_detached_instances(mine : Optional[dict], theirs : Optional[dict], explain_conflicts=True,
+                             base : Optional[dict]=None, keep_mine=False) -> Optional[dict]:
+    '''
+    Merges two maps from recurrence_key() to detached instances.  Which occurrences are detached is up to
+    'theirs' (cf. Event.merge()), unless 'keep_mine' is set: then we keep the instances of both sides.  Instances
+    on both sides are merged, with their entries in 'base' (if any) as common ancestors.
+    '''
+    if not mine or not theirs:
+        return (mine or theirs) if keep_mine else theirs
+    if base is None:
+        base = {}
+    result = dict(mine) if keep_mine else {}
+    for k, instance in theirs.items():
+        result[k] = instance if k not in mine else mine[k].merge(instance, explain_conflicts=explain_conflicts,
+                                                                 base=base.get(k))
+    return result
+
+
+def recurrence_signature(event : Event) -> str:
+    '''
+    Description of the recurrence rules and exclusions of an event that is the same for the same rules (in any
+    process, cf. SyncState), and empty if the event doesn't recur
+    '''
+    parts = [str(rec) for rec in event.recurrences]
+    exclusions = event.exclusions
+    if exclusions:
+        parts.append(f'{sorted(exclusions.dates)}{[str(rule) for rule in exclusions.rules]}')
+    return '\x1f'.join(parts)
+
+
+'''Properties that Event.merge() compares, cf. Event.content_key'''
+Event.COMPARED_PROPERTIES = [p for p in Event.PROPERTIES
+                             if p not in Event.UNDIFFABLE_PROPERTIES + Event.OPAQUE_PROPERTIES]
+_NUM_COMPARED = len(Event.COMPARED_PROPERTIES)
+_COMPARED_TYPES = tuple(Event.PROPERTIES[p][0] for p in Event.COMPARED_PROPERTIES)
+_KEY_FUNCTIONS = tuple(_key_function(proptype) for proptype in _COMPARED_TYPES)
+_get_compared = operator.attrgetter(*Event.COMPARED_PROPERTIES)
+
+# Slots that are not pickled (cf. Event.__getstate__())
+_UNPICKLED = frozenset(Event.OPAQUE_PROPERTIES)
+
+@functools.cache
+def _all_slots(cls) -> tuple[str]:
+    return tuple(slot for c in cls.__mro__ for slot in getattr(c, '__slots__', ()))
+
+# (property, default, constructor for fresh default or None): mutable defaults must not be shared
+_PROPERTY_DEFAULTS = tuple((p, default, type(default) if isinstance(default, list) else None)
+                           for p, (_, default) in Event.PROPERTIES.items())
+
 
 class ProxyEvent(Event):
     '''Answer queries from base event, any changes are local'''
+
+    __slots__ = ('_base', '_seq_nr', '_overrides', '_conflict_event')
+
     def __init__(self, base_event, seq_nr, conflict_event=None, **overrides):
         super().__init__(base_event.event_id, seq_nr)
         self._base = base_event
@@ -359,67 +739,68 @@ class ProxyEvent(Event):
 
     def __setattr__(self, attrname, v):
         if attrname[0] == '_':
-            return super().__setattr__(attrname, v)
+            return object.__setattr__(self, attrname, v)
 
         if attrname in Event.PROPERTIES.keys():
             self._overrides[attrname] = v
         else:
             raise Exception('Invalid field: {attrname}')
 
+    def __getstate__(self):
+        slots, state = super().__getstate__()
+        state['_overrides'] = {k : v for k, v in self._overrides.items() if k not in _UNPICKLED}
+        return (slots, state)
 
-class EventRepeater(Event):
-    '''An event generator '''
+    def _with_updates(self, conflict_event, updates) -> ProxyEvent:
+        if self._conflict_event is not None:
+            return super()._with_updates(conflict_event, updates)
+        # Avoid chains of proxies when merging repeatedly
+        return ProxyEvent(self._base, self.sequence_nr, conflict_event=conflict_event,
+                          **{**self._overrides, **updates})
 
-    def __init__(self, event_id : str, name : str, start):
-        super().__init__(event_id, None)
-        self.name = name
-        self.description = ''
-        self.location = ''
-        self.status = EVENT_STATUS_MAPPING[None]
-        self.attendees = []
+
+class Occurrence(Event):
+    '''
+    A single occurrence of a (recurring) base event.  Only start and end are stored locally; all other
+    PROPERTIES are read-only and read straight from the base event.
+    '''
+
+    __slots__ = ('_base', 'start', 'end')
+
+    def __init__(self, base_event, seq_nr, start, end):
+        self._base = base_event
+        self._event_id = base_event.event_id
+        self._sequence_nr = seq_nr
         self.start = start
-        self.end = None
-        self.recurrences = []
-        self.exceptions = []
-        self.last_modified_remote = None
-        self.organizer = None
-        self.evo_event = None
-        self.debuginfo = []
+        self.end = end
 
     @property
     def base_event(self):
-        return self
-
-    def in_interval(self, start : Optional[CalTime], end : CalTime) -> Generator[Event]:
-        '''All events that intersect with this interval. 'start' may be None.'''
+        return self._base
 
-        if start is None:
-            start = self.start
+# Flyweight accessors: attrgetter avoids the Python-level __getattr__ fallback that ProxyEvent needs
+for _prop in Event.PROPERTIES:
+    if _prop not in Occurrence.__slots__:
+        setattr(Occurrence, _prop, property(operator.attrgetter('_base.' + _prop)))
+del _prop
 
-        seq_nr = 0
-        ev_start = self.start
-        ev_end = self.end
-        repeater = None
 
-        if self.recurrences == []:
-            seq_nr += 1
-            if ev_end >= start:
-                yield ProxyEvent(self, seq_nr, start=ev_start, end=ev_end)
+class EventRepeater(Event):
+    '''An event generator '''
 
-        else:
-            for rec in self.recurrences:
-                ev_end_it = rec.range_from(self.end).starting(ev_end)
-                for ev_start in rec.range_from(self.start).starting(ev_start):
-                    ev_end = ev_end_it.__next__()
-                    if ev_end is None:
-                        break
+    __slots__ = Event.property_slots('description_remote')
 
-                    if ev_start > end:
-                        return None # Passed the specified range
+    def __init__(self, event_id : str, name : str, start):
+        super().__init__(event_id, None)
+        self.init_properties()
+        self.name = name
+        self.start = start
+        self.status = EVENT_STATUS_MAPPING[None]
+        self.description_remote = ''
 
-                    seq_nr += 1
-                    if ev_end >= start:
-                        yield ProxyEvent(self, seq_nr, start=ev_start, end=ev_end)
+    @property
+    def base_event(self):
+        return self
 
     def __str__(self):
         return f'{self.status} {self.name} at: {self.start}'
@@ -427,9 +808,12 @@ class EventRepeater(Event):
 
 class CalEvent(Event):
     '''A calendar event that may contain one or more event occurrences'''
+
+    __slots__ = Event.property_slots()
+
     def __init__(self, uid : str):
         super().__init__(uid, None)
-        self.populate_properties()
+        self.init_properties()
 
 
 # ----------------------------------------
@@ -439,11 +823,18 @@ class MergingDict(collections.OrderedDict):
     def __init__(self):
         super().__init__()
 
-    def merge(self, other) -> MergingDict:
+    def merge(self, other, base=None) -> MergingDict:
+        '''
+        Merges values with equal keys.  'base' optionally maps keys to the common ancestor information
+        of the values to merge (cf. Event.merge()).
+        '''
         result = self.__class__()
         for k, v in self.items():
             if k in other:
-                v = v.merge(other[k])
+                if base is None:
+                    v = v.merge(other[k])
+                else:
+                    v = v.merge(other[k], base=base.get(k))
             result[k] = v
         for k, v in other.items():
             if k not in self:
@@ -456,13 +847,115 @@ class EventSet(MergingDict):
     '''A set of calendar events, indexed by their event IDs'''
     def __init__(self):
         super().__init__()
+        self._index = None
+        self._table = None
+        # event ID -> keys of detached instances whose recurring event we have not seen yet
+        self._orphans = {}
 
     def add(self, event):
-        if event.event_id in self:
-            self[event.event_id].merge(event)
+        '''
+        Adds an event.  Detached instances are attached to their recurring event, if present (or once it is
+        added).  Adding an event whose key is already present merges the two, unless that would conflict
+        (then the event that was added first wins).
+        '''
+        key = event.key
+        if key != event.event_id:
+            if event.event_id in self:
+                self._attach(event.event_id, event)
+                return
+            self._orphans.setdefault(event.event_id, []).append(key)
+
+        if key in self:
+            merged = self[key].merge(event, explain_conflicts=False, remote=False)
+            if merged.get_conflict_event() is None:
+                self[key] = merged
+        else:
+            self[key] = event
+
+        for orphan_key in self._orphans.pop(key, ()):
+            if orphan_key in self:
+                self._attach(key, self[orphan_key])
+                del self[orphan_key]
+
+    def _attach(self, key, instance):
+        '''Attaches a detached instance to the recurring event at 'key' '''
+        series = self[key]
+        rkey = recurrence_key(instance.recurrence_id)
+        detached = dict(series.detached_instances or {})
+        if rkey in detached:
+            merged = detached[rkey].merge(instance, explain_conflicts=False, remote=False)
+            if merged.get_conflict_event() is None:
+                detached[rkey] = merged
         else:
-            self[event.event_id] = event
+            detached[rkey] = instance
+        series.detached_instances = detached
+        self._changed(key)
+
+    def merge(self, other, base=None) -> EventSet:
+        result = super().merge(other, base=base)
+        # Detached instances whose recurring event only one side knew
+        for key in [k for k in result if type(k) is tuple and k[0] in result]:
+            instance = result[key]
+            del result[key]
+            result._attach(key[0], instance)
+        return result
+
+    def __setitem__(self, key, event):
+        super().__setitem__(key, event)
+        self._changed(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._table = None
+        if self._index is not None:
+            self._index.remove(key)
+
+    def _changed(self, key):
+        '''The event at 'key' is new or has changed: the table is rebuilt on demand, the index updated now'''
+        self._table = None
+        if self._index is not None:
+            self._index.add(key, *self[key].time_bounds())
+
+    def __getstate__(self):
+        # The table and index are cheaper to rebuild than to pickle
+        return {**vars(self), '_index' : None, '_table' : None}
+
+    @property
+    def table(self) -> event_table.EventTable:
+        '''EventTable over all events, in order (rebuilt on demand after changes)'''
+        if self._table is None:
+            self._table = event_table.EventTable(self.values())
+        return self._table
+
+    @property
+    def index(self) -> IntervalIndex:
+        '''Index over the time bounds of all events; built from the table on demand, then kept up to date'''
+        if self._index is None:
+            table = self.table
+            self._index = IntervalIndex(zip(self.keys(), table.start.tolist(), table.last_end.tolist()))
+        return self._index
+
+    def overlapping(self, start : CalTime, end : Optional[CalTime]) -> list[Event]:
+        '''All events that may have occurrences in [start, end] (end=None: unbounded), ordered by their first start'''
+        return [self[key] for key in self.index.overlapping(start.timestamp(),
+                                                            math.inf if end is None else end.timestamp())]
+
+    def in_interval(self, start : CalTime, end : Optional[CalTime]) -> Generator[Event]:
+        '''All occurrences of all events that intersect with [start, end], grouped by event'''
+        for event in self.overlapping(start, end):
+            yield from event.in_interval(start, end)
+
+    def chronological(self, start : CalTime, end : Optional[CalTime]=None) -> Generator[Event]:
+        '''
+        All occurrences of all events that intersect with [start, end], in chronological order.
+        Lazy: only holds one pending occurrence per event, and stops expanding at 'end' (if any).
+        '''
+        return heapq.merge(*(event.in_interval(start, end) for event in self.overlapping(start, end)),
+                           key=_occurrence_start)
 
 
+_occurrence_start = operator.attrgetter('start')
 
 
+# Imported last: event_table itself builds on this module
+import event_table
@@ -0,0 +1,180 @@
+# This file is Copyright (C) 2022 Christoph Reichenbach
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the
+#   Free Software Foundation, Inc.
+#   59 Temple Place, Suite 330
+#   Boston, MA  02111-1307
+#   USA
+#
+# The author can be reached as "creichen" at the usual gmail server.
+
+from __future__ import annotations
+
+import itertools
+from array import array
+from typing import Iterable
+
+from caltime import CalTime
+from event import Event, EventState, MergingDict
+
+try:
+    import numpy
+except ImportError:
+    # Optional: without numpy, columns are arrays and masks are lists of booleans
+    numpy = None
+
+
+class StringColumn:
+    '''Interned string column: one integer code per row, plus the list of distinct strings'''
+
+    def __init__(self, values : Iterable[str]):
+        codes = {}
+        self.strings = []
+        def code(s):
+            c = codes.get(s)
+            if c is None:
+                c = codes[s] = len(self.strings)
+                self.strings.append(s)
+            return c
+        self.codes = _column('i', [code(s) for s in values])
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row : int) -> str:
+        return self.strings[self.codes[row]]
+
+
+def _column(typecode : str, values : list):
+    if numpy is None:
+        return array(typecode, values)
+    return numpy.array(values, dtype=_NUMPY_TYPES[typecode])
+
+_NUMPY_TYPES = {
+    'd' : 'float64',
+    'i' : 'int32',
+    'b' : 'int8',
+}
+
+
+def is_active_after(event : Event, caltime : CalTime) -> bool:
+    '''Does the event have an occurrence that ends after 'caltime'?  (EventTable.active_after() for one event)'''
+    if event.recurrences or event.detached_instances:
+        return event.time_bounds()[1] > caltime.timestamp()
+    return (event.start if event.end is None else event.end).timestamp() > caltime.timestamp()
+
+
+class EventTable:
+    '''
+    Columnar (struct-of-arrays) snapshot of a number of events, for bulk filtering, sorting and statistics.
+    Masks are numpy boolean arrays if numpy is available and lists of booleans otherwise; either way, they
+    can be passed to select().
+
+    Columns (one row per event, in the order of the events):
+    - start, end: POSIX timestamps of the (first) start and end (end is start if there is none)
+    - last_end: POSIX timestamp of the last end over all occurrences (math.inf if unbounded)
+    - status: EventState codes
+    - calendar: index of the calendar that the event came from
+    - recurring: 1 for recurring events, 0 otherwise
+    - name, location: StringColumns
+    '''
+
+    def __init__(self, events : Iterable[Event], calendar_indices : Iterable[int]=None):
+        self.events = list(events)
+        if calendar_indices is None:
+            calendar_indices = itertools.repeat(0, len(self.events))
+
+        starts, ends, last_ends = [], [], []
+        for ev in self.events:
+            first_start = ev.start.timestamp()
+            end = first_start if ev.end is None else ev.end.timestamp()
+            if ev.recurrences or ev.detached_instances:
+                first_start, last_end = ev.time_bounds()
+            else:
+                last_end = end
+            starts.append(first_start)
+            ends.append(end)
+            last_ends.append(last_end)
+
+        self.start = _column('d', starts)
+        self.end = _column('d', ends)
+        self.last_end = _column('d', last_ends)
+        self.status = _column('b', [ev.status.code for ev in self.events])
+        self.calendar = _column('i', list(calendar_indices))
+        self.recurring = _column('b', [1 if ev.recurrences else 0 for ev in self.events])
+        self.name = StringColumn(ev.name for ev in self.events)
+        self.location = StringColumn(ev.location or '' for ev in self.events)
+
+    @staticmethod
+    def from_calendars(calendars : MergingDict) -> EventTable:
+        '''Table over the events of all calendars; the 'calendar' column indexes into calendars.values()'''
+        events, indices = [], []
+        for i, cal in enumerate(calendars.values()):
+            events.extend(cal.events.values())
+            indices.extend(itertools.repeat(i, len(cal.events)))
+        return EventTable(events, indices)
+
+    def __len__(self):
+        return len(self.events)
+
+    def active_after(self, caltime : CalTime) -> list[bool]:
+        '''Mask of all events that have an occurrence that ends after 'caltime' '''
+        t = caltime.timestamp()
+        if numpy is not None:
+            return self.last_end > t
+        return [e > t for e in self.last_end]
+
+    def overlapping(self, start : CalTime, end : CalTime) -> list[bool]:
+        '''Mask of all events that may have occurrences in [start, end]'''
+        lo, hi = start.timestamp(), end.timestamp()
+        if numpy is not None:
+            return (self.start <= hi) & (self.last_end >= lo)
+        return [s <= hi and e >= lo for s, e in zip(self.start, self.last_end)]
+
+    def with_status(self, state : EventState) -> list[bool]:
+        '''Mask of all events with the given status'''
+        if numpy is not None:
+            return self.status == state.code
+        return [c == state.code for c in self.status]
+
+    def select(self, mask) -> list[Event]:
+        '''The events for which 'mask' is set, in table order'''
+        if numpy is not None:
+            return [self.events[i] for i in numpy.flatnonzero(mask)]
+        return list(itertools.compress(self.events, mask))
+
+    def by_start(self, mask=None) -> list[Event]:
+        '''The events (optionally only those for which 'mask' is set), ordered by their first start'''
+        if numpy is not None:
+            order = numpy.argsort(self.start, kind='stable')
+            if mask is not None:
+                order = order[numpy.asarray(mask)[order]]
+            return [self.events[i] for i in order]
+        rows = range(len(self.events)) if mask is None else itertools.compress(range(len(self.events)), mask)
+        return [self.events[i] for i in sorted(rows, key=self.start.__getitem__)]
+
+    def status_counts(self, mask=None) -> dict[EventState, int]:
+        '''Number of events per status (optionally only those for which 'mask' is set)'''
+        codes = self.status
+        if numpy is not None:
+            if mask is not None:
+                codes = codes[mask]
+            counts = numpy.bincount(codes, minlength=len(EventState.BY_CODE))
+        else:
+            if mask is not None:
+                codes = itertools.compress(codes, mask)
+            counts = [0] * len(EventState.BY_CODE)
+            for c in codes:
+                counts[c] += 1
+        return {state : int(n) for state, n in zip(EventState.BY_CODE, counts) if n}
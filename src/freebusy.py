@@ -0,0 +1,112 @@
+# This file is Copyright (C) 2022 Christoph Reichenbach
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the
+#   Free Software Foundation, Inc.
+#   59 Temple Place, Suite 330
+#   Boston, MA  02111-1307
+#   USA
+#
+# The author can be reached as "creichen" at the usual gmail server.
+
+from __future__ import annotations
+
+import sys
+from datetime import timedelta
+from typing import Iterable
+
+from caltime import CalTime
+from event import CANCELLED, Event, MergingDict
+import org_events
+
+'''Occurrences at least this long (all-day and multi-day events) do not count as busy'''
+TRANSPARENT_DURATION = timedelta(days=1)
+
+
+def is_busy(occurrence : Event) -> bool:
+    '''Does this occurrence block time?'''
+    duration = occurrence.end - occurrence.start
+    return occurrence.status is not CANCELLED and timedelta(0) < duration < TRANSPARENT_DURATION
+
+
+def sweep(occurrences : Iterable[tuple[object, Event]]) -> tuple[list[tuple[CalTime, CalTime]], list[list]]:
+    '''
+    Single sweep over (calendar, occurrence) pairs, which must be ordered by start time (as produced by
+    EventSet.chronological() or org_events.chronological()).
+
+    Returns (busy, overlaps): 'busy' is the list of maximal busy (start, end) intervals, and 'overlaps' the
+    list of groups of (calendar, occurrence) pairs that (transitively) overlap.  Back-to-back occurrences
+    share a busy interval but do not overlap.
+    '''
+    busy = []
+    overlaps = []
+    group = []
+    group_end = None
+
+    for calendar, occ in occurrences:
+        if not is_busy(occ):
+            continue
+        start, end = occ.start, occ.end
+
+        if busy and start <= busy[-1][1]:
+            if end > busy[-1][1]:
+                busy[-1] = (busy[-1][0], end)
+        else:
+            busy.append((start, end))
+
+        if group and start < group_end:
+            group.append((calendar, occ))
+            group_end = max(group_end, end)
+        else:
+            if len(group) > 1:
+                overlaps.append(group)
+            group = [(calendar, occ)]
+            group_end = end
+
+    if len(group) > 1:
+        overlaps.append(group)
+    return busy, overlaps
+
+
+class FreeBusyReport:
+    '''Busy intervals and overlapping occurrences in [start, end], per calendar and over all calendars'''
+
+    def __init__(self, calendars : MergingDict, start : CalTime, end : CalTime):
+        self.start = start
+        self.end = end
+        self.busy, self.overlaps = sweep(org_events.chronological(calendars, start, end))
+        # calendar UID -> (calendar, busy, overlaps)
+        self.per_calendar = {}
+        for cal in calendars.values():
+            busy, overlaps = sweep((cal, occ) for occ in cal.events.chronological(start, end))
+            self.per_calendar[cal.uid] = (cal, busy, overlaps)
+
+    def sections(self) -> list[tuple[str, list, list]]:
+        '''(title, busy, overlaps) over all calendars, then for each calendar'''
+        return ([('All calendars', self.busy, self.overlaps)] +
+                [(cal.name, busy, overlaps) for cal, busy, overlaps in self.per_calendar.values()])
+
+    def clipped(self, interval : tuple[CalTime, CalTime]) -> tuple[CalTime, CalTime]:
+        '''Restricts a busy interval to the report window'''
+        start, end = interval
+        return (max(start, self.start), min(end, self.end))
+
+
+def print_report(report : FreeBusyReport, file=sys.stdout, timezone=None):
+    '''Plain-text report'''
+    for title, busy, overlaps in report.sections():
+        print(f'{title}:', file=file)
+        for interval in busy:
+            print(f'  busy    {org_events.inactive_timespec(*report.clipped(interval), timezone)}', file=file)
+        for group in overlaps:
+            print(f'  overlap {org_events.overlap_str(group, timezone)}', file=file)
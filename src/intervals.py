@@ -0,0 +1,140 @@
+# This file is Copyright (C) 2022 Christoph Reichenbach
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the
+#   Free Software Foundation, Inc.
+#   59 Temple Place, Suite 330
+#   Boston, MA  02111-1307
+#   USA
+#
+# The author can be reached as "creichen" at the usual gmail server.
+
+from __future__ import annotations
+
+import heapq
+import operator
+from typing import Iterable
+
+
+class _StaticIntervals:
+    '''
+    Static interval tree over closed intervals [lo, hi] (numbers, e.g. POSIX timestamps; hi may be math.inf).
+
+    The intervals are kept in arrays sorted by 'lo'; the array is read as an implicit balanced search tree
+    (the middle element of each index range is the root of that range), with 'max_hi' storing the maximum
+    'hi' for each subtree.  Queries take O(log n + k) for k results.
+    '''
+
+    def __init__(self, entries : list[tuple[object, float, float]]):
+        '''entries: (key, lo, hi) triples, sorted by 'lo' '''
+        self.entries = entries
+        self._lo = [lo for _, lo, _ in entries]
+        self._hi = [hi for _, _, hi in entries]
+        self._max_hi = list(self._hi)
+        self._build(0, len(entries))
+
+    def _build(self, left : int, right : int) -> float:
+        '''Computes max_hi for the subtree over [left, right), returns it'''
+        if left >= right:
+            return -float('inf')
+        mid = (left + right) // 2
+        max_hi = max(self._hi[mid], self._build(left, mid), self._build(mid + 1, right))
+        self._max_hi[mid] = max_hi
+        return max_hi
+
+    def __len__(self):
+        return len(self.entries)
+
+    def overlapping(self, lo : float, hi : float) -> list[tuple[object, float, float]]:
+        '''All entries that intersect [lo, hi], ordered by their 'lo' '''
+        result = []
+        self._query(0, len(self.entries), lo, hi, result)
+        return result
+
+    def _query(self, left : int, right : int, lo : float, hi : float, result : list):
+        if left >= right:
+            return
+        mid = (left + right) // 2
+        if self._max_hi[mid] < lo:
+            return # Everything in this subtree ends too early
+        self._query(left, mid, lo, hi, result)
+        if self._lo[mid] > hi:
+            return # This and everything to the right starts too late
+        if self._hi[mid] >= lo:
+            result.append(self.entries[mid])
+        self._query(mid + 1, right, lo, hi, result)
+
+
+_entry_lo = operator.itemgetter(1)
+
+
+class IntervalIndex:
+    '''
+    Interval index over closed intervals [lo, hi] with keys, that can be updated: add() inserts an interval
+    (replacing the key's earlier one, if any) and remove() drops one.
+
+    The intervals live in a few static trees (_StaticIntervals) of decreasing size, each at least twice as
+    large as the next one (the "logarithmic method"): add() puts the interval into a tree of its own and then
+    merges the smallest trees until that holds again, so each interval is merged O(log n) times.  Replaced and
+    removed intervals stay in their tree until the next merge, but no longer count.  Queries ask each of the
+    O(log n) trees, i.e., take O(log^2 n + k) for k results.
+    '''
+
+    def __init__(self, intervals : Iterable[tuple[object, float, float]]):
+        '''intervals: (key, lo, hi) triples'''
+        # key -> its current entry (key, lo, hi); entries in the trees that aren't (any more) are dead
+        self._live = {}
+        for entry in intervals:
+            self._live[entry[0]] = entry
+        self._trees = []
+        self._dead = 0
+        if self._live:
+            self._trees.append(_StaticIntervals(sorted(self._live.values(), key=_entry_lo)))
+
+    def __len__(self):
+        return len(self._live)
+
+    def add(self, key, lo : float, hi : float):
+        '''Inserts an interval for 'key', replacing its earlier one'''
+        if key in self._live:
+            self._dead += 1
+        entry = (key, lo, hi)
+        self._live[key] = entry
+        trees = self._trees
+        trees.append(_StaticIntervals([entry]))
+        while len(trees) > 1 and len(trees[-2]) <= 2 * len(trees[-1]):
+            smaller = trees.pop()
+            trees[-1] = self._merged(trees[-1], smaller)
+
+    def remove(self, key):
+        '''Drops the interval of 'key' (if any)'''
+        if self._live.pop(key, None) is not None:
+            self._dead += 1
+            if self._dead > len(self._live):
+                # Mostly dead: start over
+                self._trees = [self._merged(*self._trees)] if self._trees else []
+
+    def _merged(self, *trees) -> _StaticIntervals:
+        live = self._live
+        entries = [e for tree in trees for e in tree.entries if live.get(e[0]) is e]
+        self._dead -= sum(len(tree) for tree in trees) - len(entries)
+        # Each tree is sorted already, which sorted() takes advantage of
+        return _StaticIntervals(sorted(entries, key=_entry_lo))
+
+    def overlapping(self, lo : float, hi : float) -> list[object]:
+        '''Keys of all intervals that intersect [lo, hi], ordered by their 'lo' '''
+        live = self._live
+        found = [[e for e in tree.overlapping(lo, hi) if live.get(e[0]) is e] for tree in self._trees]
+        if len(found) == 1:
+            return [e[0] for e in found[0]]
+        return [e[0] for e in heapq.merge(*found, key=_entry_lo)]
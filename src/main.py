@@ -32,14 +32,21 @@ from __future__ import annotations
 from __future__ import annotations
 
 import sys
-import io
 import gi
 import sys
+import os
+import re
 import argparse
+from datetime import timedelta
 from caltime import CalTime, CalConverter
 import event
 import org_events
 from event import EventSet, MergingDict
+from archive import Archive
+from dedup import DedupPolicy, deduplicate, deduplicate_stream
+from freebusy import FreeBusyReport, print_report
+from orgwriter import AtomicOrgWriter, FSYNC_POLICIES, FSYNC_POLICY
+from syncstate import SyncState, calendar_digest, stable_digest
 from tzresolve import TZResolver
 
 gi.require_version('EDataServer', '1.2')
@@ -51,6 +58,24 @@ from gi.repository import ECal, Gio
 # Config
 '''Seconds to wait for connection'''
 WAIT_TO_CONNECT_SECS = 5
+'''Number of days (from today) covered by free/busy reports'''
+FREEBUSY_DAYS = 7
+'''Append a free/busy section to the org file?'''
+FREEBUSY_SECTION = False
+'''Policy for events that occur in several calendars (cf. dedup.DedupPolicy); None emits all copies'''
+DEDUP_POLICY = None
+'''Number of processes for merging and rendering calendars in parallel (cf. update_sections())'''
+JOBS = 1
+'''Stream the org file through the merge when updating, instead of loading it (cf. update_streaming())'''
+STREAM_MERGE = False
+'''When to fsync() the org file that we write (cf. orgwriter.FSYNC_POLICIES)'''
+ORG_FSYNC_POLICY = FSYNC_POLICY
+'''Write one org file per calendar into a directory, plus an index (cf. update_directory())'''
+PER_CALENDAR = False
+'''Name of the index file in --per-calendar directories; the synchronisation state is stored next to it'''
+CALENDAR_INDEX = 'index.org'
+'''When updating, move events that ended more than this many days ago into the archive (cf. archive.Archive); None keeps them'''
+ARCHIVE_DAYS = None
 '''sexp filter for events; "#t" finds all events'''
 EVENT_FILTER_SEXP = '#t'
 '''Name that we fill in for events whose name/summary is empty'''
@@ -68,6 +93,7 @@ class EvolutionCalendar:
         self._events = None
         self._uid = evocalendar.get_uid()
         self.cc = None
+        self.links = {}
 
     @property
     def uid(self):
@@ -110,9 +136,9 @@ class EvolutionCalendar:
 
         return self._events
 
-    def merge(self, other):
+    def merge(self, other, base=None):
         oc = org_events.OrgCalendar(self.name, self.uid, self.events)
-        return oc.merge(other)
+        return oc.merge(other, base=base)
 
 
 class EvolutionEvents:
@@ -145,46 +171,383 @@ class EvolutionEvents:
         return self._calendars
 
 
+def deduplicated(calendars : MergingDict) -> MergingDict:
+    '''Removes duplicate events according to DEDUP_POLICY'''
+    if DEDUP_POLICY is None:
+        return calendars
+    return deduplicate(calendars, DedupPolicy(DEDUP_POLICY))
+
+def remote_calendars() -> MergingDict:
+    '''All Evolution calendars, deduplicated'''
+    return deduplicated(EvolutionEvents().calendars)
+
 def fetch(orgfile_name):
     '''Get and write events'''
-    buf = io.StringIO()
-    events = EvolutionEvents()
-    unparser = org_events.OrgEventUnparser(buf)
-    unparser.unparse_all(events.calendars)
+    if PER_CALENDAR:
+        return fetch_directory(orgfile_name)
+    calendars = remote_calendars()
+    with AtomicOrgWriter(orgfile_name, fsync=ORG_FSYNC_POLICY) as output:
+        unparser = org_events.OrgEventUnparser(output)
+        unparser.unparse_all(calendars, jobs=JOBS)
+        if FREEBUSY_SECTION:
+            unparser.unparse_freebusy(freebusy_report(calendars, unparser.today))
 
-    with open(orgfile_name, 'w') as output:
-        output.write(buf.getvalue())
+    SyncState.from_calendars(calendars).save(orgfile_name, fsync=ORG_FSYNC_POLICY)
 
 def update(orgfile_name):
-    '''Get and write events'''
-    buf = io.StringIO()
-    events = EvolutionEvents()
-
+    '''
+    Get and write events.  Calendars whose inputs (their text in the org file, their remote events and
+    synchronisation base, and our settings) are the same as last time, and whose text is still the one
+    that we wrote then, would come out the same: we copy their text instead of parsing and rendering them,
+    only moving it to today's window of recurring event occurrences (cf. OrgEventUnparser.slide_calendar()).
+    '''
+    if PER_CALENDAR:
+        return update_directory(orgfile_name)
+    if STREAM_MERGE:
+        return update_streaming(orgfile_name)
+    with open(orgfile_name, encoding='utf-8') as f:
+        lines = f.readlines()
+    sections = dict(org_events.calendar_sections(lines))
+    windows = dict.fromkeys(sections, org_events.OrgEventParser().emitted_window(lines))
+    sync_state = SyncState.load(orgfile_name)
+    unparser = org_events.OrgEventUnparser(None)
+    texts, _, merged_cals, new_state, windowed = update_sections(sections, sync_state, unparser,
+                                                                 load_archive(orgfile_name), windows)
+
+    with AtomicOrgWriter(orgfile_name, fsync=ORG_FSYNC_POLICY) as output:
+        unparser.f = output
+        unparser.print_header(window=bool(windowed))
+        for text in texts.values():
+            output.write(text)
+        if FREEBUSY_SECTION:
+            unparser.unparse_freebusy(freebusy_report(merged_cals, unparser.today))
+
+    save_sync_state(orgfile_name, new_state, sync_state)
+
+def load_archive(orgfile_name) -> Archive:
+    '''The archive of the org file if we archive events (cf. ARCHIVE_DAYS), otherwise None'''
+    if ARCHIVE_DAYS is None:
+        return None
+    return Archive.load(orgfile_name, fsync=ORG_FSYNC_POLICY)
+
+def update_sections(sections : dict[str, str], sync_state : SyncState, unparser : org_events.OrgEventUnparser,
+                    archive : Archive=None, windows : dict[str, CalTime]=None):
+    '''
+    Merges the org text of calendars ('sections', by calendar UID, cf. org_events.calendar_sections()) with
+    the remote calendars, as for update().  Returns the text of all calendars (local ones first, in order),
+    the set of calendar UIDs whose text was rendered or moved (rather than copied), the merged calendars if
+    more than their text needs them (the free/busy section or the archive; otherwise none), the new
+    synchronisation state, and the set of calendar UIDs whose text is for today's window of recurring event
+    occurrences (cf. OrgEventUnparser.expands_by_hand()), which the header of their file should record.
+
+    'windows' maps calendar UIDs to the start of the window that their text was written for (cf.
+    OrgEventParser.emitted_window()); unchanged calendars from earlier windows are moved to ours.  Unchanged
+    calendars without occurrences for a window are moved whatever their window.
+
+    With an 'archive', archived events are only merged if they changed remotely, and events that ended
+    ARCHIVE_DAYS before today are moved into the archive (which is saved before we return).
+    '''
+    parse = org_events.OrgEventParser()
+    evo_cals = EvolutionEvents().calendars
+    remote_cals = deduplicated(evo_cals)
+    new_state = SyncState.from_calendars(remote_cals)
+    revived = {}
+    if archive is not None:
+        remote_cals, revived = archive.split_remote(remote_cals, sync_state.base)
+
+    context = [unparser.signature(), str(DEDUP_POLICY), str(None if archive is None else ARCHIVE_DAYS)]
+    if archive is not None:
+        # What we archive depends on today
+        context.append(unparser.today.isoformat())
+    if DEDUP_POLICY is not None:
+        # Which calendar keeps an event depends on all calendars
+        context += [calendar_digest(cal) for cal in evo_cals.values()]
+    order = list(sections) + [caluid for caluid in remote_cals if caluid not in sections]
+    def inputs_digest(caluid, text):
+        return stable_digest(*context, calendar_digest(remote_cals[caluid]) if caluid in remote_cals else '',
+                             sync_state.calendar_digest(caluid), text)
+    inputs = {caluid : inputs_digest(caluid, sections.get(caluid, '')) for caluid in order}
+    unchanged = {caluid for caluid, text in sections.items()
+                 if sync_state.layout.get(caluid) == [inputs[caluid], stable_digest(text)]}
+    # Texts from earlier windows need moving, texts from later ones (the clock went back?) rendering.  So do
+    # texts with conflicts, which recurring events only have below their first occurrence.  Texts without
+    # occurrences for a window (their remote events decide, as their inputs are the same) only lose the events
+    # that are over, whatever their window.
+    windows = {} if windows is None else windows
+    expanded = {caluid for caluid in unchanged if unparser.expands_by_hand(remote_cals.get(caluid))}
+    slid = {caluid for caluid in unchanged
+            if caluid not in expanded
+            or (windows.get(caluid) is not None and windows[caluid] < unparser.today
+                and org_events.OrgProc.CONFLICT_HEADING not in sections[caluid])}
+    unchanged = {caluid for caluid in unchanged if caluid in slid or windows.get(caluid) == unparser.today}
+    # The free/busy section needs the events of all calendars
+    needed = order if FREEBUSY_SECTION else [caluid for caluid in order if caluid not in unchanged]
+
+    local_cals = MergingDict()
+    for caluid in needed:
+        if caluid in sections:
+            local_cals.update(parse.loads(sections[caluid]))
+    if DEDUP_POLICY is not None:
+        # Also drops copies from org files written without (or with a different) DEDUP_POLICY
+        deduped = MergingDict()
+        for cal, events in deduplicate_stream(((cal, cal.events.values()) for cal in local_cals.values()),
+                                              evo_cals, DedupPolicy(DEDUP_POLICY)):
+            deduped[cal.uid] = org_events.OrgCalendar(cal.name, cal.uid, list(events))
+        local_cals = deduped
+    for caluid, events in revived.items():
+        # Archived copies of events that changed remotely
+        if caluid not in local_cals:
+            local_cals[caluid] = org_events.OrgCalendar(remote_cals[caluid].name, caluid, [])
+        for ev in events:
+            local_cals[caluid].events.add(ev)
+    remote_needed = MergingDict()
+    for caluid in needed:
+        if caluid in remote_cals:
+            remote_needed[caluid] = remote_cals[caluid]
+
+    # Three-way merge against the remote state from the last run, if we have it
+    changed = [caluid for caluid in order if caluid not in unchanged]
+    if archive is None and not FREEBUSY_SECTION:
+        # Only the texts need the merged events: merge and render each calendar in the same (worker) process
+        merged_cals = MergingDict()
+        results = org_events.merge_and_render_calendars(unparser, local_cals, remote_needed, changed, sync_state,
+                                                        jobs=JOBS)
+        rendered = {caluid : text for caluid, (text, _) in zip(changed, results)}
+        expanding = {caluid for caluid, (_, expands) in zip(changed, results) if expands}
+    else:
+        merged_cals = org_events.merge_calendars(local_cals, remote_needed, sync_state)
+        if archive is not None:
+            cutoff = unparser.today - timedelta(days=ARCHIVE_DAYS)
+            for caluid in changed:
+                merged_cals[caluid] = archive.archive_past(merged_cals[caluid], cutoff)
+            # Before the org file loses the events
+            archive.save()
+        rendered = dict(zip(changed, org_events.render_calendars(unparser,
+                                                                 [merged_cals[caluid] for caluid in changed],
+                                                                 jobs=JOBS)))
+        expanding = {caluid for caluid in changed if unparser.expands_by_hand(merged_cals[caluid])}
+
+    texts = {}
+    for caluid in order:
+        if caluid in slid:
+            texts[caluid] = unparser.slide_calendar(sections[caluid], remote_cals.get(caluid),
+                                                    windows[caluid] if caluid in expanded else None)
+            # Next time, the moved text is what comes out the same
+            inputs[caluid] = inputs_digest(caluid, texts[caluid])
+        else:
+            texts[caluid] = sections[caluid] if caluid in unchanged else rendered[caluid]
+        new_state.layout[caluid] = [inputs[caluid], stable_digest(texts[caluid])]
+    return texts, set(changed) | slid, merged_cals, new_state, (expanded & unchanged) | expanding
+
+def calendar_file_name(caluid : str) -> str:
+    '''File name for a calendar in --per-calendar directories: the calendar UID, if that makes a safe name'''
+    safe = re.sub(r'[^A-Za-z0-9@._-]', '_', caluid).lstrip('.')
+    if safe != caluid:
+        safe += '-' + stable_digest(caluid)[:8] # keep names apart that only differ in unsafe characters
+    return safe + '.org'
+
+def load_directory(dirname) -> tuple[dict[str, str], dict[str, str], dict[str, CalTime]]:
+    '''
+    The calendar files listed in the index of a --per-calendar directory: maps from calendar UIDs to their
+    text (cf. org_events.calendar_sections()), to their file names and to the windows that their files were
+    written for (cf. update_sections()).  A missing index means no calendars.
+    '''
+    parse = org_events.OrgEventParser()
+    try:
+        files = parse.load_index(os.path.join(dirname, CALENDAR_INDEX))
+    except FileNotFoundError:
+        return {}, {}, {}
+    sections, windows = {}, {}
+    for caluid, filename in files.items():
+        try:
+            with open(os.path.join(dirname, filename), encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            perr(f'Calendar file "{filename}" is missing, writing it again')
+            continue
+        file_sections = dict(org_events.calendar_sections(lines))
+        sections.update(file_sections)
+        windows.update(dict.fromkeys(file_sections, parse.emitted_window(lines)))
+    return sections, files, windows
+
+def write_directory(dirname, texts : dict[str, str], changed : set[str], merged_cals : MergingDict,
+                    old_files : dict[str, str], unparser : org_events.OrgEventUnparser, windowed : set[str]):
+    '''
+    Writes the calendar files (cf. update_sections()) and the index of a --per-calendar directory.  Only
+    calendars in 'changed' are written, with today's window in the header only if they are 'windowed'; the
+    writer leaves files alone if their text is the same anyway.
+    Files that we named (cf. calendar_file_name()) for calendars that are no longer listed are removed.
+    '''
+    files = {caluid : old_files.get(caluid) or calendar_file_name(caluid) for caluid in texts}
+    for caluid, text in texts.items():
+        if caluid not in changed:
+            continue
+        with AtomicOrgWriter(os.path.join(dirname, files[caluid]), fsync=ORG_FSYNC_POLICY) as output:
+            unparser.f = output
+            unparser.print_header(window=caluid in windowed)
+            output.write(text)
+
+    with AtomicOrgWriter(os.path.join(dirname, CALENDAR_INDEX), fsync=ORG_FSYNC_POLICY) as output:
+        unparser.f = output
+        # Calendar names from their headings (cf. OrgEventUnparser.unparse_calendar_heading())
+        unparser.unparse_index((text.partition('\n')[0][2:], caluid, files[caluid]) for caluid, text in texts.items())
+        if FREEBUSY_SECTION:
+            unparser.unparse_freebusy(freebusy_report(merged_cals, unparser.today))
+
+    for caluid, filename in old_files.items():
+        if caluid not in texts and filename == calendar_file_name(caluid):
+            try:
+                os.remove(os.path.join(dirname, filename))
+            except FileNotFoundError:
+                pass
+
+def fetch_directory(dirname):
+    '''As fetch(), but writes one org file per calendar into 'dirname' (cf. update_directory())'''
+    os.makedirs(dirname, exist_ok=True)
+    _, old_files, _ = load_directory(dirname)
+    index = os.path.join(dirname, CALENDAR_INDEX)
+    unparser = org_events.OrgEventUnparser(None)
+    texts, changed, merged_cals, new_state, windowed = update_sections({}, SyncState(), unparser)
+    write_directory(dirname, texts, changed, merged_cals, old_files, unparser, windowed)
+    save_sync_state(index, new_state, SyncState.load(index))
+
+def update_directory(dirname):
+    '''
+    As update(), but for a directory with one org file per calendar and an index file (CALENDAR_INDEX) that
+    lists them.  Each calendar file is parsed, merged and rendered on its own (merged and rendered in parallel
+    with JOBS > 1); calendar files whose inputs did not change are neither parsed nor written.
+    '''
+    os.makedirs(dirname, exist_ok=True)
+    sections, old_files, windows = load_directory(dirname)
+    index = os.path.join(dirname, CALENDAR_INDEX)
+    sync_state = SyncState.load(index)
+    unparser = org_events.OrgEventUnparser(None)
+    texts, changed, merged_cals, new_state, windowed = update_sections(sections, sync_state, unparser,
+                                                                       load_archive(index), windows)
+    write_directory(dirname, texts, changed, merged_cals, old_files, unparser, windowed)
+    save_sync_state(index, new_state, sync_state)
+
+def update_streaming(orgfile_name):
+    '''
+    As update(), but streams the org file through the merge (cf. org_events.merge_calendar_streams()) and
+    writes each merged event right away, so that we never hold all local or merged events.  Output is sorted
+    by event UID; org files that are not (e.g., written by fetch()) are loaded in full one last time.
+
+    Unlike update(), this renders every calendar again (rather than copying or sliding unchanged ones) and
+    does not archive; main() rejects --archive and --per-calendar with --stream.
+    '''
+    evo_cals = EvolutionEvents().calendars
+    remote_cals = deduplicated(evo_cals)
+    sync_state = SyncState.load(orgfile_name)
     parse = org_events.OrgEventParser()
-    local_cals = parse.load(orgfile_name)
-    remote_cals = events.calendars
-
-    merged_cals = local_cals.merge(remote_cals)
-
-    unparser = org_events.OrgEventUnparser(buf)
-    unparser.unparse_all(merged_cals)
 
-    with open(orgfile_name, 'w') as output:
-        output.write(buf.getvalue())
+    def write(local):
+        if DEDUP_POLICY is not None:
+            local = deduplicate_stream(local, evo_cals, DedupPolicy(DEDUP_POLICY))
+        with AtomicOrgWriter(orgfile_name, fsync=ORG_FSYNC_POLICY) as output:
+            unparser = org_events.OrgEventUnparser(output)
+            streams = org_events.merge_calendar_streams(local, remote_cals, sync_state)
+            window = MergingDict()
+            if FREEBUSY_SECTION:
+                streams = collect_window(streams, unparser.today, unparser.today + timedelta(days=FREEBUSY_DAYS),
+                                         window)
+            unparser.unparse_all_streams(streams)
+            if FREEBUSY_SECTION:
+                unparser.unparse_freebusy(freebusy_report(window, unparser.today))
+
+    try:
+        write(parse.stream(orgfile_name))
+    except org_events.UnsortedStream as e:
+        perr(f'"{orgfile_name}" is not sorted by event UID ({e}), loading it in full')
+        write(org_events.calendar_streams(parse.load(orgfile_name)))
+
+    save_sync_state(orgfile_name, SyncState.from_calendars(remote_cals), sync_state)
+
+def save_sync_state(orgfile_name, sync_state : SyncState, previous : SyncState):
+    '''Saves the new synchronisation state, unless it is the same as before (to leave its file alone, too)'''
+    if sync_state != previous:
+        sync_state.save(orgfile_name, fsync=ORG_FSYNC_POLICY)
+
+def collect_window(streams, start : CalTime, end : CalTime, window : MergingDict):
+    '''Passes (calendar, events) pairs through, copying the events that intersect [start, end] into 'window' '''
+    def collecting(events, into):
+        for ev in events:
+            if next(ev.in_interval(start, end), None) is not None:
+                into[ev.key] = ev
+            yield ev
+
+    for cal, events in streams:
+        window[cal.uid] = org_events.OrgCalendar(cal.name, cal.uid, [])
+        yield cal, collecting(events, window[cal.uid].events)
+
+def freebusy_report(calendars, today : CalTime) -> FreeBusyReport:
+    return FreeBusyReport(calendars, today, today + timedelta(days=FREEBUSY_DAYS))
+
+def freebusy(orgfile_name):
+    '''Print busy times and overlapping events across all Evolution calendars'''
+    unparser = org_events.OrgEventUnparser(sys.stdout)
+    print_report(freebusy_report(remote_calendars(), unparser.today), timezone=unparser.local_timezone)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Synchronise running Evolution server with Emacs org-agenda file (read-only, for now)')
-    parser.add_argument('orgfile', metavar='ORGFILE', type=str, help='Org file to write to or synchronise with')
+    parser.add_argument('orgfile', metavar='ORGFILE', type=str, nargs='?',
+                        help='Org file to write to or synchronise with (not needed for --freebusy)')
     parser.add_argument('--fetch', '-F', action='store_const', dest='activity', const=fetch, default=fetch,
                         help='Load from Evolution and overwrite org file (default)')
     parser.add_argument('--update', '-U', action='store_const', dest='activity', const=update, default=fetch,
                         help='Load from Evolution and merge with existing org file (experimental)')
+    parser.add_argument('--freebusy', '-B', action='store_const', dest='activity', const=freebusy, default=fetch,
+                        help='Load from Evolution and report busy times and overlapping events')
+    parser.add_argument('--days', type=int, metavar='DAYS', dest='conf_FREEBUSY_DAYS', default=FREEBUSY_DAYS,
+                        help=f'Number of days covered by free/busy reports (default: {FREEBUSY_DAYS})')
+    parser.add_argument('--freebusy-section', action='store_const', dest='conf_FREEBUSY_SECTION', const=True,
+                        default=False, help='Append a free/busy section to the org file')
+    parser.add_argument('--dedup', metavar='POLICY', dest='conf_DEDUP_POLICY', default=DEDUP_POLICY,
+                        help='Emit events that occur in several calendars only once: "first" (first calendar wins), '
+                        '"prefer:CALUID[,CALUID...]" (listed calendars win) or "link" (first calendar wins, '
+                        'but lists the other calendars)')
+    parser.add_argument('--jobs', '-j', type=int, metavar='N', dest='conf_JOBS', default=JOBS,
+                        help=f'Merge and render up to N calendars in parallel (default: {JOBS})')
+    parser.add_argument('--stream', action='store_const', dest='conf_STREAM_MERGE', const=True, default=False,
+                        help='Stream the org file through the merge when updating, to bound memory use '
+                        '(writes events sorted by UID and renders every calendar again; ignores --jobs, and cannot '
+                        'be combined with --per-calendar or --archive)')
+    parser.add_argument('--per-calendar', action='store_const', dest='conf_PER_CALENDAR', const=True, default=False,
+                        help=f'Treat ORGFILE as a directory and write one org file per calendar into it, plus an '
+                        f'index ({CALENDAR_INDEX})')
+    parser.add_argument('--archive', type=int, metavar='DAYS', dest='conf_ARCHIVE_DAYS', default=ARCHIVE_DAYS,
+                        help='When updating, move events that ended more than DAYS days ago out of the org file into '
+                        'monthly archive files (in ORGFILE_archive)')
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, dest='conf_ORG_FSYNC_POLICY', default=ORG_FSYNC_POLICY,
+                        help='Before replacing the org file, sync nothing, the new file, or the new file and its '
+                        f'directory to disk (default: {ORG_FSYNC_POLICY})')
     parser.add_argument('--debug', action='store_const', dest='conf_EMIT_DEBUG', const=True, default=False,
                         help='Enable debug output (may not produce well-formed org files)')
 
     args = parser.parse_args()
     EMIT_DEBUG=args.conf_EMIT_DEBUG
+    FREEBUSY_DAYS=args.conf_FREEBUSY_DAYS
+    FREEBUSY_SECTION=args.conf_FREEBUSY_SECTION
+    DEDUP_POLICY=args.conf_DEDUP_POLICY
+    # More worker processes than CPUs would only take turns
+    JOBS=min(args.conf_JOBS, os.cpu_count() or 1)
+    STREAM_MERGE=args.conf_STREAM_MERGE
+    ORG_FSYNC_POLICY=args.conf_ORG_FSYNC_POLICY
+    PER_CALENDAR=args.conf_PER_CALENDAR
+    ARCHIVE_DAYS=args.conf_ARCHIVE_DAYS
+    if DEDUP_POLICY is not None:
+        try:
+            DedupPolicy(DEDUP_POLICY)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.orgfile is None and args.activity is not freebusy:
+        parser.error('ORGFILE is required')
+    if STREAM_MERGE:
+        # update_streaming() neither splits files by calendar nor archives
+        for option, incompatible in [('--per-calendar', PER_CALENDAR), ('--archive', ARCHIVE_DAYS is not None)]:
+            if incompatible:
+                parser.error(f'--stream cannot be combined with {option}')
 
     args.activity(orgfile_name=args.orgfile)
 
@@ -23,16 +23,24 @@ from __future__ import annotations
 
 import sys
 import io
+import heapq
+import itertools
+import re
+import concurrent.futures
+import multiprocessing
+import os
 import gi
 import sys
 import orgparse
 import argparse
 from caltime import CalTime, CalConverter
 import event
-from event import EventSet, MergingDict
+from event import Event, EventSet, MergingDict, recurrence_key
+from event_table import is_active_after
 from tzresolve import TZResolver
 from zoneinfo import ZoneInfo
 from datetime import timedelta, datetime
+from typing import Generator, Iterable
 
 EMPTY_EVENT_NAME = event.EMPTY_EVENT_NAME
 '''Use org-agenda repetition ("+1w" etc.) to avoid duplicating events, if possible'''
@@ -43,6 +51,8 @@ RECURRENCE_EMIT_FUTURE_DAYS = 7
 LOCAL_TIMEZONE=None # UTC
 '''Include one-time events earlier than today'''
 PAST_EVENTS=False
+'''Write at most this many levels of conflicts (conflicts of conflicts etc.) below an event'''
+MAX_CONFLICT_DEPTH=1
 '''Header for output file'''
 OUTPUT_HEADER='#+STARTUP: content\n#+FILETAGS: :@calendar:\n'
 
@@ -51,6 +61,8 @@ EMIT_DEBUG=event.EMIT_DEBUG
 
 TODOS=[event.TODO_STR, 'WAITING']
 DONES=[event.DONE_STR, event.CANCELLED_STR]
+for _keyword in TODOS + DONES:
+    event.EventState.register(_keyword)
 
 
 def perr(*args, **kwargs):
@@ -66,6 +78,12 @@ class OrgProc:
     TZID = 'CONVERTED-FROM-TZID'
     FIRST_START = 'FIRST-START'
     FIRST_END = 'FIRST-END'
+    ALSO_IN = 'ALSO-IN'
+    FREEBUSY_WINDOW = 'FREEBUSY-WINDOW' # marks the (generated) free/busy section
+    CALENDAR_FILE = 'CAL-FILE' # file with the calendar's events, in index files
+    RECURRENCE_ID = 'CALEVENT-RECURRENCE-ID'
+    RECURRENCE = 'CALEVENT-RECURRENCE' # rule of a natively repeating event, cf. Recurrence.rrule()
+    EMIT_WINDOW = 'EMIT-WINDOW' # file property: start and length of the window of emitted occurrences
 
     CONFLICT_HEADING = '!CONFLICT!' # extra string added to heading of conflicts
 
@@ -78,6 +96,7 @@ class OrgProc:
                  past_events = PAST_EVENTS,
                  emit_debug = EMIT_DEBUG,
                  today = None,
+                 max_conflict_depth = MAX_CONFLICT_DEPTH,
                  ):
         self.output_header = output_header
         self.empty_event_name = empty_event_name
@@ -86,7 +105,8 @@ class OrgProc:
         self.local_timezone = ZoneInfo('UTC' if local_timezone is None else local_timezone)
         self.past_events = past_events
         self.emit_debug = emit_debug
-        self.today = CalTime.today(local_timezone) if today is None else today.astimezone(local_timezone)
+        self.max_conflict_depth = max_conflict_depth
+        self.today = CalTime.today(self.local_timezone) if today is None else self.in_local_timezone(today)
         self._tzresolver = None
         self._cconv = None
 
@@ -106,10 +126,23 @@ class OrgProc:
             perr(f'Failed to resolve timezone "{tzname}"')
             return None
 
-    def parse_datetime(self, spec : str) -> CalTime:
+    @property
+    def cconv(self) -> CalConverter:
         if self._cconv is None:
             self._cconv = CalConverter(self.tzresolver)
-        return self._cconv.time_from_str(spec)
+        return self._cconv
+
+    def in_local_timezone(self, t : CalTime) -> CalTime:
+        '''Converts 't' to local_timezone; times without a zone are taken to be in local_timezone already'''
+        if t.tzinfo is None:
+            return t.replace(tzinfo=self.local_timezone)
+        return t.astimezone(self.local_timezone)
+
+    def parse_datetime(self, spec : str) -> CalTime:
+        '''Parses a time property; times without a zone are in local_timezone (cf. OrgEventUnparser.format_event())'''
+        if '/' in spec:
+            return self.cconv.time_from_str(spec)
+        return CalTime.from_str(spec, tzinfo=self.local_timezone)
 
 
 class OrgEventUnparser(OrgProc):
@@ -119,17 +152,35 @@ class OrgEventUnparser(OrgProc):
         super().__init__(**kwargs)
         self.f = file
 
-    def print_header(self):
+    def signature(self) -> str:
+        '''Everything besides the calendars themselves that our output depends on'''
+        return repr((self.output_header, self.empty_event_name, self.org_agenda_native_recurrence_allowed,
+                     self.recurrence_emit_future_days, str(self.local_timezone), self.past_events, self.emit_debug,
+                     self.max_conflict_depth))
+
+    def print_header(self, window=True):
+        '''
+        With 'window', the header records the window (from today) that we emit the occurrences of recurring
+        events for, which only matters for calendars that we expand recurring events of by hand (cf.
+        expands_by_hand()); the output also depends on today otherwise, cf. slide_calendar().
+        '''
+        if window:
+            self.pr(f'#+PROPERTY: {OrgProc.EMIT_WINDOW} {self.today.isoformat()} +{self.recurrence_emit_future_days}d')
         if self.output_header:
             self.pr(self.output_header)
 
     def pr(self, *args):
-        print(*args, file=self.f)
-
-    def unparse_all(self, caldict : MergingDict):
-        self.print_header()
-        for cal in caldict.values():
-            self.unparse_calendar(cal)
+        self.f.write(' '.join(map(str, args)) + '\n')
+
+    def unparse_all(self, caldict : MergingDict, jobs : int=1):
+        '''Writes all calendars; with jobs > 1, they are rendered in parallel (cf. render_calendars())'''
+        self.print_header(window=any(self.expands_by_hand(cal) for cal in caldict.values()))
+        if jobs <= 1:
+            for cal in caldict.values():
+                self.unparse_calendar(cal)
+        else:
+            for text in render_calendars(self, list(caldict.values()), jobs=jobs):
+                self.f.write(text)
 
     def unparse_timespec_recurrence(self, recurrence, start, end):
         start = start.astimezone(self.local_timezone)
@@ -148,95 +199,361 @@ class OrgEventUnparser(OrgProc):
 
         return f'{start.timespec(recurrence)}--{end.timespec(recurrence)}'
 
-    def unparse_event(self, event, recur_spec=None, start=None, end=None, depth='**', conflict_marker=None):
+    # Fixed parts of event blocks, cf. format_event()
+    _SCHEDULED = f'  {OrgProc.SCHEDULED}: '
+    _PROPERTIES_START = f'  :{OrgProc.PROPERTIES}:'
+    _LOCATION = f'  :{OrgProc.LOCATION}: '
+    _ATTENDEES = f'  :{OrgProc.ATTENDEES}: '
+    _EVENT_UID = f'  :{OrgProc.EVENT_UID}: '
+    _ALSO_IN = f'  :{OrgProc.ALSO_IN}: '
+    _TZID = f'  :{OrgProc.TZID}: '
+    _RECURRENCE_ID = f'  :{OrgProc.RECURRENCE_ID}: '
+    _FIRST_START = f'  :{OrgProc.FIRST_START}: '
+    _FIRST_END = f'  :{OrgProc.FIRST_END}: '
+    _RECURRENCE = f'  :{OrgProc.RECURRENCE}: '
+    _PROPERTIES_END = '  :END:'
+
+    def unparse_event(self, event, recur_spec=None, start=None, end=None, depth='**', conflict_marker=None,
+                      also_in=None, rrule=None, also_at=None, shown_conflicts=None):
+        self.f.write(self.format_event(event, recur_spec, start, end, depth, conflict_marker, also_in, rrule, also_at,
+                                       shown_conflicts))
+
+    def format_event(self, event, recur_spec=None, start=None, end=None, depth='**', conflict_marker=None,
+                     also_in=None, rrule=None, also_at=None, shown_conflicts=None) -> str:
+        '''
+        The org block for one event (including its conflicts), built with a single join.  With 'recur_spec',
+        the event repeats natively, following the rule 'rrule' (cf. native_repetition()); 'also_at' then lists
+        the starts of further timestamps that repeat in the same way.
+
+        'shown_conflicts' optionally is a set of the content keys of conflicts that were written already (e.g., for
+        an earlier occurrence of the same event); we then only write the conflicts if they are new.
+        '''
         if start is None:
             start = event.start
         if end is None:
             end = event.end
 
         conflict = '' if conflict_marker is None else f'{conflict_marker} '
-
-        self.pr(f'{depth} {event.status} {conflict}{event.name}')
-        timespec = self.unparse_timespec_recurrence(recur_spec, start, end)
-        self.pr(f'  {OrgProc.SCHEDULED}: {timespec}')
-
-        self.pr(f'  :{OrgProc.PROPERTIES}:')
-        if event.location:
-            self.pr(f'  :{OrgProc.LOCATION}: ' + event.location)
-        if event.attendees:
-            self.pr(f'  :{OrgProc.ATTENDEES}: ' + ' '.join(event.attendees))
-        self.pr(f'  :{OrgProc.EVENT_UID}: {event.event_id}')
+        lines = [f'{depth} {event.status} {conflict}{event.name}',
+                 self._SCHEDULED + self.unparse_timespec_recurrence(recur_spec, start, end),
+                 self._PROPERTIES_START]
+
+        location = event.location
+        if location:
+            lines.append(self._LOCATION + location)
+        attendees = event.attendees
+        if attendees:
+            lines.append(self._ATTENDEES + ' '.join(attendees))
+        lines.append(f'{self._EVENT_UID}{event.event_id}')
+        if also_in:
+            lines.append(self._ALSO_IN + ', '.join(also_in))
         if start.tzinfo and start.tzinfo != self.local_timezone:
-            self.pr(f'  :{OrgProc.TZID}: {start.tzinfo}')
+            lines.append(f'{self._TZID}{start.tzinfo}')
+
+        recurrence_id = event.recurrence_id
+        if recurrence_id is not None:
+            lines.append(self._RECURRENCE_ID + recurrence_id.astimezone(self.local_timezone).to_str())
 
         if event.recurrences:
-            self.pr(f'  :{OrgProc.FIRST_START}: {event.base_event.start.astimezone(None).to_str()}')
-            if event.base_event.end:
-                self.pr(f'  :{OrgProc.FIRST_END}: {event.base_event.end.astimezone(None).to_str()}')
+            base_event = event.base_event
+            lines.append(self._FIRST_START + base_event.start.astimezone(self.local_timezone).to_str())
+            if base_event.end:
+                lines.append(self._FIRST_END + base_event.end.astimezone(self.local_timezone).to_str())
+        if rrule:
+            lines.append(self._RECURRENCE + rrule)
 
         if self.emit_debug:
-            self.pr(f'  :ORIGINAL-START: {repr(event.start)}')
-            self.pr(f'  :ORIGINAL-END: {repr(event.end)}')
+            lines.append(f'  :ORIGINAL-START: {repr(event.start)}')
+            lines.append(f'  :ORIGINAL-END: {repr(event.end)}')
             sep = ', '
-            self.pr(f'  :ORIGINAL-RECURRENCES: {sep.join(str(e) for e in event.recurrences)}')
+            lines.append(f'  :ORIGINAL-RECURRENCES: {sep.join(str(e) for e in event.recurrences)}')
             for k, v in event.debuginfo:
-                self.pr(f'  :{k}: {v}')
-
-        self.pr('  :END:')
-
-        def prdescription(description):
-            for s in description.split('\n'):
-                if s.startswith('*'):
-                    self.pr(' ', s)
-                else:
-                    self.pr(s)
-
-        self.pr(event.description)
-
-        if event.get_conflict_event():
-            self.unparse_event(event.get_conflict_event(), depth=depth+'*', conflict_marker=OrgProc.CONFLICT_HEADING)
+                lines.append(f'  :{k}: {v}')
+
+        lines.append(self._PROPERTIES_END)
+        if also_at:
+            duration = None if end is None else end - start
+            lines.append('  ' + ' '.join(self.unparse_timespec_recurrence(recur_spec, s, None if end is None else s + duration)
+                                         for s in also_at))
+        lines.append(str(event.description))
+        lines.append('')
+        block = '\n'.join(lines)
+
+        if conflict_marker is not None:
+            return block # Nested conflicts are written by the event that has them
+        conflicts = self.conflicts(event)
+        if conflicts and shown_conflicts is not None:
+            keys = tuple(conflict_event.content_key for conflict_event in conflicts)
+            if keys in shown_conflicts:
+                return block
+            shown_conflicts.add(keys)
+        for level, conflict_event in enumerate(conflicts, 1):
+            block += self.format_event(conflict_event, depth=depth + '*' * level,
+                                       conflict_marker=OrgProc.CONFLICT_HEADING)
+        return block
+
+    def conflicts(self, event) -> list[Event]:
+        '''
+        The chain of conflicts of the event (its conflict event, that one's conflict event etc., cf.
+        Event.get_conflict_event()) that we write, at most max_conflict_depth deep.  Conflicts with the same
+        content (Event.content_key) as the event or a conflict before them add nothing and are left out.
+        '''
+        seen = {event.content_key}
+        result = []
+        conflict_event = event.get_conflict_event()
+        while conflict_event is not None and len(result) < self.max_conflict_depth:
+            key = conflict_event.content_key
+            if key not in seen:
+                seen.add(key)
+                result.append(conflict_event)
+            conflict_event = conflict_event.get_conflict_event()
+        return result
 
 
-    def unparse_calendar(self, calendar : EvolutionCalendar):
-        today = self.today
+    def unparse_freebusy(self, report : FreeBusyReport):
+        '''Section with the busy intervals and overlaps from a freebusy.FreeBusyReport (ignored when parsing)'''
+        tz = self.local_timezone
+        self.pr('* Free/busy')
+        self.pr(f'  :{OrgProc.PROPERTIES}:')
+        self.pr(f'  :{OrgProc.FREEBUSY_WINDOW}: {inactive_timespec(report.start, report.end, tz)}')
+        self.pr('  :END:')
+        for title, busy, overlaps in report.sections():
+            self.pr(f'** {title}')
+            for interval in busy:
+                self.pr(f'- busy: {inactive_timespec(*report.clipped(interval), tz)}')
+            for group in overlaps:
+                self.pr(f'- overlap: {overlap_str(group, tz)}')
+
+    def unparse_index(self, entries : Iterable[tuple[str, str, str]]):
+        '''Index of calendars that are written to separate files, from (name, calendar UID, file name) triples'''
+        self.print_header(window=False)
+        for name, caluid, filename in entries:
+            self.pr(f'* [[file:{filename}][{name}]]')
+            self.pr(f'  :{OrgProc.PROPERTIES}:')
+            self.pr(f'  :{OrgCalendar.CALID}: {caluid}')
+            self.pr(f'  :{OrgProc.CALENDAR_FILE}: {filename}')
+            self.pr('  :END:')
+
+    def unparse_calendar_heading(self, calendar : EvolutionCalendar):
         self.pr(f'* {calendar.name}')
         self.pr(f'  :{OrgProc.PROPERTIES}:')
         self.pr(f'  :{OrgCalendar.CALID}: {calendar.uid}')
         self.pr('  :END:')
-        for event in calendar.events.values():
-            if not event.recurrences:
-                # Only one event, non-recurring
-                #print(event.end.astimezone(self.local_timezone), today.astimezone)
-                if self.past_events or event.end.astimezone(self.local_timezone) > today:
-                    self.unparse_event(event)
-            for recurrence in event.recurrences:
-                if recurrence.spec and self.org_native_recurrence_allowed:
-                    # org can express the recurrence natively?
-                    self.unparse_event(event, recur_spec=recurrence.spec)
-                else:
-                    # Repeat by hand
-                    start_recur = recurrence.range_from(event.start).starting(today)
-                    end_recur = None
-                    end = None
 
-                    try:
-                        for start in start_recur:
-                            # Since we don't have a means to initialise by recurrence count right now,
-                            # instead use the first recurrence of "end" at or after "start", which should
-                            # always be the right one
-                            if end_recur is None and event.end:
-                                end_recur = recurrence.range_from(event.end).starting(start)
+    def unparse_calendar(self, calendar : EvolutionCalendar):
+        self.unparse_calendar_heading(calendar)
+        table = calendar.events.table
+        # Skip everything (including whole recurring events) that is over by today.  The table has one row per
+        # event, not per occurrence: manual_occurrences() checks the window of each occurrence on its own.
+        events = table.events if self.past_events else table.select(table.active_after(self.today))
+        for event in events:
+            self.unparse_calendar_event(calendar, event)
+
+    def render_calendar(self, calendar : EvolutionCalendar) -> str:
+        '''unparse_calendar() into a string'''
+        f, self.f = self.f, io.StringIO()
+        try:
+            self.unparse_calendar(calendar)
+            return self.f.getvalue()
+        finally:
+            self.f = f
 
-                            if (start.astimezone(self.local_timezone) - today).days > self.recurrence_emit_future_days:
-                                # Far enough into the future
-                                break
+    def unparse_all_streams(self, streams):
+        '''As unparse_all(), but for (calendar, events) pairs as from merge_calendar_streams()'''
+        self.print_header()
+        for calendar, events in streams:
+            self.unparse_calendar_stream(calendar, events)
+
+    def unparse_calendar_stream(self, calendar, events : Iterable[Event]):
+        '''As unparse_calendar(), but writes each of 'events' as it arrives, in the order given'''
+        self.unparse_calendar_heading(calendar)
+        for event in events:
+            if self.past_events or is_active_after(event, self.today):
+                self.unparse_calendar_event(calendar, event)
+
+    def native_repetition(self, event) -> tuple[str, list[CalTime]]:
+        '''
+        If org can repeat the (recurring) event natively, returns the org repeater and the starts of the
+        timestamps to repeat (one per weekday for weekly rules on several weekdays), otherwise None.
+
+        That excludes events with exclusions or detached instances, rules with 'count' or 'until', and rules in
+        units that org repeaters lack (minutes, seconds).
+        '''
+        if len(event.recurrences) != 1 or event.exclusions or event.detached_instances:
+            return None
+        recurrence = event.recurrences[0]
+        if recurrence.rrule() is None:
+            return None
+        if recurrence.spec:
+            repeater = recurrence.org_agenda_spec()
+            return None if repeater is None else (repeater, [event.start])
+
+        # Weekly on several weekdays: one timestamp per weekday, provided that the occurrences are exactly
+        # those timestamps repeated every week(s) (not so if the event starts on a day outside of the rule)
+        days = len(recurrence.subiterator.day_increments)
+        starts = list(itertools.islice(recurrence.range_from(event.start).all(), 2 * days))
+        if starts[0] != event.start or any(starts[i] + recurrence.increment != starts[i + days] for i in range(days)):
+            return None
+        return f'+{recurrence.increment.days // 7}w', starts[:days]
+
+    def expands_by_hand(self, calendar) -> bool:
+        '''
+        Does the calendar (or None) have recurring events whose occurrences we write by hand, i.e., for a window
+        of days (cf. manual_occurrences())?
+        '''
+        if calendar is None:
+            return False
+        table = calendar.events.table
+        return any((self.past_events or is_active_after(ev, self.today))
+                   and not (self.org_agenda_native_recurrence_allowed and self.native_repetition(ev))
+                   for ev in table.select(table.recurring))
+
+    def unparse_calendar_event(self, calendar, event):
+        '''One event of the calendar, with recurrences repeated natively or expanded as needed'''
+        today = self.today
+        also_in = calendar.links.get(event.key)
+        if not event.recurrences:
+            # Only one event, non-recurring
+            self.unparse_event(event, also_in=also_in)
+            return
+        native = self.native_repetition(event) if self.org_agenda_native_recurrence_allowed else None
+        if native is not None:
+            recur_spec, starts = native
+            self.unparse_event(event, recur_spec=recur_spec, also_in=also_in,
+                               rrule=event.recurrences[0].rrule(), also_at=starts[1:])
+            return
+        # The occurrences share the event's conflicts: only write them once
+        shown_conflicts = set()
+        for recurrence in event.recurrences:
+            # Repeat by hand
+            for start, end, instance in self.manual_occurrences(event, recurrence):
+                if instance is not None:
+                    # Individually modified occurrence
+                    self.unparse_event(instance, also_in=also_in, shown_conflicts=shown_conflicts)
+                else:
+                    self.unparse_event(event, start=start, end=end, also_in=also_in, shown_conflicts=shown_conflicts)
+
+    def manual_occurrences(self, event, recurrence, since=None) -> Generator[tuple[CalTime, CalTime, Event]]:
+        '''
+        (start, end, detached instance or None) for the occurrences of one of the event's recurrences that
+        we expand by hand: those from today to recurrence_emit_future_days days into the future.  With 'since',
+        only those that the window starting on that (earlier) day did not include.
+        '''
+        today = self.today
+        first = today
+        if since is not None:
+            first = max(today, since + timedelta(days=self.recurrence_emit_future_days + 1))
+        start_range, end_range = event.recurrence_ranges(recurrence)
+        end_recur = None
+        end = None
 
-                            if end_recur:
-                                end = end_recur.__next__()
-                            self.unparse_event(event, start=start, end=end)
+        try:
+            for start in start_range.starting(first):
+                # Since we don't have a means to initialise by recurrence count right now,
+                # instead use the first recurrence of "end" at or after "start", which should
+                # always be the right one
+                if end_recur is None and event.end:
+                    end_recur = end_range.starting(start)
+
+                if (start.astimezone(self.local_timezone) - today).days > self.recurrence_emit_future_days:
+                    # Far enough into the future
+                    break
+
+                if end_recur:
+                    end = end_recur.__next__()
+
+                instance = None
+                if event.detached_instances:
+                    instance = event.detached_instances.get(recurrence_key(start))
+                yield start, end, instance
+
+        except StopIteration:
+            pass
+
+    def slide_calendar(self, text : str, calendar, since : CalTime) -> str:
+        '''
+        Moves the text of a calendar that unparse_calendar() wrote for the window starting on day 'since' (and
+        otherwise our settings) to our window, without parsing the events: drops the blocks of events and
+        occurrences that are over by today and adds the occurrences that entered the window since.  'since' is
+        None for calendars that we expand no recurring events of by hand (cf. expands_by_hand()), which only
+        lose blocks.
+
+        The text must not have conflicts: we only write those below the first occurrence of an event.
+
+        'calendar' holds the (remote) events with their recurrence rules, or is None if there are none.  New
+        occurrences copy the last block written for the same occurrence series, so local changes carry over;
+        they go where the last block of their event was, or to the end.
+        '''
+        # As org_chunks(), but in one go
+        chunks = _BLOCK_START.split(text)[1:]
+        kept, templates = [chunks[0]], {}
+        last = {} # event UID -> index in 'kept' of its last block (or of the block before it, if dropped)
+        for block in chunks[1:]:
+            parts = block.split('\n', 2)
+            if len(parts) < 3 or not parts[1].startswith(self._SCHEDULED):
+                kept.append(block) # Not ours
+                continue
+            heading, scheduled, rest = parts
+            properties = dict(_BLOCK_PROPERTY.findall(rest.partition(self._PROPERTIES_END)[0]))
+            uid = properties.get(OrgProc.EVENT_UID)
+            if OrgProc.FIRST_START in properties and OrgProc.RECURRENCE_ID not in properties:
+                templates[uid] = (heading, rest)
+            if self.block_in_window(properties, scheduled):
+                kept.append(block)
+            last[uid] = len(kept) - 1
+
+        added = {}
+        if since is None:
+            calendar = None
+        else:
+            since = self.in_local_timezone(since)
+        for ev in ([] if calendar is None else calendar.events.values()):
+            if not ev.recurrences or (self.org_agenda_native_recurrence_allowed and self.native_repetition(ev)):
+                continue
+            also_in = calendar.links.get(ev.key)
+            new_blocks = added.setdefault(last.get(ev.event_id, len(kept) - 1), [])
+            for recurrence in ev.recurrences:
+                for start, end, instance in self.manual_occurrences(ev, recurrence, since=since):
+                    if instance is not None:
+                        new_blocks.append(self.format_event(instance, also_in=also_in))
+                    elif ev.event_id in templates:
+                        heading, rest = templates[ev.event_id]
+                        new_blocks.append('\n'.join((heading, self._SCHEDULED + self.unparse_timespec_recurrence(None, start, end),
+                                                      rest)))
+                    else:
+                        new_blocks.append(self.format_event(ev, start=start, end=end, also_in=also_in))
+
+        return ''.join(itertools.chain.from_iterable([block] + added.get(i, []) for i, block in enumerate(kept)))
+
+    def block_in_window(self, properties : dict[str, str], scheduled : str) -> bool:
+        '''
+        Would we still write an event block (with the given properties and SCHEDULED line, as written by
+        format_event()) today?  Helper for slide_calendar().
+        '''
+        if OrgProc.RECURRENCE in properties:
+            return True # Native repeaters only have unbounded rules
+        if OrgProc.RECURRENCE_ID in properties:
+            # Detached instance: shown for its original occurrence
+            return self.parse_datetime(properties[OrgProc.RECURRENCE_ID]) >= self.today
+        m = _SCHEDULED_SPAN.search(scheduled)
+        if m is None:
+            return True
+        start = self.org_timestamp(*m.group(1, 2, 3, 4, 5))
+        if OrgProc.FIRST_START in properties:
+            return start >= self.today # Occurrence of an event that we repeat by hand
+        if self.past_events:
+            return True
+        if m.group(6):
+            end = start.replace(hour=int(m.group(6)), minute=int(m.group(7)))
+        elif m.group(8):
+            end = self.org_timestamp(*m.group(8, 9, 10, 11, 12))
+        else:
+            # As when parsing, cf. OrgEventParser.translate_event()
+            end = start + timedelta(days=1) if (start.hour, start.minute) == (0, 0) else start
+        return end > self.today
 
-                    except StopIteration:
-                        pass
+    def org_timestamp(self, year, month, day, hour, minute) -> CalTime:
+        return CalTime(int(year), int(month), int(day), int(hour), int(minute), tzinfo=self.local_timezone)
 
 
 class OrgCalendar:
@@ -244,8 +561,10 @@ class OrgCalendar:
 
     CALID = 'CAL-UID'
 
-    def __init__(self, name : str, caluid : str, events):
+    def __init__(self, name : str, caluid : str, events, links=None):
         self._uid = caluid
+        # event key -> names of other calendars that have the same event (cf. dedup.deduplicate())
+        self.links = {} if links is None else links
         if type(events) is EventSet:
             self._events = events
         else:
@@ -266,8 +585,280 @@ class OrgCalendar:
     def events(self) -> EventSet:
         return self._events
 
-    def merge(self, other):
-        return OrgCalendar(self.name, self.uid, self.events.merge(other.events))
+    def merge(self, other, base=None):
+        return OrgCalendar(self.name, self.uid, self.events.merge(other.events, base=base),
+                           links={**self.links, **other.links})
+
+
+'''Inputs for the workers of _in_forked_workers(), which they inherit when they are forked'''
+_WORKER_INPUTS = None
+
+def _run_in_worker(job):
+    function, index = job
+    return function(_WORKER_INPUTS, index)
+
+
+def _in_forked_workers(function, inputs, count : int, jobs : int) -> list:
+    '''
+    [function(inputs, i) for i in range(count)], in up to 'jobs' worker processes (one per index at most).  The
+    workers are forked after 'inputs' are loaded and find them in _WORKER_INPUTS, so only 'function' (by name)
+    and the indices go to them, and only the results come back.  Without fork() (e.g., on Windows), everything
+    runs in this process.
+    '''
+    global _WORKER_INPUTS
+    jobs = min(jobs, count)
+    if jobs <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return [function(inputs, i) for i in range(count)]
+
+    _WORKER_INPUTS = inputs
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+                                                    mp_context=multiprocessing.get_context('fork')) as executor:
+            return list(executor.map(_run_in_worker, [(function, i) for i in range(count)]))
+    finally:
+        _WORKER_INPUTS = None
+
+
+def _render_calendar(inputs, index : int) -> str:
+    unparser, calendars = inputs
+    return unparser.render_calendar(calendars[index])
+
+
+def render_calendars(unparser : OrgEventUnparser, calendars : list, jobs : int=1) -> list[str]:
+    '''
+    unparser.render_calendar() for each of the calendars, in order, in up to 'jobs' forked worker processes
+    (cf. _in_forked_workers()), which only send back the texts
+    '''
+    return _in_forked_workers(_render_calendar, (unparser, calendars), len(calendars), jobs)
+
+
+def merge_calendars(local : MergingDict, remote : MergingDict, sync_state : SyncState=None):
+    '''
+    Merges two MergingDicts of calendars, three-way against the snapshot in 'sync_state' if there is one.
+
+    This merges in this process: sending merged events back from worker processes would cost several times as
+    much as merging them in the first place.  Callers that only need the texts of the merged calendars can
+    merge_and_render_calendars() instead.
+    '''
+    return local.merge(remote, base=None if sync_state is None else sync_state.base)
+
+
+def _merge_and_render_calendar(inputs, index : int) -> tuple[str, bool]:
+    unparser, local, remote, base, caluids = inputs
+    caluid = caluids[index]
+    if caluid not in local:
+        calendar = remote[caluid]
+    elif caluid not in remote:
+        calendar = local[caluid]
+    else:
+        calendar = local[caluid].merge(remote[caluid], base=None if base is None else base.get(caluid))
+    return unparser.render_calendar(calendar), unparser.expands_by_hand(calendar)
+
+
+def merge_and_render_calendars(unparser : OrgEventUnparser, local : MergingDict, remote : MergingDict,
+                               caluids : list[str], sync_state : SyncState=None,
+                               jobs : int=1) -> list[tuple[str, bool]]:
+    '''
+    Merges (as merge_calendars()) and renders (as render_calendars()) each of the calendars with the given
+    UIDs in one go, in up to 'jobs' forked worker processes.  Returns, in order, their texts and whether they
+    have events that we expand by hand (cf. OrgEventUnparser.expands_by_hand()); the merged events never leave
+    the workers.
+    '''
+    base = None if sync_state is None else sync_state.base
+    return _in_forked_workers(_merge_and_render_calendar, (unparser, local, remote, base, caluids), len(caluids),
+                              jobs)
+
+
+class UnsortedStream(ValueError):
+    '''An event stream that should be sorted by event ID is not'''
+
+
+def event_groups(events : Iterable[Event]) -> Generator[tuple[str, EventSet]]:
+    '''
+    Groups a stream of events that is sorted by event ID into (event ID, EventSet) pairs; each EventSet holds
+    all events with that ID, i.e., a recurring event with its detached instances (cf. EventSet.add()).
+    Raises UnsortedStream if the stream is not sorted.
+    '''
+    previous = None
+    for evid, evs in itertools.groupby(events, key=lambda ev: ev.event_id or ''):
+        if previous is not None and evid <= previous:
+            raise UnsortedStream(f'Event "{evid}" follows "{previous}"')
+        previous = evid
+        group = EventSet()
+        for ev in evs:
+            group.add(ev)
+        yield evid, group
+
+
+def sorted_groups(events : EventSet) -> Generator[tuple[str, EventSet]]:
+    '''The events of an EventSet as (event ID, EventSet) groups, sorted by event ID (cf. event_groups())'''
+    keys = {}
+    for key, ev in events.items():
+        keys.setdefault(ev.event_id or '', []).append(key)
+    for evid in sorted(keys):
+        group = EventSet()
+        for key in keys[evid]:
+            group[key] = events[key]
+        yield evid, group
+
+
+def _group_order(item):
+    # Within a group: the recurring event first, then any detached instances that we could not attach to it
+    key = item[0]
+    return (1, key[1]) if type(key) is tuple else (0, 0)
+
+
+def merge_groups(local : Iterable[tuple[str, EventSet]], remote : Iterable[tuple[str, EventSet]],
+                 base=None) -> Generator[Event]:
+    '''
+    Merge join of two streams of (event ID, EventSet) groups that are sorted by event ID (as produced by
+    event_groups() or sorted_groups()).  Yields the events of local.merge(remote, base=base), sorted by
+    event ID, while holding only one group per side.
+    '''
+    local, remote = iter(local), iter(remote)
+    lgroup, rgroup = next(local, None), next(remote, None)
+    while lgroup is not None or rgroup is not None:
+        if rgroup is None or (lgroup is not None and lgroup[0] < rgroup[0]):
+            group = lgroup[1]
+            lgroup = next(local, None)
+        elif lgroup is None or rgroup[0] < lgroup[0]:
+            group = rgroup[1]
+            rgroup = next(remote, None)
+        else:
+            group = lgroup[1].merge(rgroup[1], base=base)
+            lgroup, rgroup = next(local, None), next(remote, None)
+        for _, ev in sorted(group.items(), key=_group_order):
+            yield ev
+
+
+def merge_calendar_streams(local : Iterable[tuple[OrgCalendar, Iterable[Event]]], remote : MergingDict,
+                           sync_state : SyncState=None) -> Generator[tuple[OrgCalendar, Generator[Event]]]:
+    '''
+    Streaming counterpart of merge_calendars(): merges (calendar, events) pairs as from OrgEventParser.stream()
+    with the remote calendars.  Yields (calendar, merged events) pairs, with the calendars in the same order
+    as merge_calendars() and the events sorted by event ID.  Each events generator must be consumed before
+    advancing to the next calendar.
+
+    The local events must be sorted by event ID within each calendar, as unparse_calendar_stream() writes
+    them; otherwise, the events generator raises UnsortedStream.
+    '''
+    base = {} if sync_state is None else sync_state.base
+    seen = set()
+    for calendar, events in local:
+        other = None if calendar.uid in seen else remote.get(calendar.uid)
+        seen.add(calendar.uid)
+        if other is None:
+            yield calendar, merge_groups(event_groups(events), [])
+        else:
+            yield (OrgCalendar(calendar.name, calendar.uid, [], links={**calendar.links, **other.links}),
+                   merge_groups(event_groups(events), sorted_groups(other.events), base=base.get(calendar.uid)))
+    for caluid, cal in remote.items():
+        if caluid not in seen:
+            yield cal, merge_groups([], sorted_groups(cal.events))
+
+
+def calendar_streams(calendars : MergingDict) -> Generator[tuple[OrgCalendar, list[Event]]]:
+    '''(calendar, events) pairs for calendars that are already in memory, with events sorted by event ID'''
+    for cal in calendars.values():
+        yield cal, sorted(cal.events.values(), key=lambda ev: ev.event_id or '')
+
+
+def chronological(calendars : MergingDict, start : CalTime, end : CalTime=None):
+    '''
+    Chronologically ordered stream of (calendar, occurrence) pairs over all events in all calendars (e.g.,
+    OrgCalendar or EvolutionCalendar objects) that intersect [start, end]; end=None means 'unbounded'.
+
+    The per-event occurrence iterators are merged lazily, so e.g. the next N events can be taken with
+    itertools.islice() even for unbounded recurrences.
+    '''
+    def tagged(calendar):
+        for occurrence in calendar.events.chronological(start, end):
+            yield (calendar, occurrence)
+
+    return heapq.merge(*(tagged(cal) for cal in calendars.values()), key=lambda co: co[1].start)
+
+
+def inactive_timespec(start : CalTime, end : CalTime, timezone=None) -> str:
+    '''Inactive org timestamp (range) for [start, end], i.e., one that does not show up in the agenda'''
+    start = start.astimezone(timezone)
+    end = end.astimezone(timezone)
+    if start.date() == end.date():
+        return f'[{start.date_str()} {start.time_str()}-{end.time_str()}]'
+    return f'[{start.date_str()} {start.time_str()}]--[{end.date_str()} {end.time_str()}]'
+
+
+def overlap_str(group : list, timezone=None) -> str:
+    '''Time span and participants of a group of overlapping (calendar, occurrence) pairs'''
+    end = max(occ.end for _, occ in group)
+    return (inactive_timespec(group[0][1].start, end, timezone) + ' ' +
+            ', '.join(f'{occ.name} ({cal.name})' for cal, occ in group))
+
+
+_HEADING = re.compile(r'(\*+) ')
+_CONFLICT_HEADING = re.compile(rf'\*+ \S+ {re.escape(OrgProc.CONFLICT_HEADING)} ')
+
+_TIMESTAMPS_LINE = re.compile(r'\s*(<[^<>]*>\s*)+')
+# Event blocks, their property lines and SCHEDULED timestamp(s), cf. OrgEventUnparser.slide_calendar()
+_BLOCK_START = re.compile(r'^(?=\*\*? )', re.MULTILINE)
+_BLOCK_PROPERTY = re.compile(r'^  :([A-Z-]+): (.*)$', re.MULTILINE)
+_TIMESTAMP = r'<(\d{4})-(\d\d)-(\d\d) \w+ (\d\d):(\d\d)'
+_SCHEDULED_SPAN = re.compile(_TIMESTAMP + r'(?:-(\d\d):(\d\d))?[^>]*>(?:--' + _TIMESTAMP + r'[^>]*>)?')
+_EMIT_WINDOW = re.compile(rf'#\+PROPERTY: {OrgProc.EMIT_WINDOW} (\S+) \+(\d+)d\s*')
+
+def org_chunks(lines : Iterable[str]) -> Generator[tuple[int, str]]:
+    '''
+    Splits org text into (level, text) chunks without parsing it: text before the first heading (level 0),
+    each top-level heading with the text below it (level 1), and each second-level subtree (level 2)
+    '''
+    level, chunk = 0, []
+    for line in lines:
+        m = _HEADING.match(line)
+        if m and len(m.group(1)) <= 2:
+            if chunk:
+                yield level, ''.join(chunk)
+            level, chunk = len(m.group(1)), []
+        chunk.append(line)
+    if chunk:
+        yield level, ''.join(chunk)
+
+
+def without_conflicts(lines : Iterable[str]) -> Generator[str]:
+    '''
+    The lines of org text without the subtrees of conflicts (cf. OrgEventUnparser.format_event()).  We only
+    write those for the user to resolve and never read them back, so there is no need to parse them.
+    '''
+    skipping = None # level of the conflict heading whose subtree we skip
+    for line in lines:
+        m = _HEADING.match(line)
+        if m:
+            level = len(m.group(1))
+            if skipping is not None and level <= skipping:
+                skipping = None
+            if skipping is None and level >= 2 and _CONFLICT_HEADING.match(line):
+                skipping = level
+        if skipping is None:
+            yield line
+
+
+def calendar_sections(lines : Iterable[str]) -> Generator[tuple[str, str]]:
+    '''
+    Splits org text into (calendar UID, text) pairs, one per calendar subtree, without parsing the events
+    (cf. org_chunks()).  Text before the first calendar and generated free/busy sections are skipped.
+    '''
+    caluid, section = None, None
+    for level, text in org_chunks(lines):
+        if level == 1:
+            if section is not None:
+                yield caluid, ''.join(section)
+            node = orgparse.loads(text).children[0]
+            if node.get_property(OrgProc.FREEBUSY_WINDOW) is None:
+                caluid, section = node.get_property(OrgCalendar.CALID), [text]
+            else:
+                caluid, section = None, None
+        elif section is not None:
+            section.append(text)
+    if section is not None:
+        yield caluid, ''.join(section)
 
 
 class OrgEventParser(OrgProc):
@@ -280,14 +871,94 @@ class OrgEventParser(OrgProc):
         return orgparse.OrgEnv(todos=TODOS, dones=DONES, filename=filename)
 
     def load(self, file):
-        return self.translate(orgparse.load(file, env=self.org_env(file)))
+        '''Parses an org file (name or text file), cf. without_conflicts()'''
+        if isinstance(file, str):
+            with open(file, encoding='utf-8') as f:
+                return self.load(f)
+        filename = getattr(file, 'name', '<string>')
+        return self.translate(orgparse.loads(''.join(without_conflicts(file)), filename=filename,
+                                             env=self.org_env(filename)))
 
     def loads(self, str):
-        return self.translate(orgparse.loads(str, env=self.org_env('<string>')))
+        return self.translate(orgparse.loads(''.join(without_conflicts(str.splitlines(True))),
+                                             env=self.org_env('<string>')))
+
+    def stream(self, file) -> Generator[tuple[OrgCalendar, Generator[Event]]]:
+        '''
+        Lazily parses an org file (name or text file) into (calendar, events) pairs, in file order.  The
+        calendars are OrgCalendars without events; each events generator yields the events of its calendar
+        and must be consumed before advancing to the next calendar.  Only one event subtree (an event and
+        its conflicts) is parsed at a time.
+        '''
+        if isinstance(file, str):
+            with open(file, encoding='utf-8') as f:
+                yield from self.stream(f)
+            return
+
+        filename = getattr(file, 'name', '<string>')
+        env = self.org_env(filename)
+        def parse(text):
+            children = orgparse.loads(''.join(without_conflicts(text.splitlines(True))), filename=filename,
+                                      env=env).children
+            return children[0] if children else None # None for (misplaced) conflicts
+
+        chunks = org_chunks(file)
+        heading = next((text for level, text in chunks if level == 1), None)
+        while heading is not None:
+            node = parse(heading)
+            heading = None
+
+            def section(translate):
+                nonlocal heading
+                for level, text in chunks:
+                    if level == 1:
+                        heading = text
+                        return
+                    event_node = parse(text) if translate else None
+                    if event_node is not None:
+                        yield self.translate_event(event_node)
+
+            if node.get_property(OrgProc.FREEBUSY_WINDOW) is not None:
+                # Generated free/busy section
+                for _ in section(False):
+                    pass
+                continue
+            events = section(True)
+            yield OrgCalendar(node.heading, node.get_property(OrgCalendar.CALID), []), events
+            for _ in events: # Whatever the caller did not consume
+                pass
+
+    def emitted_window(self, lines : Iterable[str]) -> CalTime:
+        '''
+        Start of the window that the org text emitted recurring events for (cf. OrgEventUnparser.print_header()),
+        or None if it did not record one or the window had a different length than ours
+        '''
+        for line in lines:
+            if _HEADING.match(line):
+                break
+            m = _EMIT_WINDOW.fullmatch(line)
+            if m and int(m.group(2)) == self.recurrence_emit_future_days:
+                try:
+                    return CalTime.from_datetime(datetime.fromisoformat(m.group(1))).astimezone(self.local_timezone)
+                except ValueError:
+                    return None
+        return None
+
+    def load_index(self, file) -> dict[str, str]:
+        '''Maps calendar UIDs to file names, for an index (name or text file) from OrgEventUnparser.unparse_index()'''
+        if isinstance(file, str):
+            with open(file, encoding='utf-8') as f:
+                return self.load_index(f)
+        filename = getattr(file, 'name', '<string>')
+        return {node.get_property(OrgCalendar.CALID) : node.get_property(OrgProc.CALENDAR_FILE)
+                for node in orgparse.loads(file.read(), filename=filename, env=self.org_env(filename)).children
+                if node.get_property(OrgProc.CALENDAR_FILE) is not None}
 
     def translate(self, root):
         result = MergingDict()
         for calnode in root.children:
+            if calnode.get_property(OrgProc.FREEBUSY_WINDOW) is not None:
+                continue # Generated free/busy section
             cal = self.translate_calendar(calnode)
             result[cal.uid] = cal
         return result
@@ -305,7 +976,8 @@ class OrgEventParser(OrgProc):
     def translate_event(self, orgev):
         ev = event.CalEvent(orgev.get_property(OrgProc.EVENT_UID))
         ev.name = orgev.heading
-        ev.status = event.EventState.get(str(orgev.todo))
+        # Files may declare further keywords (#+TODO: lines)
+        ev.status = event.TODO if orgev.todo is None else event.EventState.register(orgev.todo)
         ev.start = self.translate_datetime(orgev.scheduled.start)
         if orgev.scheduled.end:
             ev.end = self.translate_datetime(orgev.scheduled.end)
@@ -324,10 +996,27 @@ class OrgEventParser(OrgProc):
             ev.start = self.parse_datetime(original_start)
         if original_end:
             ev.end = self.parse_datetime(original_end)
-
-        ev.description = orgev.body
+        recurrence_id = orgev.get_property(OrgProc.RECURRENCE_ID)
+        if recurrence_id:
+            ev.recurrence_id = self.parse_datetime(recurrence_id)
+
+        description = orgev.body
+        rrule = orgev.get_property(OrgProc.RECURRENCE)
+        if rrule:
+            try:
+                recurrence = self.cconv.recurrence_from_rrule(rrule)
+            except ValueError as e:
+                perr(f'Ignoring recurrence of "{ev.name}": {e}')
+            else:
+                ev.recurrences = [recurrence]
+                if recurrence.subiterator and len(recurrence.subiterator.day_increments) > 1:
+                    # Drop the line with the timestamps for the other weekdays (cf. OrgEventUnparser.format_event())
+                    first, _, rest = description.partition('\n')
+                    if _TIMESTAMPS_LINE.fullmatch(first):
+                        description = rest
+        ev.description = description
         attendees = orgev.get_property(OrgProc.ATTENDEES)
-        ev.attendees = sorted([s.strip() for s in attendees.split(' ')]) if attendees else []
+        ev.attendees = event.EventStringList(sorted([s.strip() for s in attendees.split(' ')]) if attendees else [])
         ev.location = orgev.get_property(OrgProc.LOCATION)
 
         tzid = orgev.get_property(OrgProc.TZID)
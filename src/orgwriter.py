@@ -0,0 +1,199 @@
+# This file is Copyright (C) 2022 Christoph Reichenbach
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the
+#   Free Software Foundation, Inc.
+#   59 Temple Place, Suite 330
+#   Boston, MA  02111-1307
+#   USA
+#
+# The author can be reached as "creichen" at the usual gmail server.
+
+
+from __future__ import annotations
+
+import os
+import stat
+import tempfile
+
+'''fsync() policies: leave it to the OS, sync the new file before it replaces the old one, or also sync the
+directory afterwards (so that the replacement itself survives a crash)'''
+FSYNC_NONE = 'none'
+FSYNC_FILE = 'file'
+FSYNC_FULL = 'full'
+FSYNC_POLICIES = [FSYNC_NONE, FSYNC_FILE, FSYNC_FULL]
+'''Default fsync() policy'''
+FSYNC_POLICY = FSYNC_FILE
+'''Number of characters that AtomicOrgWriter collects before writing them out'''
+BUFFER_SIZE = 1 << 16
+
+
+class AtomicOrgWriter:
+    '''
+    Text file writer that replaces 'path' atomically: output goes to a temporary file in the same directory,
+    which only replaces 'path' (taking over its permissions) once everything is written, so that readers such
+    as Emacs see either the old or the new file, but never a partial one.  write() only collects chunks,
+    which go out in batches of about 'buffer_size' characters.
+
+    With 'skip_unchanged', the batches are first compared against the current contents of 'path', and the
+    temporary file is only created at the first difference; if there is none, 'path' is not touched at all
+    (not even its mtime).  Afterwards, 'changed' tells whether 'path' was replaced.
+
+    Use as a context manager; if the block raises, 'path' is left alone.
+    '''
+
+    def __init__(self, path : str, fsync : str=FSYNC_POLICY, buffer_size : int=BUFFER_SIZE,
+                 skip_unchanged : bool=True):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f'Unknown fsync policy "{fsync}"')
+        self.path = os.path.realpath(path) # Replace the target of symlinks, not the link
+        self.fsync = fsync
+        self.buffer_size = buffer_size
+        self.skip_unchanged = skip_unchanged
+        self.changed = None
+        self._chunks = []
+        self._buffered = 0
+        self._file = None
+        self._tmp_path = None
+        self._old = None # current contents of 'path', while they match what we have written
+        self._matched = 0 # number of characters that matched so far
+
+    def __enter__(self):
+        if self.skip_unchanged:
+            try:
+                self._old = open(self.path, encoding='utf-8', newline='')
+            except FileNotFoundError:
+                pass
+        if self._old is None:
+            self._open_tmp()
+        return self
+
+    def _open_tmp(self):
+        directory, name = os.path.split(self.path)
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{name}.', suffix='.tmp')
+        self._file = os.fdopen(fd, 'w', encoding='utf-8', newline='')
+
+    def _old_continues_with(self, data : str) -> bool:
+        try:
+            return self._old.read(len(data)) == data
+        except UnicodeDecodeError:
+            return False
+
+    def _old_ends(self) -> bool:
+        try:
+            return self._old.read(1) == ''
+        except UnicodeDecodeError:
+            return False
+
+    def _diverge(self):
+        '''Switches from comparing to writing: copies the matching prefix into the temporary file'''
+        self._open_tmp()
+        self._old.seek(0)
+        remaining = self._matched
+        while remaining:
+            block = self._old.read(min(remaining, self.buffer_size))
+            if not block:
+                break
+            self._file.write(block)
+            remaining -= len(block)
+        self._old.close()
+        self._old = None
+
+    def write(self, s : str):
+        self._chunks.append(s)
+        self._buffered += len(s)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        '''Writes out (or compares) the collected chunks'''
+        data = ''.join(self._chunks)
+        self._chunks.clear()
+        self._buffered = 0
+        if self._file is None:
+            if self._old_continues_with(data):
+                self._matched += len(data)
+                return
+            self._diverge()
+        self._file.write(data)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.flush()
+                if self._file is None and self._old_ends():
+                    self.changed = False
+                else:
+                    self._replace()
+        finally:
+            if self._old is not None:
+                self._old.close()
+            if self._file is not None:
+                self._file.close()
+            if self._tmp_path is not None:
+                os.unlink(self._tmp_path)
+                self._tmp_path = None
+        return False
+
+    def _replace(self):
+        if self._file is None:
+            self._diverge()
+        self._file.flush()
+        if self.fsync != FSYNC_NONE:
+            os.fsync(self._file.fileno())
+        self._file.close()
+        os.chmod(self._tmp_path, _mode_for(self.path))
+        os.replace(self._tmp_path, self.path)
+        self._tmp_path = None
+        if self.fsync == FSYNC_FULL:
+            _fsync_directory(os.path.dirname(self.path))
+        self.changed = True
+
+
+def write_atomically(path : str, data : bytes, fsync : str=FSYNC_POLICY):
+    '''Replaces 'path' with 'data' as AtomicOrgWriter does, for binary files that we write in one go'''
+    if fsync not in FSYNC_POLICIES:
+        raise ValueError(f'Unknown fsync policy "{fsync}"')
+    path = os.path.realpath(path)
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            if fsync != FSYNC_NONE:
+                os.fsync(f.fileno())
+        os.chmod(tmp_path, _mode_for(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    if fsync == FSYNC_FULL:
+        _fsync_directory(directory)
+
+
+def _mode_for(path : str) -> int:
+    '''Permissions for the new file: those of the one that it replaces, or the default ones'''
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+def _fsync_directory(directory : str):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
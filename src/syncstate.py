@@ -0,0 +1,214 @@
+# This file is Copyright (C) 2022 Christoph Reichenbach
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the
+#   Free Software Foundation, Inc.
+#   59 Temple Place, Suite 330
+#   Boston, MA  02111-1307
+#   USA
+#
+# The author can be reached as "creichen" at the usual gmail server.
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import sys
+from datetime import datetime
+
+from caltime import CalTime, Exclusions, Recurrence
+from event import Event, EventState, EventStringList, MergingDict, recurrence_signature
+from orgwriter import FSYNC_POLICY, write_atomically
+
+'''Suffix for the file (next to the org file) that stores synchronisation state'''
+SYNC_STATE_SUFFIX = '.sync.json.gz'
+'''Bump whenever the file format changes; files with other versions are ignored'''
+SYNC_STATE_VERSION = 2
+
+
+def perr(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def encode_value(proptype, v):
+    '''Translates an event property value into JSON'''
+    if v is None:
+        return None
+    if proptype is CalTime:
+        return v.isoformat()
+    if isinstance(v, EventState):
+        return v.name
+    if isinstance(v, (list, EventStringList)):
+        return list(v)
+    return v
+
+def decode_value(proptype, v):
+    '''Inverse of encode_value()'''
+    if v is None:
+        return None
+    if proptype is CalTime:
+        return CalTime.from_datetime(datetime.fromisoformat(v))
+    if proptype is EventState:
+        return EventState.register(v)
+    if proptype is EventStringList:
+        return EventStringList(v)
+    return v
+
+
+_SNAPSHOT_PROPERTIES = [(p, Event.PROPERTIES[p][0]) for p in Event.COMPARED_PROPERTIES]
+
+def encode_event(ev : Event) -> list:
+    '''
+    Snapshot of an event: the encoded values of its COMPARED_PROPERTIES, its recurrence_signature(), and the
+    snapshots of its detached instances (by recurrence_key())
+    '''
+    return [encode_value(proptype, getattr(ev, p)) for p, proptype in _SNAPSHOT_PROPERTIES] + [
+        recurrence_signature(ev),
+        {str(rkey) : encode_event(instance) for rkey, instance in (ev.detached_instances or {}).items()}]
+
+def decode_event(record : list) -> tuple:
+    '''The common ancestor information for Event.merge() from the output of encode_event()'''
+    *values, recurrences, detached = record
+    return tuple(decode_value(proptype, v) for (_, proptype), v in zip(_SNAPSHOT_PROPERTIES, values)) + (
+        recurrences, {int(rkey) : decode_event(instance) for rkey, instance in detached.items()})
+
+
+def encode_key(key) -> str:
+    '''Translates an EventSet key (cf. Event.key) into a JSON object key'''
+    if type(key) is str:
+        return key
+    evid, rkey = key
+    return f'{evid}\0{rkey}'
+
+def decode_key(s : str):
+    '''Inverse of encode_key()'''
+    evid, sep, rkey = s.rpartition('\0')
+    return (evid, int(rkey)) if sep else s
+
+
+def stable_digest(*parts : str) -> str:
+    '''Digest of some strings that is the same in every process and run'''
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part.encode('utf-8', 'surrogatepass'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def _stable_repr(v) -> str:
+    if isinstance(v, CalTime):
+        return f'{v.isoformat()}/{v.tzinfo}'
+    if isinstance(v, (list, EventStringList)):
+        return '[' + ', '.join(_stable_repr(item) for item in v) + ']'
+    if isinstance(v, Recurrence):
+        return str(v)
+    if isinstance(v, Exclusions):
+        return f'{sorted(v.dates)}{[str(rule) for rule in v.rules]}'
+    if isinstance(v, dict):
+        return '{' + ', '.join(f'{k}: {event_repr(instance)}' for k, instance in sorted(v.items())) + '}'
+    return repr(v)
+
+def event_repr(ev : Event) -> str:
+    '''Stable description of everything about an event (including its conflicts) that we write out'''
+    parts = [repr(ev.key)] + [_stable_repr(getattr(ev, p)) for p in _DESCRIBED_PROPERTIES]
+    conflict = ev.get_conflict_event()
+    if conflict is not None:
+        parts.append(event_repr(conflict))
+    return '\x1f'.join(parts)
+
+_DESCRIBED_PROPERTIES = [p for p in Event.PROPERTIES if p not in Event.OPAQUE_PROPERTIES]
+
+def calendar_digest(calendar) -> str:
+    '''stable_digest() of a calendar's name, UID, links (cf. dedup.deduplicate()) and events, in order'''
+    return stable_digest(calendar.name, str(calendar.uid), repr(sorted((repr(k), v) for k, v in calendar.links.items())),
+                         *(event_repr(ev) for ev in calendar.events.values()))
+
+
+class SyncState:
+    '''
+    Synchronisation state that we persist between runs.  Currently this is the "base" snapshot: the
+    remote events as of the last synchronisation, which is the common ancestor for three-way merging.
+
+    Only what Event.merge() compares is stored (cf. encode_event()).
+
+    We also remember the 'layout' of the org file that we wrote: for each calendar, the stable_digest() of
+    the inputs that it was rendered from and of the text that we wrote for it.  If both still match, the
+    calendar's text can be copied instead of rendered again (cf. main.update()).
+    '''
+
+    def __init__(self, snapshot=None, layout=None):
+        # calendar UID -> event ID -> encode_event()
+        self._snapshot = {} if snapshot is None else snapshot
+        self._base = None
+        # calendar UID -> [inputs digest, text digest]
+        self.layout = {} if layout is None else layout
+
+    @staticmethod
+    def path_for(orgfile_name : str) -> str:
+        return orgfile_name + SYNC_STATE_SUFFIX
+
+    @staticmethod
+    def from_calendars(calendars : MergingDict) -> SyncState:
+        '''Snapshot of all events of the given calendars'''
+        return SyncState({cal.uid : {encode_key(key) : encode_event(ev) for key, ev in cal.events.items()}
+                          for cal in calendars.values()})
+
+    @staticmethod
+    def load(orgfile_name : str) -> SyncState:
+        '''Loads the state for the given org file; yields empty state if there is none (or it is unusable)'''
+        path = SyncState.path_for(orgfile_name)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return SyncState()
+        except (OSError, ValueError) as e:
+            perr(f'Ignoring unreadable synchronisation state "{path}": {e}')
+            return SyncState()
+
+        if data.get('version') != SYNC_STATE_VERSION or data.get('fields') != Event.COMPARED_PROPERTIES:
+            perr(f'Ignoring outdated synchronisation state "{path}"')
+            return SyncState()
+        return SyncState(data['snapshot'], data.get('layout'))
+
+    def save(self, orgfile_name : str, fsync : str=FSYNC_POLICY):
+        data = {
+            'version'  : SYNC_STATE_VERSION,
+            'fields'   : Event.COMPARED_PROPERTIES,
+            'snapshot' : self._snapshot,
+            'layout'   : self.layout,
+        }
+        # Replaced atomically: a truncated state would be discarded, turning the next merge into a two-way one
+        write_atomically(SyncState.path_for(orgfile_name),
+                         gzip.compress(json.dumps(data, separators=(',', ':')).encode('utf-8')), fsync=fsync)
+
+    def __eq__(self, other):
+        '''Same snapshot?  (e.g., to skip saving state that did not change)'''
+        return isinstance(other, SyncState) and self._snapshot == other._snapshot and self.layout == other.layout
+
+    def calendar_digest(self, caluid : str) -> str:
+        '''stable_digest() of the snapshot of one calendar ('' if we have none)'''
+        if caluid not in self._snapshot:
+            return ''
+        return stable_digest(json.dumps(self._snapshot[caluid], separators=(',', ':')))
+
+    @property
+    def base(self) -> dict[str, dict[str, tuple]]:
+        '''
+        Maps calendar UIDs to maps from event keys to the common ancestor information of the snapshotted
+        events (cf. decode_event()), suitable as 'base' for OrgCalendar.merge().
+        '''
+        if self._base is None:
+            self._base = {caluid : {decode_key(key) : decode_event(record) for key, record in events.items()}
+                          for caluid, events in self._snapshot.items()}
+        return self._base
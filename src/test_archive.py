@@ -0,0 +1,122 @@
+# This file is Copyright (C) 2022 Christoph Reichenbach
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the
+#   Free Software Foundation, Inc.
+#   59 Temple Place, Suite 330
+#   Boston, MA  02111-1307
+#   USA
+#
+# The author can be reached as "creichen" at the usual gmail server.
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import unittest
+import caltime
+import tzresolve
+import event
+from archive import *
+from org_events import OrgCalendar
+from syncstate import SyncState
+
+cconv = caltime.CalConverter(tzresolve.TZResolver(None))
+
+def dt(s):
+    return cconv.time_from_str(s)
+
+def mk_event(evid : str, name : str, start, end, **args):
+    ev = event.EventRepeater(evid, name, start)
+    ev.end = end
+    for k, v in args.items():
+        setattr(ev, k, v)
+    return ev
+
+def mk_calendars(*events):
+    cals = event.MergingDict()
+    cals['C0'] = OrgCalendar('CAL0', 'C0', events)
+    return cals
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.orgfile = os.path.join(self.tmpdir.name, 'cal.org')
+        self.remote = mk_calendars(
+            mk_event('I0', 'Old', start=dt('2022-01-10T10:00/UTC'), end=dt('2022-01-10T11:00/UTC')),
+            mk_event('I1', 'Older', start=dt('2022-02-01T10:00/UTC'), end=dt('2022-02-01T11:00/UTC')),
+            mk_event('I2', 'Recent', start=dt('2022-05-20T10:00/UTC'), end=dt('2022-05-20T11:00/UTC')),
+            mk_event('I3', 'Daily', start=dt('2022-01-01T10:00/UTC'), end=dt('2022-01-01T11:00/UTC'),
+                     recurrences=[cconv.daily_recurrence()]))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def archived(self, cutoff='2022-05-01T00:00/UTC') -> OrgCalendar:
+        '''Archives the past events of the remote calendar, returns the remaining ones'''
+        archive = Archive.load(self.orgfile)
+        remaining = archive.archive_past(self.remote['C0'], dt(cutoff))
+        archive.save()
+        return remaining
+
+    def test_archive_past(self):
+        self.assertEqual(['I2', 'I3'], list(self.archived().events))
+
+        dirname = Archive.path_for(self.orgfile)
+        self.assertEqual(['2022-01.org', '2022-02.org', ARCHIVE_INDEX], sorted(os.listdir(dirname)))
+        with open(os.path.join(dirname, ARCHIVE_INDEX)) as f:
+            self.assertEqual({'C0' : {'I0' : '2022-01', 'I1' : '2022-02'}}, json.load(f))
+
+        archive = Archive.load(self.orgfile)
+        self.assertIn(('C0', 'I0'), archive)
+        self.assertNotIn(('C0', 'I2'), archive)
+        self.assertNotIn(('C1', 'I0'), archive)
+        # Archived as they were
+        ev = archive.take('C0', 'I1')
+        self.assertEqual('Older', ev.name)
+        self.assertEqual(dt('2022-02-01T10:00/UTC'), ev.start)
+        self.assertEqual(dt('2022-02-01T11:00/UTC'), ev.end)
+
+    def test_nothing_to_archive(self):
+        self.assertIs(self.remote['C0'], self.archived(cutoff='2021-01-01T00:00/UTC'))
+        self.assertFalse(os.path.exists(Archive.path_for(self.orgfile)))
+
+    def test_split_remote(self):
+        self.archived()
+        base = SyncState.from_calendars(self.remote).base
+        self.remote['C0'].events['I1'].name = 'Older, renamed'
+
+        archive = Archive.load(self.orgfile)
+        remote, revived = archive.split_remote(self.remote, base)
+        # Unchanged archived events stay out of the merge; changed ones go back in, with their archived copy
+        self.assertEqual(['I1', 'I2', 'I3'], list(remote['C0'].events))
+        self.assertEqual({'C0' : ['Older']}, {caluid : [ev.name for ev in events] for caluid, events in revived.items()})
+        self.assertNotIn(('C0', 'I1'), archive)
+
+        archive.save()
+        self.assertEqual(['2022-01.org', ARCHIVE_INDEX], sorted(os.listdir(Archive.path_for(self.orgfile))))
+        self.assertNotIn(('C0', 'I1'), Archive.load(self.orgfile))
+
+    def test_unreadable_index(self):
+        os.makedirs(Archive.path_for(self.orgfile))
+        with open(os.path.join(Archive.path_for(self.orgfile), ARCHIVE_INDEX), 'w') as f:
+            f.write('{')
+        with self.assertRaises(ValueError):
+            Archive.load(self.orgfile)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -51,6 +51,16 @@ class TestCalTime(unittest.TestCase):
         self.assertEqual('03:59', t.time_str())
         self.assertEqual('Fri', t.weekday_str())
 
+    def test_strings_like_strftime(self):
+        t = dt('2022-12-25T07:05')
+        for _ in range(400):
+            t = t + timedelta(hours=13, minutes=17)
+            self.assertEqual(t.strftime('%Y-%m-%d') + ' ' + CalTime.WEEKDAYS[t.weekday(WEEKSTART_MON)], t.date_str())
+            self.assertEqual(t.strftime('%H:%M'), t.time_str())
+            self.assertEqual(t.strftime('%Y-%m-%dT%H:%M'), t.to_str())
+        # Memoised per day, not per time
+        self.assertIs(dt('2023-01-02T08:00').date_str(), dt('2023-01-02T19:30').date_str())
+
     def test_null(self):
         t = self.converter.time_from_evolution(MockTS(2022, 7, 29, 3, 59, null_time=True))
         self.assertIs(None, t)
@@ -852,5 +862,66 @@ class TestRecurrence(unittest.TestCase):
                           ],
                          [tstamp.astimezone(None) for tstamp in  take(it.all(), 10)])
 
+    def test_exclusions(self):
+        rec = self.converter.recurrence_from_evolution(MockRecurrence(I_DAY, 1, 6))
+        every_other_day = self.converter.recurrence_from_evolution(MockRecurrence(I_DAY, 2, 0))
+        start = self.dt('2022-01-01T10:00/UTC')
+        exclusions = Exclusions([self.dt('2022-01-04T10:00/UTC')], [every_other_day])
+
+        it = rec.range_from(start, Exclusions([self.dt('2022-01-04T10:00/UTC')]))
+        # Excluded dates still count towards the recurrence count
+        self.assertEqual([self.dt(f'2022-01-{d:02}T10:00/UTC') for d in [1, 2, 3, 5, 6]], take(it.all(), 10))
+        self.assertEqual([self.dt(f'2022-01-{d:02}T10:00/UTC') for d in [3, 5, 6]],
+                         take(it.starting(self.dt('2022-01-03T00:00/UTC')), 10))
+
+        it = rec.range_from(start, exclusions)
+        self.assertEqual([self.dt(f'2022-01-{d:02}T10:00/UTC') for d in [2, 6]], take(it.all(), 10))
+
+        # Exclusions for end dates
+        it = rec.range_from(self.dt('2022-01-01T11:00/UTC'), exclusions.shifted(timedelta(hours=1)))
+        self.assertEqual([self.dt(f'2022-01-{d:02}T11:00/UTC') for d in [2, 6]], take(it.all(), 10))
+
+    def test_starting_skips_ahead(self):
+        '''starting() skips whole periods of fixed increments (counting them), with the same result as filtering all()'''
+        rules = [MockRecurrence(I_MINUTE, 15, 0),
+                 MockRecurrence(I_HOUR, 5, 0, until=MockTS(2023, 1, 1, 0, 0, tzid='Europe/Berlin')),
+                 MockRecurrence(I_DAY, 3, 0),
+                 MockRecurrence(I_DAY, 1, 40),
+                 MockRecurrence(I_WEEK, 2, 0, by_day_array=[2, 4, 5] + ([32639] * 383)),
+                 MockRecurrence(I_WEEK, 1, 20, by_day_array=[2, 4, 5] + ([32639] * 383)),
+                 MockRecurrence(I_WEEK, 1, 0, by_day_array=[1, 7] + ([32639] * 384), week_start=I_CAL_SUNDAY_WEEKDAY),
+                 MockRecurrence(I_MONTH, 1, 0)]
+        exclusions = Exclusions([self.dt('2022-04-01T10:00/Europe/Berlin')],
+                                [self.converter.recurrence_from_evolution(MockRecurrence(I_DAY, 7, 0))])
+        for occ in rules:
+            rec = self.converter.recurrence_from_evolution(occ)
+            for excluded in [None, exclusions]:
+                it = rec.range_from(self.dt('2022-01-11T10:00/Europe/Berlin'), excluded)
+                for since in ['2022-01-01T00:00', '2022-01-11T10:00', '2022-01-12T09:59', '2022-03-27T02:30',
+                              '2022-04-01T10:00', '2022-10-30T02:30', '2023-06-01T00:00']:
+                    start = self.dt(f'{since}/Europe/Berlin')
+                    expected = take((t for t in it.all() if t >= start), 20)
+                    self.assertEqual(expected, take(it.starting(start), 20), f'{rec} from {since}')
+
+    def test_rrule(self):
+        for occ, rrule in [(MockRecurrence(I_DAY, 2, 0), 'FREQ=DAILY;INTERVAL=2'),
+                           (MockRecurrence(I_MONTH, 1, 0), 'FREQ=MONTHLY;INTERVAL=1'),
+                           (MockRecurrence(I_WEEK, 1, 0, by_day_array=[2, 4, 5] + ([32639] * 383)),
+                            'FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,WE,TH;WKST=MO'),
+                           (MockRecurrence(I_WEEK, 2, 0, by_day_array=[1, 3] + ([32639] * 384),
+                                           week_start=I_CAL_SUNDAY_WEEKDAY),
+                            'FREQ=WEEKLY;INTERVAL=2;BYDAY=SU,TU;WKST=SU'),
+                           ]:
+            rec = self.converter.recurrence_from_evolution(occ)
+            self.assertEqual(rrule, rec.rrule())
+            self.assertEqual(str(rec), str(self.converter.recurrence_from_rrule(rrule)))
+
+        # org can't express these natively
+        self.assertIs(None, self.converter.recurrence_from_evolution(MockRecurrence(I_DAY, 1, 5)).rrule())
+        self.assertIs(None, self.converter.recurrence_from_evolution(
+            MockRecurrence(I_MONTH, 1, 0, by_month_day_array=[15] + ([32639] * 31))).rrule())
+        with self.assertRaises(ValueError):
+            self.converter.recurrence_from_rrule('FREQ=SECONDLY;INTERVAL=1')
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,100 @@
+# This file is Copyright (C) 2022 Christoph Reichenbach
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the
+#   Free Software Foundation, Inc.
+#   59 Temple Place, Suite 330
+#   Boston, MA  02111-1307
+#   USA
+#
+# The author can be reached as "creichen" at the usual gmail server.
+
+from __future__ import annotations
+
+import io
+import unittest
+import caltime
+import tzresolve
+import event
+from event import MergingDict
+from dedup import *
+from org_events import OrgCalendar, OrgEventUnparser
+
+
+cconv = caltime.CalConverter(tzresolve.TZResolver(None))
+
+def mk_event(evid, name):
+    ev = event.EventRepeater(evid, name, cconv.time_from_str('2022-01-03T10:00/UTC'))
+    ev.end = cconv.time_from_str('2022-01-03T11:00/UTC')
+    return ev
+
+def calendars():
+    cals = MergingDict()
+    cals['C0'] = OrgCalendar('Personal', 'C0', [mk_event('I0', 'Only here'), mk_event('I1', 'Shared')])
+    cals['C1'] = OrgCalendar('Team', 'C1', [mk_event('I1', 'Shared'), mk_event('I2', 'Team only')])
+    cals['C2'] = OrgCalendar('Other', 'C2', [mk_event('I1', 'Shared'), mk_event('I2', 'Team only')])
+    return cals
+
+def event_ids(cals):
+    return {caluid : list(cal.events) for caluid, cal in cals.items()}
+
+
+class TestDedup(unittest.TestCase):
+
+    def test_index(self):
+        cals = calendars()
+        index = UIDIndex(cals, list(cals))
+        self.assertEqual(3, len(index))
+        self.assertEqual(3, index.duplicates())
+        self.assertEqual(['C0', 'C1', 'C2'], index.calendars('I1'))
+        self.assertEqual('C1', index.owner('I2'))
+
+    def test_first(self):
+        self.assertEqual({'C0' : ['I0', 'I1'], 'C1' : ['I2'], 'C2' : []},
+                         event_ids(deduplicate(calendars(), DedupPolicy('first'))))
+
+    def test_prefer(self):
+        self.assertEqual({'C0' : ['I0'], 'C1' : [], 'C2' : ['I1', 'I2']},
+                         event_ids(deduplicate(calendars(), DedupPolicy('prefer:C2,C9'))))
+
+    def test_link(self):
+        cals = deduplicate(calendars(), DedupPolicy('link'))
+        self.assertEqual({'C0' : ['I0', 'I1'], 'C1' : ['I2'], 'C2' : []}, event_ids(cals))
+        self.assertEqual({'I1' : ['Team', 'Other']}, cals['C0'].links)
+
+        f = io.StringIO()
+        OrgEventUnparser(f, local_timezone=None, today=cconv.time_from_str('2022-01-03')).unparse_all(cals)
+        self.assertIn('''** TODO Shared
+  SCHEDULED: <2022-01-03 Mon 10:00-11:00>
+  :PROPERTIES:
+  :CALEVENT-UID: I1
+  :ALSO-IN: Team, Other
+  :END:
+''', f.getvalue())
+
+    def test_stream(self):
+        local = calendars()
+        local['C2'].events.add(mk_event('I7', 'Local only'))
+        stream = deduplicate_stream(((cal, cal.events.values()) for cal in local.values()), calendars(),
+                                    DedupPolicy('first'))
+        self.assertEqual({'C0' : ['I0', 'I1'], 'C1' : ['I2'], 'C2' : ['I7']},
+                         {cal.uid : [ev.key for ev in events] for cal, events in stream})
+
+    def test_bad_policy(self):
+        for spec in ['last', 'prefer:']:
+            with self.assertRaises(ValueError):
+                DedupPolicy(spec)
+
+
+if __name__ == '__main__':
+    unittest.main()
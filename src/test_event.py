@@ -23,6 +23,7 @@ from __future__ import annotations
 
 import unittest
 import itertools
+import pickle
 import caltime
 import tzresolve
 from event import *
@@ -47,6 +48,17 @@ class TestMerge(unittest.TestCase):
             dtest(XSTATE, XSTATE, t)
 
 
+    def test_event_state_codes(self):
+        self.assertIs(TODO, EventState.get('TODO'))
+        self.assertIs(DONE, EventState.BY_CODE[DONE.code])
+        self.assertIs(DONE, pickle.loads(pickle.dumps(DONE)))
+        with self.assertRaises(KeyError):
+            EventState.get('NO-SUCH-STATE')
+        ystate = EventState.register('YSTATE')
+        self.assertIs(ystate, EventState.register('YSTATE'))
+        self.assertIs(ystate, ystate.merge(TODO))
+        self.assertIs(CANCELLED, CANCELLED.merge(ystate))
+
     def test_event_string_list_merge(self):
         e = EventStringList()
         self.assertEqual(e, e.merge(e))
@@ -78,6 +90,18 @@ class TestMerge(unittest.TestCase):
             for n in ['2', '3', 'foo', 'bar']:
                 self.assertTrue(n in m)
 
+    def test_event_string_list_order_and_interning(self):
+        l = EventStringList(['c', 'a'])
+        r = EventStringList(['b', ''.join(['a']), 'd', 'c'])
+        m = l.merge(r)
+        self.assertEqual(['c', 'a', 'b', 'd'], list(m))
+        self.assertIs(l[1], r[1])
+        self.assertEqual(EventStringList(['c', 'a', 'b', 'd']), m)
+        self.assertEqual(['c', 'a', 'b', 'd'], m)
+        self.assertEqual(hash(m), hash(EventStringList(m)))
+        self.assertEqual(['b', 'd'], list(r.difference(l)))
+        self.assertNotEqual(l, r)
+
 
 cconv = caltime.CalConverter(tzresolve.TZResolver(None))
 
@@ -161,6 +185,176 @@ class TestEvent(unittest.TestCase):
             self.assertEqual(10, e.start.hour)
             self.assertEqual(11, e.end.hour)
 
+    def test_fresh_defaults(self):
+        '''Events don't share their default containers'''
+        for mk in [lambda evid: EventRepeater(evid, 'Test', dt('2022-01-01T10:00/UTC')), CalEvent]:
+            ev0, ev1 = mk('I0'), mk('I1')
+            # Attendee lists are immutable, so they may share the default
+            self.assertEqual(EventStringList(), ev1.attendees)
+            self.assertIsNot(ev0.recurrences, ev1.recurrences)
+            ev0.recurrences.append(daily())
+            self.assertEqual([], ev1.recurrences)
+
+    def test_occurrence_reads_base(self):
+        ev = mk_event('I0', 'Test',
+                      start=dt('2022-01-01T10:00/UTC'),
+                      end=dt(  '2022-01-01T11:00/UTC'),
+                      location='Room 1',
+                      recurrences=[daily(3)])
+
+        evs = list(ev.in_interval(start=None, end=dt('2022-01-03T15:00/UTC')))
+        self.assertEqual(3, len(evs))
+        ev.name = 'Renamed'
+        for e in evs:
+            self.assertIsInstance(e, Occurrence)
+            self.assertIs(ev, e.base_event)
+            self.assertEqual('Renamed', e.name)
+            self.assertEqual('Room 1', e.location)
+            self.assertEqual(None, e.get_conflict_event())
+        self.assertEqual(dt('2022-01-03T10:00/UTC'), evs[2].start)
+        self.assertEqual({}, evs[2].diff(evs[2]))
+        self.assertRaises(AttributeError, lambda: setattr(evs[0], 'name', 'Other'))
+
+    def test_event_set_interval_query(self):
+        evs = EventSet()
+        evs.add(mk_event('I0', 'Once',
+                         start=dt('2022-01-01T10:00/UTC'),
+                         end=dt(  '2022-01-01T11:00/UTC'),
+                         recurrences=[]))
+        evs.add(mk_event('I1', 'Daily forever',
+                         start=dt('2022-01-02T10:00/UTC'),
+                         end=dt(  '2022-01-02T11:00/UTC'),
+                         recurrences=[daily()]))
+        evs.add(mk_event('I2', 'Daily, three times',
+                         start=dt('2022-01-01T12:00/UTC'),
+                         end=dt(  '2022-01-01T13:00/UTC'),
+                         recurrences=[daily(3)]))
+
+        self.assertEqual(dt('2022-01-03T13:00/UTC').timestamp(), evs['I2'].time_bounds()[1])
+
+        def ids_in(start, end):
+            return [(e.event_id, e.start.day) for e in evs.in_interval(dt(start), dt(end))]
+
+        self.assertEqual([('I0', 1), ('I2', 1)], ids_in('2022-01-01T00:00/UTC', '2022-01-01T23:00/UTC'))
+        self.assertEqual([('I1', 10)], ids_in('2022-01-10T00:00/UTC', '2022-01-10T23:00/UTC'))
+
+        evs.add(mk_event('I3', 'Late',
+                         start=dt('2022-01-10T20:00/UTC'),
+                         end=dt(  '2022-01-10T21:00/UTC'),
+                         recurrences=[]))
+        self.assertEqual([('I1', 10), ('I3', 10)], ids_in('2022-01-10T00:00/UTC', '2022-01-10T23:00/UTC'))
+
+    def test_event_set_chronological(self):
+        evs = EventSet()
+        evs.add(mk_event('I0', 'Daily forever',
+                         start=dt('2022-01-01T10:00/UTC'),
+                         end=dt(  '2022-01-01T11:00/UTC'),
+                         recurrences=[daily()]))
+        evs.add(mk_event('I1', 'Daily, twice',
+                         start=dt('2022-01-01T09:00/UTC'),
+                         end=dt(  '2022-01-01T09:30/UTC'),
+                         recurrences=[daily(2)]))
+        evs.add(mk_event('I2', 'Once',
+                         start=dt('2022-01-02T12:00/UTC'),
+                         end=dt(  '2022-01-02T13:00/UTC'),
+                         recurrences=[]))
+
+        stream = evs.chronological(dt('2022-01-01T00:00/UTC'))
+        self.assertEqual([('I1', 1), ('I0', 1), ('I1', 2), ('I0', 2), ('I2', 2), ('I0', 3), ('I0', 4)],
+                         [(e.event_id, e.start.day) for e in itertools.islice(stream, 7)])
+
+        self.assertEqual([('I0', 2), ('I2', 2)],
+                         [(e.event_id, e.start.day) for e in evs.chronological(dt('2022-01-02T10:00/UTC'),
+                                                                               dt('2022-01-02T23:00/UTC'))])
+
+    def test_detached_instances(self):
+        def moved(evid, day, hour, name='Moved'):
+            return mk_event(evid, name,
+                            start=dt(f'2022-01-{day:02}T{hour:02}:00/UTC'),
+                            end=dt(  f'2022-01-{day:02}T{hour:02}:30/UTC'),
+                            recurrence_id=dt(f'2022-01-{day:02}T10:00/UTC'),
+                            recurrences=[])
+
+        def series(evid):
+            return mk_event(evid, 'Daily',
+                            start=dt('2022-01-01T10:00/UTC'),
+                            end=dt(  '2022-01-01T11:00/UTC'),
+                            recurrences=[daily(5)])
+
+        evs = EventSet()
+        evs.add(moved('I0', 2, 8))   # before its recurring event
+        evs.add(series('I0'))
+        evs.add(moved('I0', 4, 12))  # after its recurring event
+        evs.add(moved('I1', 3, 12))  # no recurring event
+        self.assertEqual(['I0', ('I1', recurrence_key(dt('2022-01-03T10:00/UTC')))], list(evs))
+
+        self.assertEqual([('Daily', 1, 10), ('Moved', 2, 8), ('Daily', 3, 10), ('Moved', 4, 12), ('Daily', 5, 10)],
+                         [(e.name, e.start.day, e.start.hour) for e in evs['I0'].in_interval(None, None)])
+        self.assertEqual(['Moved'], [e.name for e in evs.in_interval(dt('2022-01-02T07:00/UTC'),
+                                                                     dt('2022-01-02T08:10/UTC'))])
+
+        # The other (remote) side decides which occurrences are detached; instances on both sides are merged
+        other = EventSet()
+        other.add(series('I0'))
+        other.add(moved('I0', 4, 12))
+        other.add(moved('I0', 5, 7, name='Early'))
+        other.add(series('I1'))
+        merged = evs.merge(other)
+        self.assertEqual(['I0', 'I1'], list(merged))
+        self.assertEqual(['Daily', 'Daily', 'Daily', 'Moved', 'Early'],
+                         [e.name for e in merged['I0'].in_interval(None, None)])
+        self.assertEqual(['Daily', 'Daily', 'Moved', 'Daily', 'Daily'],
+                         [e.name for e in merged['I1'].in_interval(None, None)])
+
+    def test_remote_recurrence_removal(self):
+        def mk(**args):
+            return mk_event('I0', 'Weekly',
+                            start=dt('2022-01-03T10:00/UTC'),
+                            end=dt(  '2022-01-03T11:00/UTC'),
+                            **args)
+
+        weekly = caltime.CalConverter(tzresolve.TZResolver(None)).recurrence_from_rrule('FREQ=WEEKLY;INTERVAL=1')
+        local = mk(recurrences=[weekly])
+        remote = mk(recurrences=[])
+        merged = local.merge(remote)
+        self.assertEqual([], merged.recurrences)
+        self.assertEqual([3], [e.start.day for e in merged.in_interval(None, None)])
+
+        # ... but copies from the same source keep the rules that either of them has
+        self.assertEqual([weekly], local.merge(remote, remote=False).recurrences)
+        self.assertEqual([weekly], remote.merge(local, remote=False).recurrences)
+
+    def test_exclusions(self):
+        ev = mk_event('I0', 'Daily',
+                      start=dt('2022-01-01T10:00/UTC'),
+                      end=dt(  '2022-01-01T11:00/UTC'),
+                      recurrences=[daily(5)],
+                      exclusions=caltime.Exclusions([dt('2022-01-02T10:00/UTC'), dt('2022-01-04T10:00/UTC')]))
+        self.assertEqual([(1, 10, 11), (3, 10, 11), (5, 10, 11)],
+                         [(e.start.day, e.start.hour, e.end.hour) for e in ev.in_interval(None, None)])
+
+    def test_pickle(self):
+        ev = mk_event('I0', 'Daily',
+                      start=dt('2022-01-01T10:00/Europe/Berlin'),
+                      end=dt(  '2022-01-01T11:00/Europe/Berlin'),
+                      recurrences=[daily(5)],
+                      exclusions=caltime.Exclusions([dt('2022-01-02T10:00/Europe/Berlin')]),
+                      attendees=EventStringList(['a@b.c']),
+                      status=DONE,
+                      evo_event=object())
+        proxy = ev.merge(mk_event('I0', 'Daily', start=ev.start, end=ev.end, location='Room 1', evo_event=object(),
+                                  recurrences=ev.recurrences, exclusions=ev.exclusions))
+
+        copy = pickle.loads(pickle.dumps(proxy))
+        self.assertIs(DONE, copy.status)
+        self.assertEqual('Room 1', copy.location)
+        self.assertIsNone(copy.evo_event)
+        self.assertEqual(ev.start, copy.start)
+        self.assertIs(caltime.CalTime, type(copy.start))
+        self.assertEqual(proxy.content_key, copy.content_key)
+        self.assertEqual([(e.start.day) for e in ev.in_interval(None, None)],
+                         [(e.start.day) for e in copy.in_interval(None, None)])
+
     def test_diff_trivial(self):
         ev0 = mk_event('I0', 'Test',
                        start=dt('2022-01-01T10:00/UTC'),
@@ -209,6 +403,28 @@ class TestEvent(unittest.TestCase):
             self.assertEqual((False, swap_if_needed("A", "B")), diff['description'])
             self.assertEqual(1, len(diff))
 
+    def test_content_key(self):
+        def mk(end, **args):
+            return mk_event('I0', 'Test',
+                            start=dt('2022-01-01T10:00/UTC'),
+                            end=end,
+                            recurrences=[], **args)
+
+        ev0 = mk(dt('2022-01-01T11:00/UTC'), description='Potato salad')
+        ev1 = mk(dt('2022-01-01T12:00/UTC'), description='Potato salad\n')
+        self.assertEqual(ev0.content_key, ev1.content_key)
+        ev1.start = dt('2022-01-01T11:00/Europe/Berlin')
+        self.assertEqual(ev0.content_key, ev1.content_key)
+
+        ev1.description = 'Tomato salad'
+        self.assertNotEqual(ev0.content_key, ev1.content_key)
+        self.assertEqual({'description'}, ev0.diff(ev1, Event.COMPARED_PROPERTIES).keys())
+
+        # Proxies and occurrences have the content of their own fields
+        self.assertEqual(ev0.content_key, ProxyEvent(ev0, None).content_key)
+        self.assertNotEqual(ev0.content_key, ProxyEvent(ev0, None, status=DONE).content_key)
+        self.assertEqual(ev0.content_key, list(ev0.in_interval(None, dt('2022-01-02T00:00/UTC')))[0].content_key)
+
     def test_merge_trivial(self):
         ev0 = mk_event('I0', 'Test',
                        start=dt('2022-01-01T10:00/UTC'),
@@ -268,3 +484,18 @@ class TestEvent(unittest.TestCase):
         self.assertEqual('A', m.description)
         self.assertEqual(DONE, m.status)
         self.assertIs(ev1, m.get_conflict_event())
+
+    def test_merge_conflict_explanation(self):
+        '''Conflict explanations replace those from earlier conflicts instead of piling up'''
+        ev0 = mk_event('I0', 'Test', start=dt('2022-01-01T10:00/UTC'), end=dt('2022-01-01T11:00/UTC'),
+                       description='A', status=TODO, recurrences=[])
+        ev1 = mk_event('I0', 'Test', start=dt('2022-01-01T10:00/UTC'), end=dt('2022-01-01T11:00/UTC'),
+                       description='B', status=DONE, recurrences=[])
+        conflict = ev0.merge(ev1).get_conflict_event()
+        self.assertEqual(1, conflict.description.count(CONFLICT_EXPLANATION))
+        self.assertTrue(conflict.description.startswith('B' + CONFLICT_EXPLANATION))
+
+        ev1.description = conflict.description
+        again = ev0.merge(ev1).get_conflict_event()
+        self.assertEqual(1, again.description.count(CONFLICT_EXPLANATION))
+        self.assertTrue(again.description.startswith('B' + CONFLICT_EXPLANATION))
@@ -0,0 +1,123 @@
+# This file is Copyright (C) 2022 Christoph Reichenbach
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the
+#   Free Software Foundation, Inc.
+#   59 Temple Place, Suite 330
+#   Boston, MA  02111-1307
+#   USA
+#
+# The author can be reached as "creichen" at the usual gmail server.
+
+from __future__ import annotations
+
+import unittest
+import caltime
+import tzresolve
+import event
+import event_table
+from event_table import *
+
+
+cconv = caltime.CalConverter(tzresolve.TZResolver(None))
+
+def dt(s):
+    return cconv.time_from_str(s)
+
+def mk_event(evid, name, start, end, **args):
+    ev = event.EventRepeater(evid, name, start)
+    ev.end = end
+    for k, v in args.items():
+        setattr(ev, k, v)
+    return ev
+
+
+class TestEventTable(unittest.TestCase):
+
+    def mk_table(self):
+        return EventTable([
+            mk_event('I0', 'Old', start=dt('2022-01-01T10:00/UTC'), end=dt('2022-01-01T11:00/UTC'),
+                     location='Room 1'),
+            mk_event('I1', 'Daily', start=dt('2021-12-01T10:00/UTC'), end=dt('2021-12-01T11:00/UTC'),
+                     recurrences=[cconv.daily_recurrence()], status=event.DONE),
+            mk_event('I2', 'New', start=dt('2022-02-01T10:00/UTC'), end=dt('2022-02-01T11:00/UTC'),
+                     location='Room 1'),
+            mk_event('I3', 'Old', start=dt('2022-01-10T10:00/UTC'), end=None),
+        ], [0, 0, 1, 1])
+
+    def check_table(self):
+        table = self.mk_table()
+        def ids(events):
+            return [e.event_id for e in events]
+
+        self.assertEqual(4, len(table))
+        self.assertEqual(['I1', 'I2'], ids(table.select(table.active_after(dt('2022-01-15T00:00/UTC')))))
+        self.assertEqual(['I0', 'I1', 'I3'], ids(table.select(table.overlapping(dt('2022-01-01T10:30/UTC'),
+                                                                                dt('2022-01-10T10:00/UTC')))))
+        self.assertEqual(['I1', 'I0', 'I3', 'I2'], ids(table.by_start()))
+        self.assertEqual(['I0', 'I3', 'I2'], ids(table.by_start(table.with_status(event.TODO))))
+        self.assertEqual({event.TODO : 3, event.DONE : 1}, table.status_counts())
+        self.assertEqual({event.TODO : 1, event.DONE : 1}, table.status_counts(table.active_after(dt('2022-01-15T00:00/UTC'))))
+        self.assertEqual([], table.select(table.with_status(event.CANCELLED)))
+
+        self.assertEqual(['Old', 'Daily', 'New'], table.name.strings)
+        self.assertEqual('Old', table.name[3])
+        self.assertEqual(['Room 1', ''], table.location.strings)
+        self.assertEqual([0, 0, 1, 1], list(table.calendar))
+        self.assertEqual([0, 1, 0, 0], list(table.recurring))
+        self.assertEqual(table.start[3], table.end[3])
+
+    def test_table(self):
+        self.check_table()
+
+    def test_table_without_numpy(self):
+        numpy = event_table.numpy
+        event_table.numpy = None
+        try:
+            self.check_table()
+        finally:
+            event_table.numpy = numpy
+
+    def test_event_set_table(self):
+        '''EventSets keep their table (and the index built from it) until they change'''
+        events = event.EventSet()
+        for ev in self.mk_table().events:
+            events.add(ev)
+        table = events.table
+        self.assertIs(table, events.table)
+        self.assertEqual(['I0', 'I1', 'I2', 'I3'], [e.event_id for e in table.events])
+        self.assertEqual(['I1', 'I0', 'I3'], [e.event_id for e in events.overlapping(dt('2022-01-01T10:30/UTC'),
+                                                                                       dt('2022-01-10T10:00/UTC'))])
+        del events['I0']
+        self.assertEqual(['I1', 'I2', 'I3'], [e.event_id for e in events.table.events])
+        self.assertEqual(['I1', 'I3'], [e.event_id for e in events.overlapping(dt('2022-01-01T10:30/UTC'),
+                                                                                dt('2022-01-10T10:00/UTC'))])
+
+    def test_event_set_index_updates(self):
+        '''Changing an EventSet after a query updates its index, rather than rebuilding it'''
+        events = event.EventSet()
+        events.add(mk_event('I0', 'Old', start=dt('2022-01-01T10:00/UTC'), end=dt('2022-01-01T11:00/UTC')))
+        self.assertEqual(['I0'], [e.event_id for e in events.overlapping(dt('2022-01-01T00:00/UTC'), None)])
+        index = events.index
+        events.add(mk_event('I1', 'Earlier', start=dt('2021-12-31T10:00/UTC'), end=dt('2022-01-01T10:30/UTC')))
+        events['I0'] = mk_event('I0', 'Moved', start=dt('2022-03-01T10:00/UTC'), end=dt('2022-03-01T11:00/UTC'))
+        self.assertIs(index, events.index)
+        self.assertEqual(['I1'], [e.event_id for e in events.overlapping(dt('2022-01-01T00:00/UTC'),
+                                                                         dt('2022-02-01T00:00/UTC'))])
+        self.assertEqual(['I1', 'I0'], [e.event_id for e in events.overlapping(dt('2022-01-01T00:00/UTC'), None)])
+        del events['I1']
+        self.assertEqual(['Moved'], [e.name for e in events.overlapping(dt('2022-01-01T00:00/UTC'), None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
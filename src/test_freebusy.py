@@ -0,0 +1,99 @@
+# This file is Copyright (C) 2022 Christoph Reichenbach
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the
+#   Free Software Foundation, Inc.
+#   59 Temple Place, Suite 330
+#   Boston, MA  02111-1307
+#   USA
+#
+# The author can be reached as "creichen" at the usual gmail server.
+
+from __future__ import annotations
+
+import io
+import unittest
+import caltime
+import tzresolve
+import event
+from event import MergingDict
+from freebusy import *
+from org_events import OrgCalendar, OrgEventParser, OrgEventUnparser
+
+
+cconv = caltime.CalConverter(tzresolve.TZResolver(None))
+
+def dt(s):
+    return cconv.time_from_str(s)
+
+def mk_event(evid, name, start, end, **args):
+    ev = event.EventRepeater(evid, name, dt(start))
+    ev.end = dt(end)
+    for k, v in args.items():
+        setattr(ev, k, v)
+    return ev
+
+def calendars():
+    cals = MergingDict()
+    cals['C0'] = OrgCalendar('CAL0', 'C0', [
+        mk_event('I0', 'Standup', '2022-01-03T09:00/UTC', '2022-01-03T09:15/UTC',
+                 recurrences=[cconv.daily_recurrence()]),
+        mk_event('I1', 'Review', '2022-01-03T10:00/UTC', '2022-01-03T11:00/UTC'),
+        mk_event('I2', 'Holiday', '2022-01-04T00:00/UTC', '2022-01-05T00:00/UTC'),
+    ])
+    cals['C1'] = OrgCalendar('CAL1', 'C1', [
+        mk_event('I3', 'Dentist', '2022-01-03T10:30/UTC', '2022-01-03T11:30/UTC'),
+        mk_event('I4', 'Lunch', '2022-01-03T11:30/UTC', '2022-01-03T12:30/UTC'),
+        mk_event('I5', 'Cancelled', '2022-01-03T09:00/UTC', '2022-01-03T10:00/UTC', status=event.CANCELLED),
+    ])
+    return cals
+
+
+class TestFreeBusy(unittest.TestCase):
+
+    def test_sweep(self):
+        report = FreeBusyReport(calendars(), dt('2022-01-03T00:00/UTC'), dt('2022-01-04T23:59/UTC'))
+        self.assertEqual([(dt('2022-01-03T09:00/UTC'), dt('2022-01-03T09:15/UTC')),
+                          (dt('2022-01-03T10:00/UTC'), dt('2022-01-03T12:30/UTC')),
+                          (dt('2022-01-04T09:00/UTC'), dt('2022-01-04T09:15/UTC'))],
+                         report.busy)
+        self.assertEqual([['Review', 'Dentist']], [[occ.name for _, occ in group] for group in report.overlaps])
+
+        _, busy, overlaps = report.per_calendar['C1']
+        self.assertEqual([(dt('2022-01-03T10:30/UTC'), dt('2022-01-03T12:30/UTC'))], busy)
+        self.assertEqual([], overlaps)
+
+    def test_org_section(self):
+        f = io.StringIO()
+        unparser = OrgEventUnparser(f, local_timezone=None, today=dt('2022-01-03'))
+        cals = calendars()
+        unparser.unparse_all(cals)
+        unparser.unparse_freebusy(FreeBusyReport(cals, dt('2022-01-03T00:00/UTC'), dt('2022-01-04T00:00/UTC')))
+        s = f.getvalue()
+        self.assertIn('''* Free/busy
+  :PROPERTIES:
+  :FREEBUSY-WINDOW: [2022-01-03 Mon 00:00]--[2022-01-04 Tue 00:00]
+  :END:
+** All calendars
+- busy: [2022-01-03 Mon 09:00-09:15]
+- busy: [2022-01-03 Mon 10:00-12:30]
+- overlap: [2022-01-03 Mon 10:00-11:30] Review (CAL0), Dentist (CAL1)
+** CAL0
+''', s)
+
+        parsed = OrgEventParser(local_timezone=None).loads(s)
+        self.assertEqual(['C0', 'C1'], list(parsed))
+
+
+if __name__ == '__main__':
+    unittest.main()
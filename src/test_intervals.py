@@ -0,0 +1,75 @@
+# This file is Copyright (C) 2022 Christoph Reichenbach
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the
+#   Free Software Foundation, Inc.
+#   59 Temple Place, Suite 330
+#   Boston, MA  02111-1307
+#   USA
+#
+# The author can be reached as "creichen" at the usual gmail server.
+
+from __future__ import annotations
+
+import math
+import random
+import unittest
+from intervals import *
+
+
+class TestIntervalIndex(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual([], IntervalIndex([]).overlapping(0, 10))
+
+    def test_overlapping(self):
+        index = IntervalIndex([('a', 0, 10), ('b', 5, 6), ('c', 20, math.inf), ('d', 11, 19)])
+        self.assertEqual(['a', 'b'], index.overlapping(5, 5))
+        self.assertEqual(['a'], index.overlapping(10, 10))
+        self.assertEqual(['a', 'b', 'd', 'c'], index.overlapping(-5, 100))
+        self.assertEqual(['c'], index.overlapping(10000, 20000))
+        self.assertEqual([], index.overlapping(-5, -1))
+
+    def test_against_scan(self):
+        rnd = random.Random(42)
+        intervals = []
+        for i in range(500):
+            lo = rnd.randrange(0, 1000)
+            intervals.append((i, lo, lo + rnd.randrange(0, 50)))
+        index = IntervalIndex(intervals)
+        for _ in range(200):
+            lo = rnd.randrange(-10, 1100)
+            hi = lo + rnd.randrange(0, 100)
+            expected = sorted(k for k, l, h in intervals if l <= hi and h >= lo)
+            self.assertEqual(expected, sorted(index.overlapping(lo, hi)))
+
+    def test_updates_against_scan(self):
+        rnd = random.Random(23)
+        intervals = {}
+        index = IntervalIndex([])
+        for i in range(2000):
+            key = rnd.randrange(0, 300)
+            if rnd.random() < 0.2:
+                intervals.pop(key, None)
+                index.remove(key)
+            else:
+                lo = rnd.randrange(0, 1000)
+                intervals[key] = (lo, lo + rnd.randrange(0, 50))
+                index.add(key, *intervals[key])
+            self.assertEqual(len(intervals), len(index))
+            if i % 10 == 0:
+                lo = rnd.randrange(-10, 1100)
+                hi = lo + rnd.randrange(0, 100)
+                result = index.overlapping(lo, hi)
+                self.assertEqual(sorted(k for k, (l, h) in intervals.items() if l <= hi and h >= lo), sorted(result))
+                self.assertEqual(sorted(intervals[k][0] for k in result), [intervals[k][0] for k in result])
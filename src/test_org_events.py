@@ -23,10 +23,12 @@ from __future__ import annotations
 
 import io
 import unittest
+import unittest.mock
 import itertools
 import caltime
 import tzresolve
 import event
+import org_events
 from org_events import *
 from test_mock import mock_class
 
@@ -115,6 +117,35 @@ A
 B
 ''', getstr())
 
+    def test_conflict_depth(self):
+        '''Chains of conflicts are cut off at max_conflict_depth, and repeated conflicts left out'''
+        evs = [mk_event('I0', f'Test {i}', start=dt('2022-01-01T10:00/UTC'), end=dt('2022-01-01T11:00/UTC'))
+               for i in range(4)]
+        chain = evs[3]
+        for ev in reversed(evs[:3]):
+            chain = event.ProxyEvent(ev, None, conflict_event=chain)
+        for depth, headings in [(1, ['*** TODO !CONFLICT! Test 1']),
+                                (5, ['*** TODO !CONFLICT! Test 1', '**** TODO !CONFLICT! Test 2',
+                                     '***** TODO !CONFLICT! Test 3'])]:
+            oup, getstr = self.mk_unparser(today=dt('2022-01-01'), max_conflict_depth=depth)()
+            oup.unparse_event(chain)
+            self.assertEqual(headings, [l for l in getstr().splitlines() if OrgProc.CONFLICT_HEADING in l])
+
+        oup, getstr = self.mk_unparser(today=dt('2022-01-01'))()
+        oup.unparse_event(event.ProxyEvent(evs[0], None, conflict_event=evs[0]))
+        self.assertNotIn(OrgProc.CONFLICT_HEADING, getstr())
+
+    def test_conflict_once_per_series(self):
+        '''Occurrences that we repeat by hand share one copy of their conflict'''
+        local = mk_event('I0', 'Daily', start=dt('2022-05-20T10:00/UTC'), end=dt('2022-05-20T11:00/UTC'),
+                         description='A', recurrences=[daily(count=30)])
+        remote = mk_event('I0', 'Daily', start=dt('2022-05-20T10:00/UTC'), end=dt('2022-05-20T11:00/UTC'),
+                          description='B', recurrences=[daily(count=30)])
+        oup, getstr = self.mk_unparser(today=dt('2022-05-21'))()
+        oup.unparse_calendar(OrgCalendar('X', 'C0', [local.merge(remote)]))
+        self.assertEqual(8, getstr().count('** TODO Daily\n'))
+        self.assertEqual(1, getstr().count(OrgProc.CONFLICT_HEADING))
+
 
 class TestParse(unittest.TestCase):
 
@@ -127,6 +158,25 @@ class TestParse(unittest.TestCase):
 
         return OrgEventParser(**kwd)
 
+    # ----------------------------------------
+    def test_file_todo_keywords(self):
+        '''TODO keywords declared in the file itself'''
+        text = '''#+TODO: TODO NEXT | DONE
+* CAL0
+  :PROPERTIES:
+  :CAL-UID: C0
+  :END:
+** NEXT Meeting
+  SCHEDULED: <2022-01-01 Sat 10:00-11:00>
+  :PROPERTIES:
+  :CALEVENT-UID: I0
+  :END:
+'''
+        ev = TestParse.parser().load(io.StringIO(text))['C0'].events['I0']
+        self.assertEqual('Meeting', ev.name)
+        self.assertEqual('NEXT', str(ev.status))
+        self.assertIs(ev.status, TestParse.parser().loads(text)['C0'].events['I0'].status)
+
     # ----------------------------------------
     def test_simple(self):
         cals = TestParse.parser().loads('''* CAL0
@@ -213,6 +263,198 @@ class TestRemerge(unittest.TestCase):
                                     today=dt('2022-05-21/CET'),
                                     past_events = False)
 
+    # ----------------------------------------
+    def test_detached_instance(self):
+        ev = mk_event('I0', 'Daily',
+                      start=dt('2022-05-20T10:00/UTC'),
+                      end=dt(  '2022-05-20T11:00/UTC'),
+                      recurrences=[daily()])
+        moved = mk_event('I0', 'Moved',
+                         start=dt('2022-05-22T14:00/UTC'),
+                         end=dt(  '2022-05-22T15:00/UTC'),
+                         recurrence_id=dt('2022-05-22T10:00/UTC'),
+                         status=event.CANCELLED)
+        ugen = TestUnparse.mk_unparser(today=dt('2022-05-21'))
+        oup, getstr = ugen()
+        oup.unparse_calendar(OrgCalendar('X', 'C0', [moved, ev]))
+        s = getstr()
+        self.assertIn('''** CANCELLED Moved
+  SCHEDULED: <2022-05-22 Sun 14:00-15:00>
+  :PROPERTIES:
+  :CALEVENT-UID: I0
+  :CALEVENT-RECURRENCE-ID: 2022-05-22T10:00
+  :END:
+''', s)
+        self.assertNotIn('<2022-05-22 Sun 10:00-11:00>', s)
+
+        cal = list(TestParse.parser().loads(s).values())[0]
+        self.assertEqual(['I0'], list(cal.events))
+        series = cal.events['I0']
+        self.assertEqual('Daily', series.name)
+        self.assertEqual(['Moved'], [i.name for i in series.detached_instances.values()])
+
+    # ----------------------------------------
+    def test_native_repeater(self):
+        ev = mk_event('I0', 'Weekly',
+                      start=dt('2022-05-02T10:00/UTC'),
+                      end=dt(  '2022-05-02T11:00/UTC'),
+                      recurrences=[cconv.recurrence_from_rrule('FREQ=WEEKLY;INTERVAL=1')])
+        ugen = TestUnparse.mk_unparser(today=dt('2022-05-21'))
+        oup, getstr = ugen()
+        oup.unparse_calendar(OrgCalendar('X', 'C0', [ev]))
+        s = getstr()
+        self.assertEqual(1, s.count('** TODO Weekly'))
+        self.assertIn('  SCHEDULED: <2022-05-02 Mon 10:00-11:00 +1w>\n', s)
+        self.assertIn('  :CALEVENT-RECURRENCE: FREQ=WEEKLY;INTERVAL=1\n', s)
+
+        series = list(TestParse.parser().loads(s).values())[0].events['I0']
+        self.assertEqual([str(r) for r in ev.recurrences], [str(r) for r in series.recurrences])
+        self.assertRemergeIsTrivial(ev, today=dt('2022-05-21'))
+
+    # ----------------------------------------
+    def test_native_repeater_units(self):
+        '''Repeaters use org's units; rules in units that org lacks are expanded by hand'''
+        for rrule, repeater in [('FREQ=HOURLY;INTERVAL=12', '+12h'),
+                                ('FREQ=MONTHLY;INTERVAL=1', '+1m'),
+                                ('FREQ=YEARLY;INTERVAL=2', '+2y'),
+                                ('FREQ=MINUTELY;INTERVAL=30', None)]:
+            with self.subTest(rrule):
+                ev = mk_event('I0', 'Repeated',
+                              start=dt('2022-05-02T10:00/UTC'),
+                              end=dt(  '2022-05-02T10:10/UTC'),
+                              recurrences=[cconv.recurrence_from_rrule(rrule)])
+                oup, getstr = TestUnparse.mk_unparser(today=dt('2022-05-21'))()
+                oup.unparse_calendar(OrgCalendar('X', 'C0', [ev]))
+                s = getstr()
+                if repeater is None:
+                    self.assertNotIn('CALEVENT-RECURRENCE:', s)
+                    self.assertLess(1, s.count('** TODO Repeated'))
+                    continue
+                self.assertEqual(1, s.count('** TODO Repeated'))
+                self.assertIn(f'  SCHEDULED: <2022-05-02 Mon 10:00-10:10 {repeater}>\n', s)
+                self.assertIn(f'  :CALEVENT-RECURRENCE: {rrule}\n', s)
+                self.assertRemergeIsTrivial(ev, today=dt('2022-05-21'))
+
+    # ----------------------------------------
+    def test_native_weekdays(self):
+        '''Weekly on several weekdays: one heading with one repeating timestamp per weekday'''
+        ev = mk_event('I0', 'Mon/Wed/Fri',
+                      start=dt('2022-05-02T10:00/UTC'),
+                      end=dt(  '2022-05-02T11:00/UTC'),
+                      description='Notes',
+                      recurrences=[cconv.recurrence_from_rrule('FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE,FR;WKST=MO')])
+        ugen = TestUnparse.mk_unparser(today=dt('2022-05-21'))
+        oup, getstr = ugen()
+        oup.unparse_calendar(OrgCalendar('X', 'C0', [ev]))
+        s = getstr()
+        self.assertIn('''** TODO Mon/Wed/Fri
+  SCHEDULED: <2022-05-02 Mon 10:00-11:00 +2w>
+  :PROPERTIES:
+  :CALEVENT-UID: I0
+  :FIRST-START: 2022-05-02T10:00
+  :FIRST-END: 2022-05-02T11:00
+  :CALEVENT-RECURRENCE: FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE,FR;WKST=MO
+  :END:
+  <2022-05-04 Wed 10:00-11:00 +2w> <2022-05-06 Fri 10:00-11:00 +2w>
+Notes
+''', s)
+
+        cal = list(TestParse.parser().loads(s).values())[0]
+        self.assertEqual(['I0'], list(cal.events))
+        series = cal.events['I0']
+        self.assertEqual('Notes', series.description)
+        self.assertEqual([str(r) for r in ev.recurrences], [str(r) for r in series.recurrences])
+        self.assertEqual(list(itertools.islice(ev.occurrence_times(), 6)),
+                         list(itertools.islice(series.occurrence_times(), 6)))
+        self.assertRemergeIsTrivial(ev, today=dt('2022-05-21'))
+
+    # ----------------------------------------
+    def test_native_fallback(self):
+        '''Rules that org can't repeat natively are expanded by hand'''
+        weekly = cconv.recurrence_from_rrule('FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,WE;WKST=MO')
+        today = dt('2022-05-21')
+        events = [
+            # starts outside of its weekdays
+            mk_event('I0', 'A', start=dt('2022-05-03T10:00/UTC'), end=dt('2022-05-03T11:00/UTC'), recurrences=[weekly]),
+            # with exclusions
+            mk_event('I1', 'B', start=dt('2022-05-02T10:00/UTC'), end=dt('2022-05-02T11:00/UTC'), recurrences=[weekly],
+                     exclusions=caltime.Exclusions([dt('2022-05-23T10:00/UTC')], [])),
+            # counted
+            mk_event('I2', 'C', start=dt('2022-05-20T10:00/UTC'), end=dt('2022-05-20T11:00/UTC'),
+                     recurrences=[daily(count=30)]),
+        ]
+        for ev in events:
+            with self.subTest(ev.name):
+                oup, getstr = TestUnparse.mk_unparser(today=today)()
+                oup.unparse_calendar(OrgCalendar('X', 'C0', [ev]))
+                s = getstr()
+                self.assertNotIn(OrgProc.RECURRENCE + ':', s)
+                self.assertNotRegex(s, r' \+1[wd]>')
+                self.assertIn(f'** TODO {ev.name}\n', s)
+
+        oup, getstr = TestUnparse.mk_unparser(today=today, org_agenda_native_recurrence_allowed=False)()
+        oup.unparse_calendar(OrgCalendar('X', 'C0', [mk_event('I3', 'D', start=dt('2022-05-16T10:00/UTC'),
+                                                              end=dt('2022-05-16T11:00/UTC'), recurrences=[weekly])]))
+        self.assertNotIn('+1w', getstr())
+        self.assertEqual(2, getstr().count('** TODO D\n'))
+
+    def test_slide_calendar(self):
+        '''Moving a calendar to a later window yields what rendering it for that window would'''
+        weekly = cconv.recurrence_from_rrule('FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,WE;WKST=MO')
+        cal = OrgCalendar('X', 'C0', [
+            mk_event('I0', 'Counted', start=dt('2022-05-20T10:00/UTC'), end=dt('2022-05-20T11:00/UTC'),
+                     recurrences=[daily(count=30)]),
+            mk_event('I1', 'Excluded', start=dt('2022-05-02T10:00/UTC'), end=dt('2022-05-02T11:00/UTC'),
+                     recurrences=[weekly], exclusions=caltime.Exclusions([dt('2022-05-30T10:00/UTC')], [])),
+            mk_event('I2', 'Native', start=dt('2022-05-01T08:00/UTC'), end=dt('2022-05-01T08:30/UTC'),
+                     recurrences=[daily()]),
+            mk_event('I3', 'Soon over', start=dt('2022-05-22T10:00/UTC'), end=dt('2022-05-22T11:00/UTC')),
+            mk_event('I4', 'Later', start=dt('2022-07-01T10:00/UTC'), end=dt('2022-07-01T11:00/UTC')),
+            # No occurrence in the first window
+            mk_event('I5', 'Late start', start=dt('2022-05-31T10:00/UTC'), end=dt('2022-05-31T11:00/UTC'),
+                     recurrences=[daily(count=3)]),
+        ])
+        since = dt('2022-05-21')
+        oup, _ = TestUnparse.mk_unparser(today=since)()
+        text = oup.render_calendar(cal)
+        for today in ['2022-05-21', '2022-05-23', '2022-05-26', '2022-06-20']:
+            with self.subTest(today):
+                oup, _ = TestUnparse.mk_unparser(today=dt(today))()
+                self.assertEqual(oup.render_calendar(cal), oup.slide_calendar(text, cal, since))
+
+        # Local changes to the occurrences carry over to new ones
+        oup, _ = TestUnparse.mk_unparser(today=dt('2022-05-26'))()
+        slid = oup.slide_calendar(text.replace('TODO Counted', 'DONE Counted'), cal, since)
+        self.assertNotIn('TODO Counted', slid)
+        self.assertEqual(8, slid.count('** DONE Counted\n'))
+
+        # Calendars without occurrences that we expand by hand move without a window
+        plain = OrgCalendar('X', 'C0', [
+            mk_event('I2', 'Native', start=dt('2022-05-01T08:00/UTC'), end=dt('2022-05-01T08:30/UTC'),
+                     recurrences=[cconv.recurrence_from_rrule('FREQ=DAILY;INTERVAL=1')]),
+        ] + [ev for ev in cal.events.values() if ev.event_id in ['I3', 'I4']])
+        self.assertTrue(oup.expands_by_hand(cal))
+        self.assertFalse(oup.expands_by_hand(plain))
+        self.assertFalse(oup.expands_by_hand(None))
+        oup, _ = TestUnparse.mk_unparser(today=since)()
+        text = oup.render_calendar(plain)
+        for today in ['2022-05-21', '2022-05-23', '2022-07-02']:
+            with self.subTest(today):
+                oup, _ = TestUnparse.mk_unparser(today=dt(today))()
+                self.assertEqual(oup.render_calendar(plain), oup.slide_calendar(text, plain, None))
+
+    def test_emitted_window(self):
+        oup, getstr = TestUnparse.mk_unparser(today=dt('2022-05-21'))()
+        oup.print_header()
+        self.assertEqual(oup.today, OrgEventParser().emitted_window(io.StringIO(getstr())))
+        self.assertIsNone(OrgEventParser(recurrence_emit_future_days=30).emitted_window(io.StringIO(getstr())))
+        self.assertIsNone(OrgEventParser().emitted_window(io.StringIO(OUTPUT_HEADER)))
+
+        # The window starts at midnight in local_timezone, whatever the host's zone
+        oup, getstr = TestUnparse.mk_unparser(today=dt('2022-05-21'), local_timezone='Europe/Berlin')()
+        oup.print_header()
+        self.assertTrue(getstr().startswith('#+PROPERTY: EMIT-WINDOW 2022-05-21T00:00:00+02:00 +7d\n'))
+
 
 class TestIntegrate(unittest.TestCase):
 
@@ -332,3 +574,197 @@ A Comment
   :END:
 
 ''', getstr())
+
+        self.assertEqual([('C1', 'C1-Gamma'), ('C1', 'C1-Delta'), ('C0', 'C0-Alpha'), ('C0', 'C0-Beta'), ('C1', 'C1-Epsilon')],
+                         [(cal.uid, ev.name) for cal, ev in chronological(cals, dt('2022-01-01T00:00/UTC'))])
+        self.assertEqual([('C1', 'C1-Delta'), ('C0', 'C0-Alpha')],
+                         [(cal.uid, ev.name) for cal, ev in chronological(cals, dt('2022-01-01T09:40/UTC'),
+                                                                          dt('2022-01-01T11:00/UTC'))])
+
+    def test_unparse_all_parallel(self):
+        cals = event.MergingDict()
+        for i in range(3):
+            cals[f'C{i}'] = OrgCalendar(f'CAL{i}', f'C{i}', [
+                mk_event(f'I{i}-{j}', f'Event {j}',
+                         start=dt(f'2022-01-0{j + 1}T10:00/UTC'),
+                         end=dt(  f'2022-01-0{j + 1}T11:00/UTC'),
+                         recurrences=[daily(count=3)] if j == 0 else [])
+                for j in range(4)], links={f'I{i}-1' : ['Other']})
+
+        def unparsed(jobs):
+            oup, getstr = TestUnparse.mk_unparser(today=dt('2022-01-01'))()
+            oup.unparse_all(cals, jobs=jobs)
+            return getstr()
+
+        with unittest.mock.patch('os.cpu_count', return_value=2):
+            parallel = unparsed(2)
+        self.assertEqual(unparsed(1), parallel)
+        self.assertIn(':ALSO-IN: Other', parallel)
+
+
+class TestStream(unittest.TestCase):
+
+    ORG = '''#+STARTUP: content
+* CAL0
+  :PROPERTIES:
+  :CAL-UID: C0
+  :END:
+** TODO Alpha
+  SCHEDULED: <2022-01-01 Sat 10:00-11:00>
+  :PROPERTIES:
+  :CALEVENT-UID: I0
+  :LOCATION: loc-A
+  :END:
+Some notes
+*** TODO !CONFLICT! Alpha (remote)
+  SCHEDULED: <2022-01-01 Sat 10:00-11:00>
+  :PROPERTIES:
+  :CALEVENT-UID: I0
+  :END:
+** DONE Beta
+  SCHEDULED: <2022-01-01 Sat 12:00-13:00>
+  :PROPERTIES:
+  :CALEVENT-UID: I1
+  :END:
+* Free/busy
+  :PROPERTIES:
+  :FREEBUSY-WINDOW: [2022-01-01 Sat 00:00]--[2022-01-08 Sat 00:00]
+  :END:
+** All calendars
+- busy: [2022-01-01 Sat 10:00-11:00]
+* CAL1
+  :PROPERTIES:
+  :CAL-UID: C1
+  :END:
+** TODO Gamma
+  SCHEDULED: <2022-01-01 Sat 09:00-09:30>
+  :PROPERTIES:
+  :CALEVENT-UID: I2
+  :END:
+'''
+
+    @staticmethod
+    def snapshot(calendars):
+        return {cal.uid : {ev.key : ev.content_key for ev in events} for cal, events in calendars}
+
+    def test_org_chunks(self):
+        chunks = list(org_chunks(io.StringIO(TestStream.ORG)))
+        self.assertEqual([0, 1, 2, 2, 1, 2, 1, 2], [level for level, _ in chunks])
+        self.assertTrue(chunks[2][1].startswith('** TODO Alpha\n'))
+        self.assertIn('*** TODO !CONFLICT!', chunks[2][1])
+        self.assertEqual(TestStream.ORG, ''.join(text for _, text in chunks))
+
+    def test_stream_like_load(self):
+        streamed = TestStream.snapshot(TestParse.parser().stream(io.StringIO(TestStream.ORG)))
+        loaded = TestStream.snapshot((cal, cal.events.values())
+                                     for cal in TestParse.parser().loads(TestStream.ORG).values())
+        self.assertEqual(['C0', 'C1'], list(streamed))
+        self.assertEqual(loaded, streamed)
+
+    def test_conflicts_not_parsed(self):
+        '''Conflict subtrees are skipped (even misplaced ones), so unresolved conflicts don't grow the file'''
+        parse = TestParse.parser()
+        misplaced = TestStream.ORG.replace('** DONE Beta', '''** TODO !CONFLICT! Alpha (moved)
+  SCHEDULED: <2022-01-02 Sun 10:00-11:00>
+  :PROPERTIES:
+  :CALEVENT-UID: I0
+  :END:
+** DONE Beta''')
+        loaded = TestStream.snapshot((cal, cal.events.values()) for cal in parse.loads(TestStream.ORG).values())
+        self.assertEqual(loaded, TestStream.snapshot((cal, cal.events.values()) for cal in parse.loads(misplaced).values()))
+        self.assertEqual(loaded, TestStream.snapshot(parse.stream(io.StringIO(misplaced))))
+
+        remote = parse.loads(TestStream.ORG.replace('Some notes', 'Other notes'))
+        text = TestStream.ORG
+        texts = []
+        for _ in range(3):
+            oup, getstr = TestUnparse.mk_unparser(today=dt('2022-01-01'), output_header='')()
+            oup.unparse_all(parse.loads(text).merge(remote))
+            text = getstr()
+            texts.append(text)
+        self.assertEqual(1, text.count(OrgProc.CONFLICT_HEADING))
+        self.assertEqual(texts[0], texts[2])
+
+    def test_merge_like_merge_calendars(self):
+        remote = TestParse.parser().loads(TestStream.ORG.replace('loc-A', 'loc-B').replace('I2', 'I3'))
+        remote['C9'] = OrgCalendar('CAL9', 'C9', [
+            mk_event('I9', 'Remote only', start=dt('2022-01-01T08:00/UTC'), end=dt('2022-01-01T09:00/UTC'))])
+        local = TestParse.parser().loads(TestStream.ORG)
+
+        streamed = TestStream.snapshot(
+            merge_calendar_streams(TestParse.parser().stream(io.StringIO(TestStream.ORG)), remote))
+        merged = merge_calendars(local, remote)
+        self.assertEqual(['C0', 'C1', 'C9'], list(streamed))
+        self.assertEqual(TestStream.snapshot((cal, cal.events.values()) for cal in merged.values()), streamed)
+        self.assertEqual(['I2', 'I3'], list(streamed['C1']))
+
+    def test_unparse_sorted(self):
+        events = [mk_event(f'I{i}', f'Event {i}', start=dt('2022-01-01T10:00/UTC'), end=dt('2022-01-01T11:00/UTC'))
+                  for i in [3, 1, 2]]
+        cals = event.MergingDict()
+        cals['C0'] = OrgCalendar('CAL0', 'C0', events)
+        oup, getstr = TestUnparse.mk_unparser(today=dt('2022-01-01'))()
+        oup.unparse_all_streams(merge_calendar_streams(calendar_streams(cals), event.MergingDict()))
+        s = getstr()
+        self.assertLess(s.index('Event 1'), s.index('Event 2'))
+        self.assertLess(s.index('Event 2'), s.index('Event 3'))
+
+        # Written in UID order, so we can stream it back in
+        streamed = TestStream.snapshot(TestParse.parser().stream(io.StringIO(s)))
+        self.assertEqual(['I1', 'I2', 'I3'], list(streamed['C0']))
+
+    def test_calendar_sections(self):
+        sections = list(calendar_sections(io.StringIO(TestStream.ORG)))
+        self.assertEqual(['C0', 'C1'], [caluid for caluid, _ in sections])
+        self.assertTrue(sections[0][1].startswith('* CAL0\n'))
+        self.assertTrue(sections[0][1].endswith('  :CALEVENT-UID: I1\n  :END:\n'))
+        self.assertIn('*** TODO !CONFLICT!', sections[0][1])
+        self.assertEqual(TestStream.ORG[TestStream.ORG.index('* CAL1'):], sections[1][1])
+
+    def test_render_calendar(self):
+        cal = TestParse.parser().loads(TestStream.ORG)['C0']
+        oup, getstr = TestUnparse.mk_unparser(today=dt('2022-01-01'))()
+        oup.pr('before')
+        text = oup.render_calendar(cal)
+        self.assertEqual('before\n', getstr())
+        oup.unparse_calendar(cal)
+        self.assertEqual('before\n' + text, getstr())
+        # What we render splits back into the same section
+        self.assertEqual([('C0', text)], list(calendar_sections(io.StringIO(text))))
+
+    def test_render_calendars(self):
+        '''Worker processes render the same texts, in order'''
+        cals = list(TestParse.parser().loads(TestStream.ORG).values())
+        oup, _ = TestUnparse.mk_unparser(today=dt('2022-01-01'))()
+        texts = [oup.render_calendar(cal) for cal in cals]
+        self.assertEqual(texts, render_calendars(oup, cals, jobs=2))
+        self.assertIsNone(org_events._WORKER_INPUTS)
+
+    def test_merge_and_render_calendars(self):
+        '''Merging and rendering in worker processes yields the texts of the merged calendars'''
+        local = TestParse.parser().loads(TestStream.ORG)
+        remote = TestParse.parser().loads(TestStream.ORG.replace('TODO Gamma', 'TODO Gamma (moved)'))
+        del remote['C0']
+        oup, _ = TestUnparse.mk_unparser(today=dt('2022-01-01'))()
+        merged = merge_calendars(local, remote)
+        expected = [(oup.render_calendar(merged[caluid]), False) for caluid in ['C1', 'C0']]
+        for jobs in [1, 2]:
+            with self.subTest(jobs=jobs):
+                self.assertEqual(expected, merge_and_render_calendars(oup, local, remote, ['C1', 'C0'], jobs=jobs))
+        self.assertIn('Gamma (moved)', expected[0][0])
+
+    def test_index(self):
+        oup, getstr = TestUnparse.mk_unparser(today=dt('2022-01-01'))()
+        oup.unparse_index([('CAL0', 'C0', 'C0.org'), ('My calendar', 'cal/1', 'cal_1-0123abcd.org')])
+        s = getstr()
+        self.assertIn('* [[file:C0.org][CAL0]]\n', s)
+        self.assertEqual({'C0' : 'C0.org', 'cal/1' : 'cal_1-0123abcd.org'},
+                         TestParse.parser().load_index(io.StringIO(s)))
+        # Index files are no calendars
+        self.assertEqual([], [cal.events for cal in TestParse.parser().loads(s).values() if cal.events])
+
+    def test_unsorted(self):
+        unsorted = TestStream.ORG.replace(':CALEVENT-UID: I0', ':CALEVENT-UID: I5')
+        with self.assertRaises(UnsortedStream):
+            TestStream.snapshot(merge_calendar_streams(TestParse.parser().stream(io.StringIO(unsorted)),
+                                                       event.MergingDict()))
@@ -0,0 +1,152 @@
+# This file is Copyright (C) 2022 Christoph Reichenbach
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the
+#   Free Software Foundation, Inc.
+#   59 Temple Place, Suite 330
+#   Boston, MA  02111-1307
+#   USA
+#
+# The author can be reached as "creichen" at the usual gmail server.
+
+
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+from orgwriter import *
+
+
+class TestAtomicOrgWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'calendar.org')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read(self):
+        with open(self.path, encoding='utf-8') as f:
+            return f.read()
+
+    def test_write(self):
+        with AtomicOrgWriter(self.path, buffer_size=4) as w:
+            w.write('* CAL0\n')
+            w.write('** TODO Ärger\n')
+        self.assertEqual('* CAL0\n** TODO Ärger\n', self.read())
+        self.assertEqual(['calendar.org'], os.listdir(self.tmpdir.name))
+
+    def test_replace_keeps_mode(self):
+        with open(self.path, 'w') as f:
+            f.write('old\n')
+        os.chmod(self.path, 0o640)
+        for policy in FSYNC_POLICIES:
+            with AtomicOrgWriter(self.path, fsync=policy) as w:
+                w.write(f'new ({policy})\n')
+            self.assertEqual(f'new ({policy})\n', self.read())
+            self.assertEqual(0o640, os.stat(self.path).st_mode & 0o777)
+
+    def test_old_file_until_done(self):
+        with open(self.path, 'w') as f:
+            f.write('old\n')
+        with AtomicOrgWriter(self.path, buffer_size=1) as w:
+            w.write('new\n')
+            self.assertEqual('old\n', self.read())
+            self.assertEqual(2, len(os.listdir(self.tmpdir.name)))
+        self.assertEqual('new\n', self.read())
+
+    def test_failure_keeps_old_file(self):
+        with open(self.path, 'w') as f:
+            f.write('old\n')
+        with self.assertRaises(RuntimeError):
+            with AtomicOrgWriter(self.path) as w:
+                w.write('partial\n')
+                raise RuntimeError('interrupted')
+        self.assertEqual('old\n', self.read())
+        self.assertEqual(['calendar.org'], os.listdir(self.tmpdir.name))
+
+    def write_twice(self, old, new, buffer_size):
+        with open(self.path, 'w') as f:
+            f.write(old)
+        os.utime(self.path, ns=(0, 0))
+        with AtomicOrgWriter(self.path, buffer_size=buffer_size) as w:
+            for line in new.splitlines(keepends=True):
+                w.write(line)
+            self.assertEqual(['calendar.org'], os.listdir(self.tmpdir.name)) # nothing differs so far
+        self.assertEqual(new, self.read())
+        return w.changed
+
+    def test_skip_unchanged(self):
+        text = '* CAL0\n** TODO Alpha\n** TODO Beta\n'
+        for buffer_size in [1, 5, 1000]:
+            self.assertFalse(self.write_twice(text, text, buffer_size))
+            self.assertEqual(0, os.stat(self.path).st_mtime_ns)
+
+    def test_changed(self):
+        text = '* CAL0\n** TODO Alpha\n** TODO Beta\n'
+        for buffer_size in [1, 5, 1000]:
+            for old, new in [(text, text.replace('Beta', 'Gamma')), (text, text + 'more\n'),
+                             (text + 'more\n', text), (text, ''), ('', text), (text, text.replace('\n', '\r\n'))]:
+                with self.subTest(buffer_size=buffer_size, old=old, new=new):
+                    with open(self.path, 'w', newline='') as f:
+                        f.write(old)
+                    with AtomicOrgWriter(self.path, buffer_size=buffer_size) as w:
+                        w.write(new)
+                    self.assertTrue(w.changed)
+                    with open(self.path, encoding='utf-8', newline='') as f:
+                        self.assertEqual(new, f.read())
+                    self.assertEqual(['calendar.org'], os.listdir(self.tmpdir.name))
+
+    def test_no_skip(self):
+        with open(self.path, 'w') as f:
+            f.write('same\n')
+        os.utime(self.path, ns=(0, 0))
+        with AtomicOrgWriter(self.path, skip_unchanged=False) as w:
+            w.write('same\n')
+        self.assertTrue(w.changed)
+        self.assertNotEqual(0, os.stat(self.path).st_mtime_ns)
+
+    def test_symlink(self):
+        target = os.path.join(self.tmpdir.name, 'target.org')
+        with open(target, 'w') as f:
+            f.write('old\n')
+        os.symlink(target, self.path)
+        with AtomicOrgWriter(self.path) as w:
+            w.write('new\n')
+        self.assertTrue(os.path.islink(self.path))
+        self.assertEqual('new\n', self.read())
+
+    def test_bad_policy(self):
+        with self.assertRaises(ValueError):
+            AtomicOrgWriter(self.path, fsync='sometimes')
+
+    def test_write_atomically(self):
+        with open(self.path, 'w') as f:
+            f.write('old\n')
+        os.chmod(self.path, 0o640)
+        for policy in FSYNC_POLICIES:
+            write_atomically(self.path, f'new ({policy})\n'.encode('utf-8'), fsync=policy)
+            self.assertEqual(f'new ({policy})\n', self.read())
+            self.assertEqual(0o640, os.stat(self.path).st_mode & 0o777)
+        self.assertEqual(['calendar.org'], os.listdir(self.tmpdir.name))
+
+        with self.assertRaises(TypeError):
+            write_atomically(self.path, 'not bytes')
+        self.assertEqual(f'new ({FSYNC_POLICIES[-1]})\n', self.read())
+        self.assertEqual(['calendar.org'], os.listdir(self.tmpdir.name))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+# This file is Copyright (C) 2022 Christoph Reichenbach
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the
+#   Free Software Foundation, Inc.
+#   59 Temple Place, Suite 330
+#   Boston, MA  02111-1307
+#   USA
+#
+# The author can be reached as "creichen" at the usual gmail server.
+
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+import caltime
+import tzresolve
+import event
+from org_events import OrgCalendar
+from syncstate import *
+
+cconv = caltime.CalConverter(tzresolve.TZResolver(None))
+
+def dt(s):
+    return cconv.time_from_str(s)
+
+def mk_event(evid : str, name : str, start, end, **args):
+    ev = event.EventRepeater(evid, name, start)
+    ev.end = end
+    for k, v in args.items():
+        setattr(ev, k, v)
+    return ev
+
+def mk_calendars(*events):
+    cals = event.MergingDict()
+    cals['C0'] = OrgCalendar('CAL0', 'C0', events)
+    return cals
+
+
+class TestSyncState(unittest.TestCase):
+
+    def test_roundtrip(self):
+        ev = mk_event('I0', 'Test',
+                      start=dt('2022-01-01T10:00/CET'),
+                      end=dt(  '2022-01-01T11:00/CET'),
+                      attendees=['foo@bar.com', 'user@email.com'],
+                      status=event.CANCELLED,
+                      last_modified_remote=dt('2021-12-24T18:00/UTC'))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            orgfile = os.path.join(tmpdir, 'cal.org')
+            self.assertEqual({}, SyncState.load(orgfile).base)
+
+            SyncState.from_calendars(mk_calendars(ev)).save(orgfile)
+            base = SyncState.load(orgfile).base
+
+        self.assertEqual({'C0'}, base.keys())
+        self.assertTrue(ev.unchanged_since(base['C0']['I0']))
+        ev.location = 'Elsewhere'
+        self.assertFalse(ev.unchanged_since(base['C0']['I0']))
+
+    def test_equal_after_load(self):
+        ev = mk_event('I0', 'Test',
+                      start=dt('2022-01-01T10:00/CET'),
+                      end=dt(  '2022-01-01T11:00/CET'),
+                      attendees=['foo@bar.com'])
+        state = SyncState.from_calendars(mk_calendars(ev))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            orgfile = os.path.join(tmpdir, 'cal.org')
+            state.save(orgfile)
+            self.assertEqual(state, SyncState.load(orgfile))
+        ev.location = 'elsewhere'
+        self.assertNotEqual(state, SyncState.from_calendars(mk_calendars(ev)))
+
+    def test_layout(self):
+        state = SyncState.from_calendars(mk_calendars())
+        state.layout['C0'] = [stable_digest('inputs'), stable_digest('text')]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            orgfile = os.path.join(tmpdir, 'cal.org')
+            state.save(orgfile)
+            loaded = SyncState.load(orgfile)
+        self.assertEqual(state.layout, loaded.layout)
+        self.assertEqual(state, loaded)
+        self.assertEqual(state.calendar_digest('C0'), loaded.calendar_digest('C0'))
+        self.assertEqual('', loaded.calendar_digest('C9'))
+
+    def test_calendar_digest(self):
+        def mk(end=dt('2022-01-01T11:00/UTC'), **args):
+            return mk_calendars(mk_event('I0', 'Test', start=dt('2022-01-01T10:00/UTC'), end=end, **args))['C0']
+
+        digest = calendar_digest(mk())
+        self.assertEqual(digest, calendar_digest(mk()))
+        self.assertNotEqual(digest, calendar_digest(mk(location='elsewhere')))
+        # Also covers what the merge ignores, but what we write
+        self.assertNotEqual(digest, calendar_digest(mk(recurrences=[cconv.daily_recurrence()])))
+        self.assertNotEqual(digest, calendar_digest(mk(end=dt('2022-01-01T12:00/UTC'))))
+        cal = mk()
+        cal.links['I0'] = ['Other']
+        self.assertNotEqual(digest, calendar_digest(cal))
+
+    def test_unreadable(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            orgfile = os.path.join(tmpdir, 'cal.org')
+            with open(SyncState.path_for(orgfile), 'w') as f:
+                f.write('garbage')
+            self.assertEqual({}, SyncState.load(orgfile).base)
+
+    def test_three_way_merge(self):
+        def mk(**args):
+            return mk_event('I0', 'Test',
+                            start=dt('2022-01-01T10:00/UTC'),
+                            end=dt(  '2022-01-01T11:00/UTC'),
+                            **args)
+
+        base = SyncState.from_calendars(mk_calendars(mk(location='A'))).base
+        local = mk_calendars(mk(location='A', description='Local notes', status=event.DONE))
+        remote = mk_calendars(mk(location='B'))
+
+        # Two-way merge can't tell which location is more recent
+        self.assertIsNotNone(local.merge(remote)['C0'].events['I0'].get_conflict_event())
+
+        merged = local.merge(remote, base=base)['C0'].events['I0']
+        self.assertIsNone(merged.get_conflict_event())
+        self.assertEqual('B', merged.location)
+        self.assertEqual('Local notes', merged.description)
+        self.assertEqual(event.DONE, merged.status)
+
+        # Changes on both sides still conflict
+        local = mk_calendars(mk(location='C'))
+        merged = local.merge(remote, base=base)['C0'].events['I0']
+        self.assertIsNotNone(merged.get_conflict_event())
+        self.assertEqual('C', merged.location)
+
+        # Unchanged remote: local edits win
+        merged = local.merge(mk_calendars(mk(location='A')), base=base)['C0'].events['I0']
+        self.assertIsNone(merged.get_conflict_event())
+        self.assertEqual('C', merged.location)
+
+    def test_three_way_recurrences(self):
+        def mk(rrule=None, **args):
+            return mk_event('I0', 'Test',
+                            start=dt('2022-01-03T10:00/UTC'),
+                            end=dt(  '2022-01-03T11:00/UTC'),
+                            recurrences=[] if rrule is None else [cconv.recurrence_from_rrule(rrule)],
+                            **args)
+        def rrules(cals):
+            return [rec.rrule() for rec in cals['C0'].events['I0'].recurrences]
+
+        weekly, daily = 'FREQ=WEEKLY;INTERVAL=1', 'FREQ=DAILY;INTERVAL=1'
+        base = SyncState.from_calendars(mk_calendars(mk(weekly))).base
+
+        # The remote series stopped recurring
+        merged = mk_calendars(mk(weekly)).merge(mk_calendars(mk()), base=base)
+        self.assertEqual([], rrules(merged))
+        self.assertFalse(merged['C0'].events['I0'].unchanged_since(base['C0']['I0']))
+
+        # Org files don't keep the rules of expanded events: that's no removal
+        self.assertEqual([weekly], rrules(mk_calendars(mk()).merge(mk_calendars(mk(weekly)), base=base)))
+
+        # A changed local copy of the rules only wins while the remote ones are unchanged
+        self.assertEqual([daily], rrules(mk_calendars(mk(daily)).merge(mk_calendars(mk(weekly)), base=base)))
+        self.assertEqual([], rrules(mk_calendars(mk(daily)).merge(mk_calendars(mk()), base=base)))
+
+    def test_three_way_detached_instances(self):
+        def mk(*instances):
+            ev = mk_event('I0', 'Daily',
+                          start=dt('2022-01-01T10:00/UTC'),
+                          end=dt(  '2022-01-01T11:00/UTC'),
+                          recurrences=[cconv.recurrence_from_rrule('FREQ=DAILY;INTERVAL=1')])
+            ev.detached_instances = {event.recurrence_key(i.recurrence_id) : i for i in instances} or None
+            return ev
+        def moved(day, **args):
+            return mk_event('I0', 'Moved',
+                            start=dt(f'2022-01-{day:02}T14:00/UTC'),
+                            end=dt(  f'2022-01-{day:02}T15:00/UTC'),
+                            recurrence_id=dt(f'2022-01-{day:02}T10:00/UTC'),
+                            **args)
+
+        base = SyncState.from_calendars(mk_calendars(mk(moved(2, location='A'), moved(3)))).base
+        self.assertTrue(mk(moved(2, location='A'), moved(3)).unchanged_since(base['C0']['I0']))
+        self.assertFalse(mk(moved(2, location='B'), moved(3)).unchanged_since(base['C0']['I0']))
+
+        local = mk_calendars(mk(moved(2, location='A', status=event.DONE), moved(3)))
+        remote = mk_calendars(mk(moved(2, location='B')))
+        instances = local.merge(remote, base=base)['C0'].events['I0'].detached_instances
+        # The remote side dropped the instance on the 3rd, and moved the one on the 2nd without conflict
+        self.assertEqual([event.recurrence_key(dt('2022-01-02T10:00/UTC'))], list(instances))
+        instance = list(instances.values())[0]
+        self.assertIsNone(instance.get_conflict_event())
+        self.assertEqual(('B', event.DONE), (instance.location, instance.status))
+
+        # No detached instances left at all
+        self.assertIsNone(local.merge(mk_calendars(mk()), base=base)['C0'].events['I0'].detached_instances)